@@ -10,6 +10,7 @@ import {
   ICredentials,
   ILog,
   ILegalCaseFile,
+  ICursorPage,
 } from "./types";
 import { UserInfo } from "./auth";
 
@@ -228,10 +229,35 @@ export const authenticate = async (credentials: ICredentials) => {
   );
 };
 
-export const getLogs = async (id?: number, parent_type?: string) => {
+export const getLogs = async (
+  id?: number,
+  parent_type?: string,
+  since_id?: number
+) => {
   const idParam = id ? `parent_id=${id}` : "";
   const parent_typeParam = parent_type ? `&parent_type=${parent_type}` : "";
-  return await httpGet<ILog[]>(`/logs/?${idParam}${parent_typeParam}`);
+  const since_idParam = since_id ? `&since_id=${since_id}` : "";
+  return await httpGet<ICursorPage<ILog>>(
+    `/logs/?${idParam}${parent_typeParam}${since_idParam}`
+  );
+};
+
+export const getLogsPage = async (next: string) => {
+  return await httpGet<ICursorPage<ILog>>(`/logs/${new URL(next).search}`);
+};
+
+export const getNewLogs = async (
+  since_id: number,
+  id?: number,
+  parent_type?: string
+) => {
+  let page = await getLogs(id, parent_type, since_id);
+  const logs = page.results;
+  while (page.next) {
+    page = await getLogsPage(page.next);
+    logs.push(...page.results);
+  }
+  return logs;
 };
 
 export const createLog = async (log: ILog) => {
@@ -27,7 +27,7 @@ import { CaseTypesContext } from "../../contexts/caseTypesContext";
 import UpdateDialog from "./updateDialog";
 import i18n from "../../i18n";
 import userDefaultAvatar from "../../user-default-avatar.jpeg";
-import { updateLegalCase, getLogs, getLegalCase } from "../../api";
+import { updateLegalCase, getLegalCase } from "../../api";
 import {
   ILegalCase,
   ICaseType,
@@ -64,7 +64,9 @@ type Props = {
   client: IClient | undefined;
   caseHistory: ILog[];
   caseWorker: IUser | undefined;
-  setCaseHistory: (caseHistory: ILog[]) => void;
+  updateHistory: () => void;
+  hasEarlierHistory: boolean;
+  loadEarlierHistory: () => void;
   setLegalCase: (legalCase: ILegalCase) => void;
   setStatus: (status: string) => void;
   setCaseUpdates: (caseUpdates: any) => void;
@@ -142,7 +144,7 @@ export default function CaseInfoTab(props: Props) {
           severity: "success",
         });
         updateCase();
-        updateHistory();
+        props.updateHistory();
       }
     } catch (e) {
       setSummaryLoader(false);
@@ -174,7 +176,7 @@ export default function CaseInfoTab(props: Props) {
           message: "Case edit successful",
           severity: "success",
         });
-        updateHistory();
+        props.updateHistory();
         updateCase();
       }
     } catch (e) {
@@ -192,11 +194,6 @@ export default function CaseInfoTab(props: Props) {
     props.setLegalCase(dataLegalCase);
   };
 
-  const updateHistory = async () => {
-    const historyData = await getLogs(props.legalCase?.id!, "LegalCase");
-    props.setCaseHistory(historyData);
-  };
-
   const dialogOpen = () => {
     setOpen(true);
   };
@@ -297,7 +294,7 @@ export default function CaseInfoTab(props: Props) {
                 setLegalCase={props.setLegalCase}
                 setLegalCaseFiles={props.setLegalCaseFiles}
                 setCaseUpdates={props.setCaseUpdates}
-                setCaseHistory={props.setCaseHistory}
+                updateHistory={props.updateHistory}
               />
             </Grid>
           </Grid>
@@ -393,14 +390,15 @@ export default function CaseInfoTab(props: Props) {
           <Grid container justifyContent="space-between">
             <Grid item>
               <Typography variant="caption">
-                Showing {props.caseHistory?.length} of{" "}
-                {props.caseHistory?.length} updates
+                Showing {props.caseHistory?.length} updates
               </Typography>
             </Grid>
             <Grid item>
-              <Typography variant="caption">
-                {/* <a href="/#">Show all updates</a> */}
-              </Typography>
+              {props.hasEarlierHistory ? (
+                <Button size="small" onClick={props.loadEarlierHistory}>
+                  {i18n.t("Show earlier updates")}
+                </Button>
+              ) : null}
             </Grid>
           </Grid>
         </Grid>
@@ -37,7 +37,9 @@ type Props = {
   setIsLoading: (isLoading: boolean) => void;
   setShowSnackbar: (showSnackbar: LocationState) => void;
   caseHistory: ILog[];
-  setCaseHistory: (caseHistory: ILog[]) => void;
+  updateHistory: () => void;
+  hasEarlierHistory: boolean;
+  loadEarlierHistory: () => void;
   setStatus: (status: string) => void;
 };
 
@@ -166,7 +168,9 @@ export default function CaseTabs(props: Props) {
             client={client}
             caseWorker={caseWorker}
             caseHistory={props.caseHistory ? props.caseHistory : []}
-            setCaseHistory={props.setCaseHistory}
+            updateHistory={props.updateHistory}
+            hasEarlierHistory={props.hasEarlierHistory}
+            loadEarlierHistory={props.loadEarlierHistory}
             setLegalCaseFiles={setLegalCaseFiles}
             setStatus={props.setStatus}
             setCaseUpdates={setCaseUpdates}
@@ -184,7 +188,7 @@ export default function CaseTabs(props: Props) {
             setLegalCaseFiles={setLegalCaseFiles}
             setStatus={props.setStatus}
             users={users ? users : []}
-            setCaseHistory={props.setCaseHistory}
+            updateHistory={props.updateHistory}
           />
         ) : null}
       </TabPanel>
@@ -197,7 +201,7 @@ export default function CaseTabs(props: Props) {
             setLegalCaseFiles={setLegalCaseFiles}
             setStatus={props.setStatus}
             setCaseUpdates={setCaseUpdates}
-            setCaseHistory={props.setCaseHistory}
+            updateHistory={props.updateHistory}
           />
         ) : null}
       </TabPanel>
@@ -6,13 +6,7 @@ import Select from "@mui/material/Select";
 import MenuItem from "@mui/material/MenuItem";
 
 import { useStyles } from "../../utils";
-import {
-  ILegalCase,
-  LocationState,
-  ILegalCaseFile,
-  IUser,
-  ILog,
-} from "../../types";
+import { ILegalCase, LocationState, ILegalCaseFile, IUser } from "../../types";
 import i18n from "../../i18n";
 import UpdateDialog from "./updateDialog";
 import UpdateTable from "./updateTable";
@@ -27,7 +21,7 @@ type Props = {
   setCaseUpdates: (caseUpdates: any) => void;
   setStatus: (status: string) => void;
   users: IUser[];
-  setCaseHistory: (caseHistory: ILog[]) => void;
+  updateHistory: () => void;
 };
 
 const CaseUpdateTab = (props: Props) => {
@@ -90,7 +84,7 @@ const CaseUpdateTab = (props: Props) => {
             setLegalCaseFiles={props.setLegalCaseFiles}
             setCaseUpdates={props.setCaseUpdates}
             editView={editView}
-            setCaseHistory={props.setCaseHistory}
+            updateHistory={props.updateHistory}
           />
         </Grid>
         <Grid item style={{ flexGrow: 1 }}>
@@ -134,7 +128,7 @@ const CaseUpdateTab = (props: Props) => {
           users={props.users ? props.users : []}
           editView={editView}
           setEditView={setEditView}
-          setCaseHistory={props.setCaseHistory}
+          updateHistory={props.updateHistory}
         />
         {showSnackbar.open && (
           <SnackbarAlert
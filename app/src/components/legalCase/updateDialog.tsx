@@ -30,9 +30,8 @@ import {
   updateNote,
   updateMeeting,
   deleteCaseUpdate,
-  getLogs,
 } from "../../api";
-import { ILegalCase, LocationState, ILegalCaseFile, ILog } from "../../types";
+import { ILegalCase, LocationState, ILegalCaseFile } from "../../types";
 import i18n from "../../i18n";
 import UpdateDialogTabs from "./updateDialogTabs";
 import SnackbarAlert from "../general/snackBar";
@@ -50,7 +49,7 @@ type Props = {
   fileView?: boolean;
   editView?: boolean;
   selectedUpdate?: any;
-  setCaseHistory: (caseHistory: ILog[]) => void;
+  updateHistory: () => void;
 };
 
 const UpdateDialog = (props: Props) => {
@@ -254,7 +253,7 @@ const UpdateDialog = (props: Props) => {
           if (res.id) {
             dialogClose();
             refreshUpdates();
-            updateHistory();
+            props.updateHistory();
             setShowSnackbar({
               open: true,
               message: "Note update successful",
@@ -358,7 +357,7 @@ const UpdateDialog = (props: Props) => {
           if (res.id) {
             dialogClose();
             refreshUpdates();
-            updateHistory();
+            props.updateHistory();
             setShowSnackbar({
               open: true,
               message: "Meeting update successful",
@@ -435,7 +434,7 @@ const UpdateDialog = (props: Props) => {
           if (res.id) {
             dialogClose();
             refreshUpdates();
-            updateHistory();
+            props.updateHistory();
             setShowSnackbar({
               open: true,
               message: "File update successful",
@@ -521,7 +520,7 @@ const UpdateDialog = (props: Props) => {
           if (res.id) {
             dialogClose();
             refreshUpdates();
-            updateHistory();
+            props.updateHistory();
             setShowSnackbar({
               open: true,
               message: "Note update successful",
@@ -618,7 +617,7 @@ const UpdateDialog = (props: Props) => {
           if (res.id) {
             dialogClose();
             refreshUpdates();
-            updateHistory();
+            props.updateHistory();
             setShowSnackbar({
               open: true,
               message: "Meeting update successful",
@@ -666,7 +665,7 @@ const UpdateDialog = (props: Props) => {
         });
         dialogClose();
         refreshUpdates();
-        updateHistory();
+        props.updateHistory();
       }
       setDeleteLoader(false);
     } catch (e) {
@@ -689,7 +688,7 @@ const UpdateDialog = (props: Props) => {
       const { id } = await updateLegalCase(updatedStatus);
       if (id) {
         updateCase();
-        updateHistory();
+        props.updateHistory();
       }
       setIsLoading(false);
     } catch (e) {
@@ -718,11 +717,6 @@ const UpdateDialog = (props: Props) => {
     props.setLegalCase(dataLegalCase);
   };
 
-  const updateHistory = async () => {
-    const historyData = await getLogs(props.legalCase?.id!, "LegalCase");
-    props.setCaseHistory(historyData);
-  };
-
   const submitHandler = () => {
     if (!props.editView && tabValue === 0) {
       submitNoteUpdate();
@@ -12,7 +12,7 @@ import {
 import Typography from "@mui/material/Typography";
 import Chip from "@mui/material/Chip";
 import { format } from "date-fns";
-import { ILegalCaseFile, ILegalCase, IUser, ILog } from "../../types";
+import { ILegalCaseFile, ILegalCase, IUser } from "../../types";
 import {
   AudioFileIcon,
   ImageFileIcon,
@@ -35,7 +35,7 @@ type Props = {
   users: IUser[];
   editView: boolean;
   setEditView: (editView: boolean) => void;
-  setCaseHistory: (caseHistory: ILog[]) => void;
+  updateHistory: () => void;
 };
 
 const UpdateTable = (props: Props) => {
@@ -329,7 +329,7 @@ const UpdateTable = (props: Props) => {
         setCaseUpdates={props.setCaseUpdates}
         editView={props.editView}
         selectedUpdate={selectedUpdate}
-        setCaseHistory={props.setCaseHistory}
+        updateHistory={props.updateHistory}
       />
     </>
   );
@@ -89,10 +89,9 @@ const Component = (props: Props) => {
   };
 
   useEffect(() => {
-    if (props.logs.length > 0 && typeof filteredLogs === "undefined") {
-      filterLogs();
-    }
-  });
+    filterLogs();
+    // eslint-disable-next-line
+  }, [props.logs]);
 
   return (
     <div>
@@ -23,6 +23,8 @@ import {
   getLegalCase,
   updateLegalCase,
   getLogs,
+  getLogsPage,
+  getNewLogs,
   getMeetings,
 } from "../../api";
 import {
@@ -42,6 +44,8 @@ import { LegalCaseStates } from "../../contexts/legalCaseStateConstants";
 
 type RouteParams = { id: string };
 
+const HISTORY_POLL_INTERVAL = 30000;
+
 const Page = () => {
   RedirectIfNotLoggedIn();
   const history = useHistory();
@@ -55,6 +59,9 @@ const Page = () => {
   const [meetings, setMeetings] = React.useState<IMeeting[]>();
   const [status, setStatus] = React.useState<string>(legalCase?.state || "");
   const [caseHistory, setCaseHistory] = React.useState<ILog[]>([]);
+  const [caseHistoryNext, setCaseHistoryNext] = React.useState<string | null>(
+    null
+  );
   const [isLoading, setIsLoading] = React.useState<boolean>(false);
   const [deleteLoader, setDeleteLoader] = React.useState<boolean>(false);
   const [showSnackbar, setShowSnackbar] = React.useState<LocationState>({
@@ -120,7 +127,8 @@ const Page = () => {
         setStatus(dataLegalCase.state);
         setLegalCase(dataLegalCase);
         setClient(dataClient);
-        setCaseHistory(historyData);
+        setCaseHistory(historyData.results);
+        setCaseHistoryNext(historyData.next);
         setMeetings(dataMeetings);
         setIsLoading(false);
       } catch (e: any) {
@@ -173,11 +181,37 @@ const Page = () => {
     setLegalCase(dataLegalCase);
   };
 
-  const updateHistory = async () => {
-    const historyData = await getLogs(caseId, "LegalCase");
-    setCaseHistory(historyData);
+  const updateHistory = React.useCallback(async () => {
+    const newest = caseHistory[0];
+    if (!newest) {
+      const historyData = await getLogs(caseId, "LegalCase");
+      setCaseHistory(historyData.results);
+      setCaseHistoryNext(historyData.next);
+      return;
+    }
+    const newLogs = await getNewLogs(newest.id!, caseId, "LegalCase");
+    if (newLogs.length) {
+      setCaseHistory((current) => {
+        const seen = new Set(current.map((log) => log.id));
+        return [...newLogs.filter((log) => !seen.has(log.id)), ...current];
+      });
+    }
+  }, [caseId, caseHistory]);
+
+  const loadEarlierHistory = async () => {
+    if (!caseHistoryNext) {
+      return;
+    }
+    const historyData = await getLogsPage(caseHistoryNext);
+    setCaseHistory((current) => [...current, ...historyData.results]);
+    setCaseHistoryNext(historyData.next);
   };
 
+  useEffect(() => {
+    const interval = setInterval(updateHistory, HISTORY_POLL_INTERVAL);
+    return () => clearInterval(interval);
+  }, [updateHistory]);
+
   return (
     <Layout>
       <Breadcrumbs className={classes.breadcrumbs} aria-label="breadcrumb">
@@ -267,7 +301,9 @@ const Page = () => {
           setIsLoading={setIsLoading}
           setShowSnackbar={setShowSnackbar}
           caseHistory={caseHistory ? caseHistory : []}
-          setCaseHistory={setCaseHistory}
+          updateHistory={updateHistory}
+          hasEarlierHistory={caseHistoryNext !== null}
+          loadEarlierHistory={loadEarlierHistory}
           setStatus={setStatus}
         />
 
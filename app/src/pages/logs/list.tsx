@@ -1,33 +1,66 @@
 import React, { useEffect, useState } from "react";
 import Typography from "@material-ui/core/Typography";
-import { Breadcrumbs, Container, Grid } from "@material-ui/core";
+import { Breadcrumbs, Button, Container, Grid } from "@material-ui/core";
 
 import ForumIcon from "@material-ui/icons/Forum";
 
 import Layout from "../../components/layout";
-import { getLogs, getUsers } from "../../api";
+import { getLogs, getLogsPage, getNewLogs, getUsers } from "../../api";
 import { ILog, IUser } from "../../types";
 import i18n from "../../i18n";
 import { useStyles } from "../../utils";
 import { RedirectIfNotLoggedIn } from "../../auth";
 import LogsTable from "../../components/log/table";
 
+const LOGS_POLL_INTERVAL = 30000;
+
 const Page = () => {
   RedirectIfNotLoggedIn();
   const classes = useStyles();
   const [logs, setLogs] = useState<ILog[]>();
+  const [logsNext, setLogsNext] = useState<string | null>(null);
   const [users, setUsers] = useState<IUser[]>([]);
 
   useEffect(() => {
     async function fetchData() {
       const dataLogs = await getLogs();
       const users = await getUsers();
-      setLogs(dataLogs);
+      setLogs(dataLogs.results);
+      setLogsNext(dataLogs.next);
       setUsers(users);
     }
     fetchData();
   }, []);
 
+  useEffect(() => {
+    const newest = logs ? logs[0] : undefined;
+    if (!newest) {
+      return;
+    }
+    const interval = setInterval(async () => {
+      const newLogs = await getNewLogs(newest.id!);
+      if (newLogs.length) {
+        setLogs((current) => {
+          const seen = new Set(current?.map((log) => log.id));
+          return [
+            ...newLogs.filter((log) => !seen.has(log.id)),
+            ...(current ? current : []),
+          ];
+        });
+      }
+    }, LOGS_POLL_INTERVAL);
+    return () => clearInterval(interval);
+  }, [logs]);
+
+  const loadMoreLogs = async () => {
+    if (!logsNext) {
+      return;
+    }
+    const dataLogs = await getLogsPage(logsNext);
+    setLogs((current) => [...(current ? current : []), ...dataLogs.results]);
+    setLogsNext(dataLogs.next);
+  };
+
   return (
     <Layout>
       <Breadcrumbs className={classes.breadcrumbs} aria-label="breadcrumb">
@@ -52,6 +85,11 @@ const Page = () => {
         </Grid>
 
         <LogsTable logs={logs ? logs : []} users={users ? users : []} />
+        {logsNext ? (
+          <Grid container justifyContent="center">
+            <Button onClick={loadMoreLogs}>{i18n.t("Load more logs")}</Button>
+          </Grid>
+        ) : null}
       </Container>
     </Layout>
   );
@@ -139,6 +139,12 @@ export interface ILog {
   };
 }
 
+export interface ICursorPage<T> {
+  next: string | null;
+  previous: string | null;
+  results: T[];
+}
+
 export interface LocationState {
   pathname?: string;
   open?: boolean;
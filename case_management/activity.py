@@ -0,0 +1,111 @@
+'''Live case activity: new audit logs are announced with Postgres NOTIFY.
+
+The audit write path sends one notification per new Log on CHANNEL once
+the logs are committed; a notification that fails is logged and dropped,
+clients catch up from the log endpoint. Each worker
+process runs a single listener thread holding one LISTEN connection, and
+hands notifications to every open stream of that process through in-memory
+queues. Under the gevent worker class threads, queues and select() are
+monkey patched, so the listener and all streams are greenlets and an idle
+stream costs no database connection.
+'''
+import json
+import logging
+import queue
+import select
+import threading
+import time
+
+import psycopg2
+from django.db import connection, connections
+
+logger = logging.getLogger(__name__)
+
+CHANNEL = 'case_activity'
+POLL_SECONDS = 5
+HEARTBEAT_SECONDS = 15
+RECONNECT_SECONDS = 5
+
+
+def notify(logs):
+    '''Announce newly written logs, delivered when the transaction commits'''
+    payloads = [
+        json.dumps(
+            {'id': log.id, 'parent_type': log.parent_type, 'parent_id': log.parent_id}
+        )
+        for log in logs
+    ]
+    if payloads:
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'SELECT pg_notify(%s, payload) FROM unnest(%s::text[]) payload',
+                [CHANNEL, payloads],
+            )
+
+
+class Listener:
+    '''Fans out notifications from one LISTEN connection to subscriber queues'''
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.subscribers = set()
+        self.thread = None
+        self.listening = threading.Event()
+
+    def subscribe(self, timeout=RECONNECT_SECONDS):
+        '''Return a queue receiving the payload of every notification sent
+        from now on, once the listener is connected or after timeout'''
+        subscriber = queue.Queue()
+        with self.lock:
+            self.subscribers.add(subscriber)
+            if self.thread is None:
+                self.listening.clear()
+                self.thread = threading.Thread(
+                    target=self.run, name='case-activity-listener', daemon=True
+                )
+                self.thread.start()
+        self.listening.wait(timeout)
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        with self.lock:
+            self.subscribers.discard(subscriber)
+
+    def run(self):
+        while True:
+            with self.lock:
+                if not self.subscribers:
+                    self.thread = None
+                    return
+            try:
+                self.listen()
+            except psycopg2.Error:
+                logger.exception('Case activity listener lost its connection')
+                time.sleep(RECONNECT_SECONDS)
+
+    def listen(self):
+        params = connections['default'].get_connection_params()
+        listen_connection = psycopg2.connect(**params)
+        try:
+            listen_connection.autocommit = True
+            with listen_connection.cursor() as cursor:
+                cursor.execute(f'LISTEN {CHANNEL}')
+            self.listening.set()
+            while self.subscribers:
+                if select.select([listen_connection], [], [], POLL_SECONDS)[0]:
+                    listen_connection.poll()
+                    while listen_connection.notifies:
+                        self.publish(listen_connection.notifies.pop(0).payload)
+        finally:
+            self.listening.clear()
+            listen_connection.close()
+
+    def publish(self, payload):
+        entry = json.loads(payload)
+        with self.lock:
+            subscribers = list(self.subscribers)
+        for subscriber in subscribers:
+            subscriber.put(entry)
+
+
+listener = Listener()
@@ -0,0 +1,247 @@
+'''Write-behind buffer for audit Log and LogChange rows.
+
+Changes are written as LogChange rows or, when AUDIT_LOG_STORAGE is 'json',
+as a JSONB array on the Log itself (Log.change_set).
+
+Entries recorded inside a transaction are held in memory and written in one
+batch by a transaction.on_commit callback, so a transaction (or savepoint)
+that rolls back writes nothing. The transaction has committed by the time
+the callback runs, so a batch that then fails to write is logged with its
+entries rather than failing the request. flush_pending() writes the entries
+early, still inside the transaction, for responses that include new logs.
+Outside a transaction entries are written immediately. New logs are counted
+for reports (case_management.rollups) and announced to live streams, see
+case_management.activity.
+
+Both happen after the logs are written, each in a transaction of its own,
+so that a failure or lock wait there cannot roll back the audit trail: lost
+counts can be recomputed with `manage.py rebuild_report_tables` and streams
+are best effort, lost logs could not be recovered.
+'''
+import json
+import logging
+import weakref
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import connection, transaction
+
+from case_management import activity, rollups
+
+logger = logging.getLogger(__name__)
+
+LOG_FIELDS = (
+    'parent_type',
+    'parent_id',
+    'target_type',
+    'target_id',
+    'action',
+    'user_id',
+    'note',
+)
+
+
+class AuditBatch:
+    '''Logs and changes recorded within one transaction or savepoint'''
+
+    def __init__(self, batches=None, key=None):
+        self.batches = batches
+        self.key = key
+        self.logs = []
+        self.changes = []
+
+    def flush(self):
+        if self.batches is not None and self.batches.get(self.key) is self:
+            del self.batches[self.key]
+        pending_logs = set(map(id, self.logs))
+        changes = []
+        for change in self.changes:
+            if id(change.log) in pending_logs or change.log.pk is not None:
+                changes.append(change)
+                continue
+            # The log belongs to another batch: hand the change over if that
+            # batch is still pending, otherwise its savepoint rolled back and
+            # the log was never written.
+            pending = change.log._audit_batch()
+            if pending is not None and pending is not self:
+                pending.changes.append(change)
+        with transaction.atomic():
+            if settings.AUDIT_LOG_STORAGE == 'json':
+                self._write_change_sets(changes)
+            else:
+                if self.logs:
+                    type(self.logs[0]).objects.bulk_create(self.logs)
+                for change in changes:
+                    change.created_at = change.log.created_at
+                if changes:
+                    type(changes[0]).objects.bulk_create(changes)
+        try:
+            with transaction.atomic():
+                activity.notify(self.logs)
+        except Exception:
+            logger.exception('Could not announce %s new logs', len(self.logs))
+        try:
+            with transaction.atomic():
+                rollups.record_logs(self.logs)
+        except Exception:
+            logger.exception(
+                'Could not count %s new logs for reports, '
+                'run manage.py rebuild_report_tables',
+                len(self.logs),
+            )
+        self.logs = []
+        self.changes = []
+
+    def flush_on_commit(self):
+        try:
+            self.flush()
+        except Exception:
+            logger.exception(
+                'Could not write audit logs after commit: %s', self.describe()
+            )
+
+    def describe(self):
+        '''The logs and changes of the batch as JSON'''
+        new_logs = set(map(id, self.logs))
+        logs = {id(log): log for log in self.logs}
+        changes = defaultdict(list)
+        for change in self.changes:
+            logs.setdefault(id(change.log), change.log)
+            changes[id(change.log)].append(
+                {'field': change.field, 'value': change.value, 'action': change.action}
+            )
+        entries = []
+        for key, log in logs.items():
+            entry = {'id': None if key in new_logs else log.pk}
+            for field in LOG_FIELDS:
+                entry[field] = getattr(log, field)
+            entry['changes'] = changes[key]
+            entries.append(entry)
+        return json.dumps(entries, default=str)
+
+    def _write_change_sets(self, changes):
+        # Ids still come from the LogChange sequence so that serialized
+        # changes look the same in both storage modes
+        change_ids = _next_ids(type(changes[0]), len(changes)) if changes else []
+        appended = defaultdict(list)
+        for change, change_id in zip(changes, change_ids):
+            change.id = change_id
+            entry = change_set_entry(change)
+            if change.log.pk is None:
+                change.log.change_set = (change.log.change_set or []) + [entry]
+            else:
+                appended[change.log].append(entry)
+        if self.logs:
+            for log in self.logs:
+                if log.change_set is None:
+                    log.change_set = []
+            type(self.logs[0]).objects.bulk_create(self.logs)
+        if appended:
+            table = next(iter(appended))._meta.db_table
+            with connection.cursor() as cursor:
+                for log, entries in appended.items():
+                    cursor.execute(
+                        f'''UPDATE {table}
+                        SET change_set = COALESCE(change_set, '[]'::jsonb) || %s::jsonb
+                        WHERE id = %s''',
+                        [json.dumps(entries), log.pk],
+                    )
+
+
+def _next_ids(model, count):
+    with connection.cursor() as cursor:
+        cursor.execute(
+            '''SELECT nextval(pg_get_serial_sequence(%s, 'id'))
+            FROM generate_series(1, %s)''',
+            [model._meta.db_table, count],
+        )
+        return sorted(row[0] for row in cursor.fetchall())
+
+
+def change_set_entry(change):
+    '''The JSON form of a LogChange stored in Log.change_set'''
+    return {
+        'id': change.id,
+        'field': change.field,
+        'value': change.value,
+        'action': change.action,
+    }
+
+
+def backfill_change_sets(Log, LogChange, batch_size=1000):
+    '''Copy LogChange rows into Log.change_set, one batch of logs at a time.
+    Takes the models as arguments so that migrations can pass historical ones.
+    '''
+    last_id = 0
+    count = 0
+    while True:
+        logs = list(
+            Log.objects.filter(id__gt=last_id, change_set__isnull=True)
+            .only('id')
+            .order_by('id')[:batch_size]
+        )
+        if not logs:
+            return count
+        entries = defaultdict(list)
+        rows = (
+            LogChange.objects.filter(log_id__gte=logs[0].id, log_id__lte=logs[-1].id)
+            .order_by('id')
+            .values('id', 'log_id', 'field', 'value', 'action')
+        )
+        for row in rows:
+            entries[row.pop('log_id')].append(row)
+        for log in logs:
+            log.change_set = entries[log.id]
+        with transaction.atomic():
+            Log.objects.bulk_update(logs, ['change_set'])
+        last_id = logs[-1].id
+        count += len(logs)
+
+
+def _current_batch():
+    connection = transaction.get_connection()
+    if not connection.in_atomic_block:
+        return None
+    # Batches are only kept alive by their pending on_commit callback. When a
+    # transaction or savepoint rolls back Django drops the callback, the batch
+    # is garbage collected and its entries with it.
+    batches = getattr(connection, 'audit_batches', None)
+    if batches is None:
+        batches = connection.audit_batches = weakref.WeakValueDictionary()
+    # atomic(savepoint=False) blocks, e.g. around many to many changes, add
+    # None: they commit or roll back with the enclosing savepoint, so their
+    # entries belong in its batch
+    key = tuple(sid for sid in connection.savepoint_ids if sid is not None)
+    batch = batches.get(key)
+    if batch is None:
+        batch = batches[key] = AuditBatch(batches, key)
+        transaction.on_commit(batch.flush_on_commit)
+    return batch
+
+
+def flush_pending():
+    '''Write the entries queued in the current transaction now, e.g. for a
+    response listing the new logs. They still roll back with the transaction.'''
+    batches = getattr(transaction.get_connection(), 'audit_batches', None)
+    for batch in list(batches.values()) if batches else []:
+        batch.flush()
+
+
+def is_pending(log):
+    '''Whether log is queued and still to be written by the current transaction'''
+    batch = getattr(log, '_audit_batch', None)
+    return log.pk is None and batch is not None and batch() is not None
+
+
+def record(changes, log=None):
+    '''Queue changes, and the new log they belong to if given, for writing'''
+    batch = _current_batch()
+    immediate = batch is None
+    if immediate:
+        batch = AuditBatch()
+    if log is not None:
+        log._audit_batch = weakref.ref(batch)
+        batch.logs.append(log)
+    batch.changes.extend(changes)
+    if immediate:
+        batch.flush()
@@ -3,7 +3,14 @@ from rest_framework.permissions import BasePermission, DjangoModelPermissions
 from django.core.exceptions import PermissionDenied
 
 from case_management.enums import PermissionGroups
-from case_management.models import CaseOffice
+from case_management.models import (
+    CaseOffice,
+    CaseType,
+    Client,
+    LegalCase,
+    Log,
+    LoggedChildModel,
+)
 
 
 class BearerTokenAuthentication(TokenAuthentication):
@@ -102,3 +109,46 @@ def check_scoped_reporting_permision(request):
         case_office_filter = request.query_params.get('caseOffice')
         if case_office_filter is None or request.user.case_office.id != int(case_office_filter):
             raise PermissionDenied
+
+
+def check_scoped_report_job_permission(request, job):
+    if not request.user.is_authenticated:
+        raise PermissionDenied
+    if permission_is_scoped(request.user.permission_group):
+        case_office = job.parameters['caseOffice']
+        if case_office is None or request.user.case_office.id != int(case_office):
+            raise PermissionDenied
+
+
+def check_scoped_record_permission(request, model, record_id):
+    '''Scoped users may see the history of their case office, of its cases
+    with their case updates, notes, meetings and files, of the clients of
+    those cases, and of case types. The history of a case no longer in the
+    case office, e.g. deleted, is left to admins.'''
+    if not request.user.is_authenticated:
+        raise PermissionDenied
+    if not permission_is_scoped(request.user.permission_group):
+        return
+    case_office = request.user.case_office
+    cases = LegalCase.objects.filter(case_offices=case_office)
+    if model is CaseType:
+        permitted = True
+    elif model is CaseOffice:
+        permitted = record_id == case_office.id
+    elif model is LegalCase:
+        permitted = cases.filter(id=record_id).exists()
+    elif model is Client:
+        permitted = cases.filter(client_id=record_id).exists()
+    elif issubclass(model, LoggedChildModel):
+        # The record's case is the parent of its logs, even once deleted
+        permitted = cases.filter(
+            id__in=Log.objects.filter(
+                target_type=model.__name__,
+                target_id=record_id,
+                parent_type='LegalCase',
+            ).values('parent_id')
+        ).exists()
+    else:
+        permitted = False
+    if not permitted:
+        raise PermissionDenied
@@ -0,0 +1,8 @@
+'''Helpers shared by the benchmark management commands.'''
+import math
+
+
+def percentile(values, percent):
+    '''Nearest rank percentile of values'''
+    ordered = sorted(values)
+    return ordered[max(math.ceil(percent / 100 * len(ordered)) - 1, 0)]
@@ -97,3 +97,10 @@ class Provinces(models.TextChoices):
     NC = 'NorthernCape', 'Northern Cape'
     NW = 'NorthWest', 'North West'
     WC = 'WesternCape', 'Western Cape'
+
+
+class ReportJobStates(models.TextChoices):
+    PENDING = 'Pending'
+    RUNNING = 'Running'
+    DONE = 'Done'
+    FAILED = 'Failed'
@@ -0,0 +1,181 @@
+'''Point-in-time state of logged records, replayed from the audit log.
+
+A Create log records every field of a record, Update logs the fields that
+changed and many to many changes the ids added or removed. Applying a
+record's logs in order therefore gives its state at any time, with field
+values as text as they were logged.
+
+Snapshots (LogSnapshot) store the state after every SNAPSHOT_INTERVAL logs
+of a record, so that a replay starts from the nearest snapshot instead of
+the record's first log. `manage.py create_log_snapshots` takes them.
+'''
+import json
+from datetime import timedelta
+
+from django.apps import apps
+from django.db import transaction
+from django.db.models import Count, F, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from case_management.enums import LogChangeTypes
+from case_management.models import Log, LoggedModel, LogSnapshot
+
+SNAPSHOT_INTERVAL = 100
+# Logs are written after their transaction commits, so a log with a lower id
+# may still appear shortly after a higher one. Only older logs are snapshot.
+SNAPSHOT_DELAY = timedelta(minutes=5)
+
+
+def logged_model(target_type):
+    model = apps.get_model('case_management', target_type)
+    if not issubclass(model, LoggedModel):
+        raise LookupError(f'{target_type} is not logged')
+    return model
+
+
+def _log_changes(log):
+    if log.change_set is not None:
+        return [
+            (entry['field'], entry['value'], entry['action'])
+            for entry in log.change_set
+        ]
+    return [(change.field, change.value, change.action) for change in log.changes.all()]
+
+
+class RecordState:
+    def __init__(self, model, snapshot=None):
+        self.many_to_many = {field.name for field in model._meta.many_to_many}
+        self.concrete = {field.name for field in model._meta.concrete_fields}
+        self.snapshot_log_id = None
+        self.fields = {}
+        self.deleted = False
+        self.last_log_id = 0
+        self.logged_at = None
+        self.replayed_logs = 0
+        if snapshot is not None:
+            self.snapshot_log_id = snapshot.last_log_id
+            self.fields = dict(snapshot.fields)
+            self.deleted = snapshot.deleted
+            self.last_log_id = snapshot.last_log_id
+            self.logged_at = snapshot.logged_at
+
+    def apply(self, log):
+        if log.action == 'Create':
+            self.deleted = False
+        elif log.action == 'Delete':
+            self.deleted = True
+        for field, value, action in _log_changes(log):
+            if field in self.many_to_many:
+                # A Create log holds the related manager's text for these
+                if action != LogChangeTypes.CHANGE:
+                    ids = set(self.fields.get(field, []))
+                    if action == LogChangeTypes.ADD:
+                        ids.update(json.loads(value))
+                    else:
+                        ids.difference_update(json.loads(value))
+                    self.fields[field] = sorted(ids)
+            elif field in self.concrete:
+                self.fields[field] = value
+        self.last_log_id = log.id
+        self.logged_at = log.created_at
+        self.replayed_logs += 1
+
+
+def state_at(target_type, target_id, at, logs=None):
+    '''State of a record at a time, replayed from the nearest earlier snapshot.
+    logs narrows down the logs used, e.g. to those a user may see.
+    '''
+    model = logged_model(target_type)
+    snapshot = (
+        LogSnapshot.objects.filter(
+            target_type=target_type, target_id=target_id, logged_at__lte=at
+        )
+        .order_by('-last_log_id')
+        .first()
+    )
+    state = RecordState(model, snapshot)
+    logs = Log.objects.all() if logs is None else logs
+    logs = logs.filter(
+        target_type=target_type,
+        target_id=target_id,
+        created_at__lte=at,
+        id__gt=state.last_log_id,
+    ).prefetch_related('changes')
+    for log in logs.order_by('id'):
+        state.apply(log)
+    return {
+        'target_type': target_type,
+        'target_id': target_id,
+        'at': at,
+        'exists': state.last_log_id > 0 and not state.deleted,
+        'deleted': state.deleted,
+        'fields': state.fields,
+        'last_log_id': state.last_log_id or None,
+        'snapshot_log_id': state.snapshot_log_id,
+        'replayed_logs': state.replayed_logs,
+    }
+
+
+def _snapshot_record(target_type, target_id, interval, before):
+    latest = (
+        LogSnapshot.objects.filter(target_type=target_type, target_id=target_id)
+        .order_by('-last_log_id')
+        .first()
+    )
+    state = RecordState(logged_model(target_type), latest)
+    logs = Log.objects.filter(
+        target_type=target_type,
+        target_id=target_id,
+        created_at__lt=before,
+        id__gt=state.last_log_id,
+    ).prefetch_related('changes')
+    snapshots = []
+    for count, log in enumerate(logs.order_by('id'), start=1):
+        state.apply(log)
+        if count % interval == 0:
+            snapshots.append(
+                LogSnapshot(
+                    target_type=target_type,
+                    target_id=target_id,
+                    last_log_id=state.last_log_id,
+                    logged_at=state.logged_at,
+                    fields=dict(state.fields),
+                    deleted=state.deleted,
+                )
+            )
+    LogSnapshot.objects.bulk_create(snapshots)
+    return len(snapshots)
+
+
+def create_snapshots(interval=SNAPSHOT_INTERVAL):
+    '''Snapshot every record with at least interval logs since its last
+    snapshot, returning the number of snapshots taken'''
+    before = timezone.now() - SNAPSHOT_DELAY
+    latest = (
+        LogSnapshot.objects.filter(
+            target_type=OuterRef('target_type'), target_id=OuterRef('target_id')
+        )
+        .order_by('-last_log_id')
+        .values('last_log_id')[:1]
+    )
+    targets = (
+        Log.objects.filter(created_at__lt=before)
+        .annotate(snapshot_log_id=Coalesce(Subquery(latest), Value(0)))
+        .filter(id__gt=F('snapshot_log_id'))
+        .values('target_type', 'target_id')
+        .annotate(count=Count('id'))
+        .filter(count__gte=interval)
+        .order_by()
+    )
+    count = 0
+    for target in targets:
+        try:
+            logged_model(target['target_type'])
+        except LookupError:
+            continue
+        with transaction.atomic():
+            count += _snapshot_record(
+                target['target_type'], target['target_id'], interval, before
+            )
+    return count
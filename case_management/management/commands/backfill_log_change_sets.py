@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from case_management.audit import backfill_change_sets
+from case_management.models import Log, LogChange
+
+
+class Command(BaseCommand):
+    help = (
+        'Copy LogChange rows into Log.change_set for logs that do not have '
+        'one yet, for use with AUDIT_LOG_STORAGE = json'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        count = backfill_change_sets(Log, LogChange, options['batch_size'])
+        self.stdout.write(f'Backfilled {count} logs')
@@ -0,0 +1,223 @@
+import statistics
+import time
+import uuid
+from datetime import datetime, timezone
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from case_management.benchmarks import percentile
+from case_management.models import (
+    CaseOffice,
+    CaseType,
+    CaseUpdate,
+    Client,
+    File,
+    LegalCase,
+    Log,
+    Meeting,
+    Note,
+    User,
+)
+from case_management.views import CaseUpdateViewSet, LegalCaseViewSet
+
+
+class Command(BaseCommand):
+    help = (
+        'Measure throughput, latency and query counts of audit logged saves. '
+        'Run against a throwaway database: benchmark rows are committed '
+        'and removed again afterwards.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=50)
+        parser.add_argument(
+            '--warmup',
+            type=int,
+            default=5,
+            help='Untimed operations run first, e.g. to fill connection caches',
+        )
+
+    def handle(self, *args, **options):
+        self.run_id = uuid.uuid4().hex[:8]
+        self.factory = APIRequestFactory()
+        with transaction.atomic():
+            self.user = User.objects.create_user(
+                email=f'benchmark-{self.run_id}@example.com',
+                password=None,
+                permission_group='Admin',
+            )
+            self.case_office = CaseOffice.objects.create(
+                name=f'Benchmark office {self.run_id}',
+                description='Benchmark',
+                created_by=self.user,
+            )
+            self.case_type = CaseType.objects.create(
+                title=f'Benchmark type {self.run_id}',
+                description='Benchmark',
+                created_by=self.user,
+            )
+        self.clients = []
+        self.legal_cases = []
+        self.files = []
+        operations = [
+            ('Client create', self.create_client),
+            ('LegalCase create (API)', self.create_legal_case),
+            ('Meeting create', self.create_meeting),
+            ('CaseUpdate create with meeting (API)', self.create_meeting_update),
+            ('CaseUpdate create with note (API)', self.create_note_update),
+            ('CaseUpdate create with files (API)', self.create_files_update),
+        ]
+        try:
+            self.stdout.write(
+                f'{"operation":<40} {"ops/s":>8} {"p50 ms":>8} {"p99 ms":>8} '
+                f'{"queries/op":>10} {"max":>4}'
+            )
+            for label, operation in operations:
+                if operation == self.create_files_update:
+                    self.create_files(2 * (options['warmup'] + options['iterations']))
+                self._report(label, operation, options['iterations'], options['warmup'])
+        finally:
+            self._cleanup()
+
+    def create_client(self, i):
+        client = Client.objects.create(
+            name=f'Benchmark client {self.run_id} {i}',
+            contact_number='+27821234567',
+            created_by=self.user,
+            updated_by=self.user,
+        )
+        self.clients.append(client)
+
+    def create_legal_case(self, i):
+        response = self._post(
+            LegalCaseViewSet,
+            '/api/v1/cases/',
+            {
+                'client': self.clients[i % len(self.clients)].id,
+                'users': [self.user.id],
+                'case_types': [self.case_type.id],
+                'case_offices': [self.case_office.id],
+            },
+        )
+        self.legal_cases.append(LegalCase(id=response.data['id']))
+
+    def create_meeting(self, i):
+        Meeting.objects.create(
+            legal_case=self.legal_cases[i % len(self.legal_cases)],
+            meeting_date=datetime.now(timezone.utc),
+            location='Benchmark',
+            notes='Benchmark',
+            created_by=self.user,
+            updated_by=self.user,
+        )
+
+    def create_meeting_update(self, i):
+        legal_case = self.legal_cases[i % len(self.legal_cases)]
+        self._create_case_update(
+            legal_case,
+            {
+                'meeting': {
+                    'legal_case': legal_case.id,
+                    'meeting_date': datetime.now(timezone.utc).isoformat(),
+                    'location': 'Benchmark',
+                    'notes': 'Benchmark',
+                }
+            },
+        )
+
+    def create_note_update(self, i):
+        legal_case = self.legal_cases[i % len(self.legal_cases)]
+        self._create_case_update(
+            legal_case,
+            {
+                'note': {
+                    'legal_case': legal_case.id,
+                    'title': 'Benchmark',
+                    'content': 'Benchmark',
+                }
+            },
+        )
+
+    def create_files(self, count):
+        # Uploaded separately from case updates, so not part of the operation.
+        # Only rows are made, no files are stored.
+        with transaction.atomic():
+            for i in range(count):
+                self.files.append(
+                    File.objects.create(
+                        legal_case=self.legal_cases[i % len(self.legal_cases)],
+                        upload=f'uploads/benchmark-{self.run_id}-{i}.pdf',
+                        description='Benchmark',
+                        created_by=self.user,
+                        updated_by=self.user,
+                    )
+                )
+
+    def create_files_update(self, i):
+        files = self.files[2 * i : 2 * i + 2]
+        self._create_case_update(
+            files[0].legal_case, {'files': [file.id for file in files]}
+        )
+
+    def _create_case_update(self, legal_case, data):
+        self._post(
+            CaseUpdateViewSet,
+            '/api/v1/case-updates/',
+            {'legal_case': legal_case.id, **data},
+        )
+
+    def _post(self, viewset, path, data):
+        request = self.factory.post(path, data, format='json')
+        force_authenticate(request, user=self.user)
+        response = viewset.as_view({'post': 'create'})(request)
+        if response.status_code != 201:
+            raise RuntimeError(
+                f'{path} returned {response.status_code}: {response.data}'
+            )
+        return response
+
+    def _report(self, label, operation, iterations, warmup):
+        for i in range(warmup):
+            with transaction.atomic():
+                operation(i)
+        durations = []
+        query_counts = []
+        started = time.perf_counter()
+        for i in range(warmup, warmup + iterations):
+            with CaptureQueriesContext(connection) as queries:
+                start = time.perf_counter()
+                # Committing runs the audit flush, so it is part of each op
+                with transaction.atomic():
+                    operation(i)
+                durations.append((time.perf_counter() - start) * 1000)
+            query_counts.append(len(queries))
+        elapsed = time.perf_counter() - started
+        self.stdout.write(
+            f'{label:<40} {iterations / elapsed:>8.1f} '
+            f'{percentile(durations, 50):>8.2f} {percentile(durations, 99):>8.2f} '
+            f'{statistics.mean(query_counts):>10.1f} {max(query_counts):>4}'
+        )
+
+    def _cleanup(self):
+        legal_case_ids = [legal_case.id for legal_case in self.legal_cases]
+        targets = [
+            (Meeting, Meeting.objects.filter(legal_case__in=legal_case_ids)),
+            (Note, Note.objects.filter(legal_case__in=legal_case_ids)),
+            (File, File.objects.filter(id__in=[file.id for file in self.files])),
+            (CaseUpdate, CaseUpdate.objects.filter(legal_case__in=legal_case_ids)),
+            (LegalCase, LegalCase.objects.filter(id__in=legal_case_ids)),
+            (Client, Client.objects.filter(id__in=[c.id for c in self.clients])),
+            (CaseType, CaseType.objects.filter(id=self.case_type.id)),
+            (CaseOffice, CaseOffice.objects.filter(id=self.case_office.id)),
+        ]
+        with transaction.atomic():
+            for model, queryset in targets:
+                ids = list(queryset.values_list('id', flat=True))
+                Log.objects.filter(
+                    target_type=model.__name__, target_id__in=ids
+                ).delete()
+                queryset.delete()
+            self.user.delete()
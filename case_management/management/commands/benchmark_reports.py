@@ -0,0 +1,239 @@
+import json
+import subprocess
+import time
+import uuid
+from datetime import date
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.utils import timezone
+
+from case_management import queries
+from case_management.benchmarks import percentile
+from case_management.models import CaseOffice, LegalCase, Log
+
+REPORTS = {
+    'range-summary': queries.range_summary,
+    'monthly-summary': queries.monthly_summary,
+    'daily-summary': queries.daily_summary,
+}
+
+# Counts for every benchmark office and day, the worst case for the reports
+FILL_DAYS = '''
+INSERT INTO case_management_caseofficeday (
+  case_office_id, day, cases_opened, cases_closed, case_logs
+)
+SELECT caseoffice.id, day::date, 1, 1, 10
+FROM
+  case_management_caseoffice caseoffice,
+  generate_series(%s::date, %s::date, '1 day') day
+WHERE
+  caseoffice.id = ANY(%s)
+ON CONFLICT (case_office_id, day) DO NOTHING'''
+
+BUSIEST_CASE_OFFICE = '''
+SELECT case_office_id
+FROM case_management_caseofficeday
+GROUP BY case_office_id
+ORDER BY SUM(cases_opened) DESC
+LIMIT 1'''
+
+# A slower p50 than this, relative to the compared results, is a regression
+REGRESSION = 1.2
+
+
+def months_before(month, count):
+    '''The first of the month count - 1 months before month'''
+    index = month.year * 12 + month.month - count
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def plan_shape(plan):
+    '''The node types and relations of a plan, without its numbers'''
+    node = plan['Node Type']
+    if 'Relation Name' in plan:
+        node += f' on {plan["Relation Name"]}'
+    children = ', '.join(plan_shape(child) for child in plan.get('Plans', []))
+    return f'{node}({children})' if children else node
+
+
+def buffers(plan):
+    '''Shared buffers hit and read by a plan'''
+    return plan.get('Shared Hit Blocks', 0) + plan.get('Shared Read Blocks', 0)
+
+
+def commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            capture_output=True,
+            check=True,
+            text=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class Command(BaseCommand):
+    help = (
+        'Measure report latency and plans over a grid of reports, months and '
+        'case office filters, on the current data, e.g. from '
+        'generate_synthetic_data. Save the results with --output and compare '
+        'them after a change with --compare.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--reports', nargs='+', choices=list(REPORTS), default=list(REPORTS)
+        )
+        parser.add_argument('--months', type=int, nargs='+', default=[1, 6, 12, 24])
+        parser.add_argument(
+            '--case-offices',
+            nargs='+',
+            default=['all', 'busiest'],
+            help='Case office filters: all, busiest or case office ids',
+        )
+        parser.add_argument(
+            '--add-offices',
+            type=int,
+            default=0,
+            help=(
+                'Add case offices with counts on every day, rolled back '
+                'afterwards, e.g. to measure scaling by number of offices'
+            ),
+        )
+        parser.add_argument('--iterations', type=int, default=10)
+        parser.add_argument(
+            '--warmup',
+            type=int,
+            default=5,
+            help='Untimed executions first, after which Postgres may switch '
+            'the prepared statements to their generic plans',
+        )
+        parser.add_argument('--output', help='Write the results to this JSON file')
+        parser.add_argument('--compare', help='Results JSON file to compare with')
+
+    def handle(self, *args, **options):
+        compared = {}
+        if options['compare']:
+            with open(options['compare']) as file:
+                compared = {
+                    self._key(result): result for result in json.load(file)['results']
+                }
+        end_month = date.today().replace(day=1)
+        with transaction.atomic(), connection.cursor() as cursor:
+            if options['add_offices']:
+                self._add_offices(
+                    cursor,
+                    options['add_offices'],
+                    months_before(end_month, max(options['months'])),
+                )
+            case_offices = self._case_offices(cursor, options['case_offices'])
+            results = []
+            self.stdout.write(
+                f'{"report":<16} {"months":>6} {"office":>8} {"p50 ms":>8} '
+                f'{"p99 ms":>8} {"buffers":>9}  compared'
+            )
+            for report in options['reports']:
+                for months in options['months']:
+                    for label, case_office in case_offices:
+                        result = self._measure(
+                            cursor,
+                            report,
+                            months,
+                            end_month,
+                            label,
+                            case_office,
+                            options,
+                        )
+                        results.append(result)
+                        self._write(result, compared.get(self._key(result)))
+            dataset = {
+                'case_offices': CaseOffice.objects.count(),
+                'legal_cases': LegalCase.objects.count(),
+                'logs': Log.objects.count(),
+            }
+            cursor.execute('SHOW server_version')
+            server_version = cursor.fetchone()[0]
+            transaction.set_rollback(True)
+        if options['output']:
+            with open(options['output'], 'w') as file:
+                json.dump(
+                    {
+                        'commit': commit(),
+                        'at': timezone.now().isoformat(),
+                        'server_version': server_version,
+                        'dataset': dataset,
+                        'results': results,
+                    },
+                    file,
+                    indent=2,
+                )
+            self.stdout.write(f'Wrote {options["output"]}')
+
+    def _add_offices(self, cursor, count, start):
+        run_id = uuid.uuid4().hex[:8]
+        offices = CaseOffice.objects.bulk_create(
+            CaseOffice(name=f'Benchmark office {run_id} {i}', description='')
+            for i in range(count)
+        )
+        cursor.execute(FILL_DAYS, [start, date.today(), [o.id for o in offices]])
+
+    def _case_offices(self, cursor, filters):
+        case_offices = []
+        for case_office in filters:
+            if case_office == 'all':
+                case_offices.append(('all', None))
+            elif case_office == 'busiest':
+                cursor.execute(BUSIEST_CASE_OFFICE)
+                row = cursor.fetchone()
+                if row is not None:
+                    case_offices.append(('busiest', row[0]))
+            else:
+                case_offices.append((case_office, int(case_office)))
+        return case_offices
+
+    def _key(self, result):
+        return (result['report'], result['months'], result['case_office'])
+
+    def _measure(self, cursor, report, months, end_month, label, case_office, options):
+        start = months_before(end_month, months)
+        # The range summary takes days, the others the first days of months
+        end = date.today() if report == 'range-summary' else end_month
+        query = REPORTS[report](start.isoformat(), end.isoformat(), case_office)
+        for _ in range(options['warmup']):
+            queries.execute(cursor, *query)
+            cursor.fetchone()
+        durations = []
+        for _ in range(options['iterations']):
+            started = time.perf_counter()
+            queries.execute(cursor, *query)
+            cursor.fetchone()
+            durations.append((time.perf_counter() - started) * 1000)
+        plan = queries.explain(cursor, *query)
+        return {
+            'report': report,
+            'months': months,
+            'case_office': label,
+            'p50_ms': round(percentile(durations, 50), 3),
+            'p99_ms': round(percentile(durations, 99), 3),
+            'execution_ms': plan['Execution Time'],
+            'buffers': buffers(plan['Plan']),
+            'shape': plan_shape(plan['Plan']),
+            'plan': plan,
+        }
+
+    def _write(self, result, compared):
+        comparison = ''
+        if compared is not None:
+            ratio = result['p50_ms'] / compared['p50_ms'] if compared['p50_ms'] else 1
+            comparison = f'{ratio:.2f}x'
+            if ratio > REGRESSION:
+                comparison += ' SLOWER'
+            if result['shape'] != compared['shape']:
+                comparison += ' plan changed'
+        self.stdout.write(
+            f'{result["report"]:<16} {result["months"]:>6} '
+            f'{result["case_office"]:>8} {result["p50_ms"]:>8.2f} '
+            f'{result["p99_ms"]:>8.2f} {result["buffers"]:>9}  {comparison}'
+        )
@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+
+from case_management import partitions
+
+
+class Command(BaseCommand):
+    help = (
+        'Create monthly partitions of the log and logchange tables for the '
+        'current and upcoming months. Run this monthly, e.g. from cron.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--months-ahead', type=int, default=3)
+
+    def handle(self, *args, **options):
+        with transaction.atomic(), connection.cursor() as cursor:
+            created = partitions.create_future_partitions(
+                cursor, options['months_ahead']
+            )
+        for name in created:
+            self.stdout.write(f'Created {name}')
@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from case_management.history import SNAPSHOT_INTERVAL, create_snapshots
+
+
+class Command(BaseCommand):
+    help = (
+        'Snapshot the state of logged records every --interval logs, so that '
+        'point-in-time state is replayed from a nearby snapshot. Run regularly, '
+        'e.g. nightly from cron.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--interval', type=int, default=SNAPSHOT_INTERVAL)
+
+    def handle(self, *args, **options):
+        count = create_snapshots(options['interval'])
+        self.stdout.write(f'Created {count} snapshots')
@@ -0,0 +1,460 @@
+import random
+import time
+import uuid
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.utils import timezone
+
+from case_management import partitions
+from case_management.models import (
+    CaseOffice,
+    CaseUpdate,
+    Client,
+    File,
+    LegalCase,
+    LegalCaseStateTransition,
+    Log,
+    LogChange,
+    Meeting,
+    Note,
+    User,
+)
+
+# Rows are generated in the database from generate_series and random(), with
+# their ids drawn from the tables' sequences up front, so that they can be
+# referenced before they are inserted. The staging tables hold the ids and
+# the random choices every later step builds on.
+STAGING = [
+    (
+        'office',
+        '''
+SELECT nextval(%(caseoffice_seq)s::regclass) id, n
+FROM generate_series(1, %(offices)s) n''',
+    ),
+    (
+        'user',
+        '''
+SELECT nextval(%(user_seq)s::regclass) id, office.id office_id, office.n office_n, user_n n
+FROM synthetic_office office, generate_series(1, %(users_per_office)s) user_n''',
+    ),
+    (
+        'case',
+        '''
+WITH
+  picks AS (
+    SELECT
+      -- A few large case offices and many small ones
+      1 + floor(%(offices)s * random() ^ 2)::integer office_n,
+      1 + floor(%(users_per_office)s * random())::integer user_n,
+      %(start)s + random() * (now() - %(start)s) created_at,
+      random() progress,
+      random() close,
+      random() ^ 2 * interval '1 year' duration,
+      floor(random() * (2 * %(updates_per_case)s + 1))::integer updates
+    FROM generate_series(1, %(cases)s)
+  ),
+  cases AS (
+    SELECT
+      picks.*,
+      usr.office_id,
+      usr.id user_id,
+      picks.created_at + picks.duration closed_at
+    FROM
+      picks
+    INNER JOIN synthetic_user usr ON
+      usr.office_n = picks.office_n
+      AND usr.n = picks.user_n
+  )
+SELECT
+  nextval(%(legalcase_seq)s::regclass) id,
+  nextval(%(client_seq)s::regclass) client_id,
+  office_id,
+  user_id,
+  created_at,
+  CASE
+    WHEN progress < 0.8 AND created_at + duration * progress / 4 < now()
+    THEN created_at + duration * progress / 4
+  END in_progress_at,
+  CASE WHEN close < 0.7 AND closed_at < now() THEN closed_at END closed_at,
+  updates
+FROM cases''',
+    ),
+    (
+        'update',
+        '''
+SELECT
+  nextval(%(caseupdate_seq)s::regclass) id,
+  kind,
+  CASE kind
+    WHEN 'Note' THEN nextval(%(note_seq)s::regclass)
+    WHEN 'Meeting' THEN nextval(%(meeting_seq)s::regclass)
+    ELSE nextval(%(file_seq)s::regclass)
+  END child_id,
+  legal_case_id,
+  case_number,
+  user_id,
+  created_at
+FROM (
+  SELECT
+    (ARRAY['Note', 'Meeting', 'File'])[1 + floor(random() * 3)::integer] kind,
+    legalcase.id legal_case_id,
+    'S' || %(run)s || '/' || legalcase.id case_number,
+    legalcase.user_id,
+    legalcase.created_at
+      + random() * (COALESCE(legalcase.closed_at, now()) - legalcase.created_at)
+      AS created_at
+  FROM synthetic_case legalcase, generate_series(1, legalcase.updates)
+) updates''',
+    ),
+]
+
+# The model rows, as SELECTs of the model's columns from the staging tables
+ROWS = [
+    (
+        CaseOffice,
+        ['id', 'name', 'description', 'case_office_code', 'created_at', 'updated_at'],
+        '''
+SELECT id, 'Synthetic office ' || %(run)s || ' ' || n, 'Synthetic', 'S' || n %% 100,
+  %(start)s, %(start)s
+FROM synthetic_office''',
+    ),
+    (
+        User,
+        ['id', 'email', 'password', 'name', 'case_office_id', 'permission_group'],
+        '''
+SELECT id, 'synthetic-' || %(run)s || '-' || id || '@example.com', '!',
+  'Officer ' || id, office_id, 'CaseWorker'
+FROM synthetic_user''',
+    ),
+    (
+        Client,
+        ['id', 'name', 'preferred_name', 'created_at', 'updated_at', 'created_by_id'],
+        '''
+SELECT client_id, 'Client ' || client_id, 'Client ' || client_id, created_at,
+  created_at, user_id
+FROM synthetic_case''',
+    ),
+    (
+        LegalCase,
+        [
+            'id',
+            'case_number',
+            'state',
+            'client_id',
+            'created_at',
+            'updated_at',
+            'created_by_id',
+            'updated_by_id',
+        ],
+        '''
+SELECT
+  id,
+  'S' || %(run)s || '/' || id,
+  CASE
+    WHEN closed_at IS NOT NULL THEN 'Closed'
+    WHEN in_progress_at IS NOT NULL THEN 'InProgress'
+    ELSE 'Opened'
+  END,
+  client_id,
+  created_at,
+  COALESCE(closed_at, in_progress_at, created_at),
+  user_id,
+  user_id
+FROM synthetic_case''',
+    ),
+    (
+        LegalCase.case_offices.through,
+        ['legalcase_id', 'caseoffice_id'],
+        'SELECT id, office_id FROM synthetic_case',
+    ),
+    (
+        LegalCase.users.through,
+        ['legalcase_id', 'user_id'],
+        'SELECT id, user_id FROM synthetic_case',
+    ),
+    (
+        LegalCaseStateTransition,
+        ['legal_case_id', 'from_state', 'to_state', 'at', 'user_id'],
+        '''
+SELECT id, 'Opened', 'InProgress', in_progress_at, user_id
+FROM synthetic_case
+WHERE in_progress_at IS NOT NULL
+UNION ALL
+SELECT
+  id,
+  CASE WHEN in_progress_at IS NULL THEN 'Opened' ELSE 'InProgress' END,
+  'Closed',
+  closed_at,
+  user_id
+FROM synthetic_case
+WHERE closed_at IS NOT NULL''',
+    ),
+    (
+        CaseUpdate,
+        ['id', 'legal_case_id', 'created_at', 'updated_at', 'created_by_id'],
+        'SELECT id, legal_case_id, created_at, created_at, user_id FROM synthetic_update',
+    ),
+    (
+        Note,
+        [
+            'id',
+            'case_update_id',
+            'legal_case_id',
+            'title',
+            'content',
+            'created_at',
+            'updated_at',
+            'created_by_id',
+        ],
+        '''
+SELECT child_id, id, legal_case_id, 'Note ' || child_id, 'Synthetic note', created_at,
+  created_at, user_id
+FROM synthetic_update
+WHERE kind = 'Note' ''',
+    ),
+    (
+        Meeting,
+        [
+            'id',
+            'case_update_id',
+            'legal_case_id',
+            'meeting_date',
+            'location',
+            'notes',
+            'created_at',
+            'updated_at',
+            'created_by_id',
+        ],
+        '''
+SELECT child_id, id, legal_case_id, created_at, 'Office', 'Synthetic meeting',
+  created_at, created_at, user_id
+FROM synthetic_update
+WHERE kind = 'Meeting' ''',
+    ),
+    (
+        File,
+        [
+            'id',
+            'case_update_id',
+            'legal_case_id',
+            'upload',
+            'description',
+            'created_at',
+            'updated_at',
+            'created_by_id',
+        ],
+        '''
+SELECT child_id, id, legal_case_id, 'uploads/synthetic-' || child_id || '.pdf',
+  'synthetic-' || child_id || '.pdf', created_at, created_at, user_id
+FROM synthetic_update
+WHERE kind = 'File' ''',
+    ),
+]
+
+# The audit log of the rows above, as the application writes it: the
+# changes of each log are a JSON array of {field, value, action}
+LOGS = '''
+SELECT nextval(%(log_seq)s::regclass) id, *
+FROM (
+  SELECT
+    'Client' target_type, client_id target_id, 'Client' parent_type,
+    client_id parent_id, 'Create' action, user_id, created_at,
+    'Client ' || client_id note,
+    jsonb_build_array(
+      jsonb_build_object('field', 'name', 'value', 'Client ' || client_id),
+      jsonb_build_object('field', 'preferred_name', 'value', 'Client ' || client_id)
+    ) changes
+  FROM synthetic_case
+  UNION ALL
+  SELECT
+    'LegalCase', id, 'LegalCase', id, 'Create', user_id, created_at,
+    'S' || %(run)s || '/' || id,
+    jsonb_build_array(
+      jsonb_build_object('field', 'case_number', 'value', 'S' || %(run)s || '/' || id),
+      jsonb_build_object('field', 'state', 'value', 'Opened'),
+      jsonb_build_object('field', 'client', 'value', client_id::text),
+      jsonb_build_object(
+        'field', 'case_offices', 'value', '[' || office_id || ']', 'action', 'Add'
+      ),
+      jsonb_build_object('field', 'users', 'value', '[' || user_id || ']', 'action', 'Add')
+    )
+  FROM synthetic_case
+  UNION ALL
+  SELECT
+    'LegalCase', transition.legal_case_id, 'LegalCase', transition.legal_case_id,
+    'Update', transition.user_id, transition.at,
+    'S' || %(run)s || '/' || transition.legal_case_id,
+    jsonb_build_array(jsonb_build_object('field', 'state', 'value', transition.to_state))
+  FROM case_management_legalcasestatetransition transition
+  INNER JOIN synthetic_case ON synthetic_case.id = transition.legal_case_id
+  UNION ALL
+  SELECT
+    'CaseUpdate', id, 'LegalCase', legal_case_id, 'Create', user_id, created_at,
+    case_number || ' case update',
+    jsonb_build_array(jsonb_build_object('field', 'legal_case', 'value', legal_case_id::text))
+  FROM synthetic_update
+  UNION ALL
+  SELECT
+    kind, child_id, 'LegalCase', legal_case_id, 'Create', user_id, created_at,
+    kind || ' ' || child_id,
+    jsonb_build_array(
+      jsonb_build_object('field', 'legal_case', 'value', legal_case_id::text),
+      jsonb_build_object('field', 'case_update', 'value', id::text)
+    )
+  FROM synthetic_update
+  -- Ids increase with time, as when logs are written
+  ORDER BY created_at
+) logs'''
+
+CHANGE = '''
+jsonb_build_object(
+  'id', nextval(%(logchange_seq)s::regclass),
+  'field', change->>'field',
+  'value', change->>'value',
+  'action', COALESCE(change->>'action', 'Change')
+)'''
+
+LOG_COLUMNS = [
+    'id',
+    'target_type',
+    'target_id',
+    'parent_type',
+    'parent_id',
+    'action',
+    'user_id',
+    'created_at',
+    'updated_at',
+    'note',
+]
+LOG_SELECT = '''
+SELECT
+  id, target_type, target_id, parent_type, parent_id, action, user_id, created_at,
+  created_at, note'''
+
+LOG_ROWS = [
+    (Log, LOG_COLUMNS, f'{LOG_SELECT} FROM synthetic_log'),
+    (
+        LogChange,
+        ['log_id', 'created_at', 'field', 'value', 'action'],
+        '''
+SELECT
+  log.id, log.created_at, change->>'field', change->>'value',
+  COALESCE(change->>'action', 'Change')
+FROM synthetic_log log, jsonb_array_elements(log.changes) change''',
+    ),
+]
+
+# With AUDIT_LOG_STORAGE 'json' changes are stored on the log instead
+JSON_LOG_ROWS = [
+    (
+        Log,
+        LOG_COLUMNS + ['change_set'],
+        f'''{LOG_SELECT},
+  (SELECT jsonb_agg({CHANGE}) FROM jsonb_array_elements(changes) change)
+FROM synthetic_log''',
+    ),
+]
+
+
+def insert(cursor, model, columns, select, params):
+    '''Insert the rows of select into the columns of model's table, filling
+    its other required columns with their defaults. Returns the row count.'''
+    defaults = {}
+    for field in model._meta.concrete_fields:
+        if field.column in columns or field.null or field.primary_key:
+            continue
+        default = field.get_default()
+        if default is None:
+            raise ValueError(f'{model.__name__}.{field.name} needs a value')
+        defaults[field.column] = default
+    names = {column: f'default_{i}' for i, column in enumerate(defaults)}
+    default_values = ''.join(f', %({names[column]})s' for column in defaults)
+    cursor.execute(
+        f'''INSERT INTO {model._meta.db_table} ({', '.join(columns + list(defaults))})
+        SELECT generated.*{default_values} FROM ({select}) generated''',
+        {**params, **{names[column]: value for column, value in defaults.items()}},
+    )
+    return cursor.rowcount
+
+
+class Command(BaseCommand):
+    help = (
+        'Add synthetic case offices, users, clients, cases with their state '
+        'transitions, case updates, notes, meetings and files, and their audit '
+        'logs, spread over the given number of years. For load and report '
+        'testing, so run it against a throwaway database.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--offices', type=int, default=20)
+        parser.add_argument('--users-per-office', type=int, default=10)
+        parser.add_argument('--cases', type=int, default=10000)
+        parser.add_argument(
+            '--updates-per-case',
+            type=int,
+            default=5,
+            help='Average case updates per case, each with a note, meeting or file',
+        )
+        parser.add_argument('--years', type=int, default=3)
+        parser.add_argument('--seed', type=int, help='Repeat an earlier dataset')
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        now = timezone.now()
+        params = {
+            'run': uuid.uuid4().hex[:6],
+            'start': now - timedelta(days=365 * options['years']),
+            'offices': options['offices'],
+            'users_per_office': options['users_per_office'],
+            'cases': options['cases'],
+            'updates_per_case': options['updates_per_case'],
+        }
+        models = [m for m, _, _ in ROWS] + [Log, LogChange]
+        with transaction.atomic(), connection.cursor() as cursor:
+            for model in models:
+                cursor.execute(
+                    "SELECT pg_get_serial_sequence(%s, 'id')", [model._meta.db_table]
+                )
+                params[f'{model._meta.model_name}_seq'] = cursor.fetchone()[0]
+            if options['seed'] is not None:
+                seed = random.Random(options['seed']).uniform(-1, 1)
+                cursor.execute('SELECT setseed(%s)', [seed])
+            for table in partitions.PARTITIONED_TABLES:
+                if partitions.is_partitioned(cursor, table):
+                    partitions.create_partitions(
+                        cursor, table, params['start'].date(), now.date()
+                    )
+
+            for name, select in STAGING:
+                cursor.execute(
+                    f'CREATE TEMPORARY TABLE synthetic_{name} ON COMMIT DROP AS {select}',
+                    params,
+                )
+            for model, columns, select in ROWS:
+                self._insert(cursor, model, columns, select, params)
+            cursor.execute(
+                f'CREATE TEMPORARY TABLE synthetic_log ON COMMIT DROP AS {LOGS}', params
+            )
+            if settings.AUDIT_LOG_STORAGE == 'json':
+                rows = JSON_LOG_ROWS
+            else:
+                rows = LOG_ROWS
+            for model, columns, select in rows:
+                self._insert(cursor, model, columns, select, params)
+            # Plan the rebuild for the tables' new sizes
+            for model in models:
+                cursor.execute(f'ANALYZE {model._meta.db_table}')
+            call_command('rebuild_report_tables', stdout=self.stdout)
+        self.stdout.write(f'Done in {time.perf_counter() - started:.1f} s')
+
+    def _insert(self, cursor, model, columns, select, params):
+        started = time.perf_counter()
+        count = insert(cursor, model, columns, select, params)
+        self.stdout.write(
+            f'Added {count} {model._meta.verbose_name_plural} '
+            f'in {time.perf_counter() - started:.1f} s'
+        )
@@ -0,0 +1,31 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from case_management.history import state_at
+
+
+class Command(BaseCommand):
+    help = 'Print the state of a logged record at a time, replayed from its logs'
+
+    def add_arguments(self, parser):
+        parser.add_argument('target_type', help='Model name, e.g. LegalCase')
+        parser.add_argument('target_id', type=int)
+        parser.add_argument('--at', help='ISO 8601 date and time, defaults to now')
+
+    def handle(self, *args, **options):
+        at = timezone.now()
+        if options['at'] is not None:
+            at = parse_datetime(options['at'])
+            if at is None:
+                raise CommandError('--at must be an ISO 8601 date and time')
+            if timezone.is_naive(at):
+                at = timezone.make_aware(at)
+        try:
+            state = state_at(options['target_type'], options['target_id'], at)
+        except LookupError as error:
+            raise CommandError(error)
+        self.stdout.write(json.dumps(state, cls=DjangoJSONEncoder, indent=2))
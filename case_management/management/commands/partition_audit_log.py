@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+
+from case_management import partitions
+
+
+class Command(BaseCommand):
+    help = (
+        'Convert the log and logchange tables to monthly range partitions on '
+        'created_at. Copies all rows under an exclusive lock, so run it in a '
+        'maintenance window.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--months-ahead',
+            type=int,
+            default=3,
+            help='Also create partitions for this many future months',
+        )
+
+    def handle(self, *args, **options):
+        with transaction.atomic(), connection.cursor() as cursor:
+            converted = partitions.partition_audit_log(cursor, options['months_ahead'])
+        for table in converted:
+            self.stdout.write(f'Partitioned {table}')
+        if not converted:
+            self.stdout.write('Audit log tables are already partitioned')
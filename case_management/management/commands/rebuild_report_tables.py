@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+
+from case_management import queries, report_cache, rollups
+
+
+class Command(BaseCommand):
+    help = (
+        'Recompute the tables reports read instead of the case history, which '
+        'are otherwise kept up to date as cases change. Run after changing '
+        'cases, their state transitions or logs outside the application.'
+    )
+
+    def handle(self, *args, **options):
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute(queries.REBUILD_LEGALCASE_ACTIVITY)
+            self.stdout.write(
+                f'Updated close and last activity dates of {cursor.rowcount} cases'
+            )
+            days = rollups.rebuild()
+            self.stdout.write(f'Rebuilt {days} days of case office counts')
+            report_cache.bump()
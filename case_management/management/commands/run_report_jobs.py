@@ -0,0 +1,51 @@
+import multiprocessing
+import signal
+import sys
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from case_management import report_jobs
+
+
+class Command(BaseCommand):
+    help = (
+        'Run reports submitted as jobs with POST /api/v1/reports/<report>/jobs. '
+        'Keep it running next to the web workers, e.g. as its own process type.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--processes',
+            type=int,
+            default=2,
+            help='Worker processes, each running one report at a time',
+        )
+        parser.add_argument(
+            '--once',
+            action='store_true',
+            help='Run the pending jobs in this process and exit',
+        )
+
+    def handle(self, *args, **options):
+        if options['once']:
+            report_jobs.work(once=True)
+            return
+        # Forked processes must not share the parent's connections
+        connections.close_all()
+        processes = [
+            multiprocessing.Process(target=report_jobs.work, daemon=True)
+            for _ in range(options['processes'])
+        ]
+        for process in processes:
+            process.start()
+        # Stop the workers with this process, e.g. when the platform stops it
+        signal.signal(signal.SIGTERM, lambda *args: sys.exit(0))
+        try:
+            for process in processes:
+                process.join()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            for process in processes:
+                process.terminate()
@@ -1,4 +1,5 @@
 from django.contrib.auth.base_user import BaseUserManager
+from django.db import models
 from django.utils.translation import ugettext_lazy as _
 
 
@@ -34,3 +35,11 @@ class UserManager(BaseUserManager):
         if extra_fields.get('is_superuser') is not True:
             raise ValueError(_('Superuser must have is_superuser=True.'))
         return self.create_user(email, password, **extra_fields)
+
+
+class LogQuerySet(models.QuerySet):
+    def with_details(self):
+        """
+        Load the user and changes that LogSerializer reads along with the logs.
+        """
+        return self.select_related('user').prefetch_related('changes')
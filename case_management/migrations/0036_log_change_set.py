@@ -0,0 +1,26 @@
+# Generated by Django 3.2.25 on 2026-10-18 05:59
+
+import django.contrib.postgres.indexes
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    # The index is built without blocking writes to the log
+    atomic = False
+
+    dependencies = [
+        ('case_management', '0035_fix_logs'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='log',
+            name='change_set',
+            field=models.JSONField(blank=True, null=True),
+        ),
+        AddIndexConcurrently(
+            model_name='log',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['change_set'], name='log_change_set_gin'),
+        ),
+    ]
@@ -0,0 +1,57 @@
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import migrations, transaction
+
+BATCH_SIZE = 1000
+
+
+def backfill(apps, schema_editor):
+    '''Copy existing LogChange rows into Log.change_set when switching to
+    AUDIT_LOG_STORAGE = 'json', one batch of logs at a time. Deployments
+    using rows storage skip this; run manage.py backfill_log_change_sets
+    when switching later.'''
+    if settings.AUDIT_LOG_STORAGE != 'json':
+        return
+    Log = apps.get_model('case_management', 'Log')
+    LogChange = apps.get_model('case_management', 'LogChange')
+    last_id = 0
+    while True:
+        logs = list(
+            Log.objects.filter(id__gt=last_id, change_set__isnull=True)
+            .only('id')
+            .order_by('id')[:BATCH_SIZE]
+        )
+        if not logs:
+            return
+        entries = defaultdict(list)
+        rows = (
+            LogChange.objects.filter(log_id__gte=logs[0].id, log_id__lte=logs[-1].id)
+            .order_by('id')
+            .values('id', 'log_id', 'field', 'value', 'action')
+        )
+        for row in rows:
+            entries[row.pop('log_id')].append(row)
+        for log in logs:
+            log.change_set = entries[log.id]
+        with transaction.atomic():
+            Log.objects.bulk_update(logs, ['change_set'])
+        last_id = logs[-1].id
+
+
+def clear(apps, schema_editor):
+    Log = apps.get_model('case_management', 'Log')
+    Log.objects.update(change_set=None)
+
+
+class Migration(migrations.Migration):
+    # Each batch commits on its own rather than in one long transaction
+    atomic = False
+
+    dependencies = [
+        ('case_management', '0036_log_change_set'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill, clear),
+    ]
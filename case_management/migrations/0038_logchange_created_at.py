@@ -0,0 +1,50 @@
+from django.db import migrations, models
+import django.db.models.deletion
+
+BATCH_SIZE = 10000
+
+
+def copy_log_created_at(apps, schema_editor):
+    '''Fill logchange.created_at from its log, one id range at a time'''
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute('SELECT MIN(id), MAX(id) FROM case_management_logchange')
+        first_id, last_id = cursor.fetchone()
+        if first_id is None:
+            return
+        for start in range(first_id, last_id + 1, BATCH_SIZE):
+            cursor.execute(
+                '''UPDATE case_management_logchange logchange
+                SET created_at = log.created_at
+                FROM case_management_log log
+                WHERE log.id = logchange.log_id
+                    AND logchange.id >= %s AND logchange.id < %s''',
+                [start, start + BATCH_SIZE],
+            )
+
+
+class Migration(migrations.Migration):
+    # Each backfill batch commits on its own rather than in one long transaction
+    atomic = False
+
+    dependencies = [
+        ('case_management', '0037_backfill_log_change_set'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='logchange',
+            name='log',
+            field=models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.CASCADE, related_name='changes', to='case_management.log'),
+        ),
+        migrations.AddField(
+            model_name='logchange',
+            name='created_at',
+            field=models.DateTimeField(null=True),
+        ),
+        migrations.RunPython(copy_log_created_at, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='logchange',
+            name='created_at',
+            field=models.DateTimeField(),
+        ),
+    ]
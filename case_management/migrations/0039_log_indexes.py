@@ -0,0 +1,24 @@
+# Generated by Django 3.2.25 on 2026-10-18 06:04
+
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    # The indexes are built without blocking writes to the log
+    atomic = False
+
+    dependencies = [
+        ('case_management', '0038_logchange_created_at'),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name='log',
+            index=models.Index(fields=['parent_type', 'parent_id', '-id'], name='log_parent_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='log',
+            index=models.Index(fields=['target_type', 'target_id'], name='log_target_idx'),
+        ),
+    ]
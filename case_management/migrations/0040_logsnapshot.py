@@ -0,0 +1,30 @@
+# Generated by Django 3.2.25 on 2026-10-18 06:27
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('case_management', '0039_log_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LogSnapshot',
+            fields=[
+                ('id', models.AutoField(primary_key=True, serialize=False)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('target_id', models.IntegerField()),
+                ('target_type', models.CharField(max_length=255)),
+                ('last_log_id', models.IntegerField()),
+                ('logged_at', models.DateTimeField()),
+                ('fields', models.JSONField()),
+                ('deleted', models.BooleanField(default=False)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='logsnapshot',
+            index=models.Index(fields=['target_type', 'target_id', 'logged_at'], name='logsnapshot_target_idx'),
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 3.2.25 on 2026-10-18 06:30
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('case_management', '0040_logsnapshot'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LegalCaseStateTransition',
+            fields=[
+                ('id', models.AutoField(primary_key=True, serialize=False)),
+                ('from_state', models.CharField(choices=[('Opened', 'Opened'), ('InProgress', 'In Progress'), ('Hanging', 'Hanging'), ('Pending', 'Pending'), ('Referred', 'Referred'), ('Resolved', 'Resolved'), ('Escalated', 'Escalated'), ('Closed', 'Closed')], max_length=10, null=True)),
+                ('to_state', models.CharField(choices=[('Opened', 'Opened'), ('InProgress', 'In Progress'), ('Hanging', 'Hanging'), ('Pending', 'Pending'), ('Referred', 'Referred'), ('Resolved', 'Resolved'), ('Escalated', 'Escalated'), ('Closed', 'Closed')], max_length=10)),
+                ('at', models.DateTimeField()),
+                ('legal_case', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='state_transitions', to='case_management.legalcase')),
+                ('user', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='legalcasestatetransition',
+            index=models.Index(fields=['to_state', 'at'], name='transition_to_state_at_idx'),
+        ),
+    ]
@@ -0,0 +1,60 @@
+from django.db import migrations
+
+# State values logged for each case, from either audit storage mode, with the
+# previous logged value as from_state. Opened at creation is the default and
+# not a transition, matching LegalCase.record_initial_state.
+BACKFILL = """
+INSERT INTO case_management_legalcasestatetransition (
+    legal_case_id, from_state, to_state, at, user_id
+)
+SELECT
+    legal_case_id, from_state, to_state, at, user_id
+FROM (
+    SELECT
+        state_log.target_id legal_case_id,
+        LAG(state_log.value) OVER (
+            PARTITION BY state_log.target_id ORDER BY state_log.id
+        ) from_state,
+        state_log.value to_state,
+        state_log.created_at at,
+        state_log.user_id
+    FROM (
+        SELECT log.id, log.target_id, log.created_at, log.user_id, logchange.value
+        FROM
+            case_management_log log
+        INNER JOIN case_management_logchange logchange ON
+            log.id = logchange.log_id
+            AND log.created_at = logchange.created_at
+        WHERE
+            log.target_type = 'LegalCase'
+            AND log.change_set IS NULL
+            AND logchange.field = 'state'
+        UNION ALL
+        SELECT log.id, log.target_id, log.created_at, log.user_id, entry->>'value'
+        FROM
+            case_management_log log,
+            jsonb_array_elements(log.change_set) entry
+        WHERE
+            log.target_type = 'LegalCase'
+            AND log.change_set @> '[{"field": "state"}]'
+            AND entry->>'field' = 'state'
+    ) state_log
+) transition
+WHERE
+    NOT (from_state IS NULL AND to_state = 'Opened')
+    AND from_state IS DISTINCT FROM to_state
+    AND legal_case_id IN (SELECT id FROM case_management_legalcase)
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('case_management', '0041_legalcasestatetransition'),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            BACKFILL, 'DELETE FROM case_management_legalcasestatetransition'
+        ),
+    ]
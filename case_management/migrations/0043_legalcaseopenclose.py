@@ -0,0 +1,26 @@
+# Generated by Django 3.2.25 on 2026-10-18 06:52
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('case_management', '0042_backfill_legalcase_state_transitions'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LegalCaseOpenClose',
+            fields=[
+                ('legal_case', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='open_close', serialize=False, to='case_management.legalcase')),
+                ('created_at', models.DateTimeField()),
+                ('closed_at', models.DateTimeField(null=True)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='legalcaseopenclose',
+            index=models.Index(fields=['closed_at'], name='openclose_closed_at_idx'),
+        ),
+    ]
@@ -0,0 +1,26 @@
+from django.db import migrations
+
+BACKFILL = """
+INSERT INTO case_management_legalcaseopenclose (legal_case_id, created_at, closed_at)
+SELECT
+    legalcase.id,
+    legalcase.created_at,
+    MAX(transition.at) FILTER (WHERE transition.to_state = 'Closed')
+FROM
+    case_management_legalcase legalcase
+LEFT JOIN case_management_legalcasestatetransition transition ON
+    transition.legal_case_id = legalcase.id
+GROUP BY
+    legalcase.id
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('case_management', '0043_legalcaseopenclose'),
+    ]
+
+    operations = [
+        migrations.RunSQL(BACKFILL, 'DELETE FROM case_management_legalcaseopenclose'),
+    ]
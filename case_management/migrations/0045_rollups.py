@@ -0,0 +1,55 @@
+# Generated by Django 3.2.25 on 2026-10-18 07:00
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('case_management', '0044_backfill_legalcaseopenclose'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CaseOfficeDay',
+            fields=[
+                ('id', models.AutoField(primary_key=True, serialize=False)),
+                ('day', models.DateField()),
+                ('cases_opened', models.IntegerField(default=0)),
+                ('cases_closed', models.IntegerField(default=0)),
+                ('case_logs', models.IntegerField(default=0)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='UserActivityDay',
+            fields=[
+                ('id', models.AutoField(primary_key=True, serialize=False)),
+                ('day', models.DateField()),
+                ('logs', models.IntegerField(default=0)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='useractivityday',
+            name='user',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddField(
+            model_name='caseofficeday',
+            name='case_office',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='case_management.caseoffice'),
+        ),
+        migrations.AddIndex(
+            model_name='useractivityday',
+            index=models.Index(fields=['day'], name='useractivityday_day_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='useractivityday',
+            constraint=models.UniqueConstraint(fields=('user', 'day'), name='useractivityday_unique'),
+        ),
+        migrations.AddConstraint(
+            model_name='caseofficeday',
+            constraint=models.UniqueConstraint(fields=('case_office', 'day'), name='caseofficeday_unique'),
+        ),
+    ]
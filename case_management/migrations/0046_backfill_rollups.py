@@ -0,0 +1,55 @@
+from django.db import migrations
+
+BACKFILL_CASE_OFFICE_DAYS = """
+INSERT INTO case_management_caseofficeday (
+    case_office_id, day, cases_opened, cases_closed, case_logs
+)
+SELECT caseoffice_id, day, SUM(cases_opened), SUM(cases_closed), SUM(case_logs)
+FROM (
+    SELECT case_office.caseoffice_id, legalcase.created_at::date AS day,
+        1 cases_opened, 0 cases_closed, 0 case_logs
+    FROM
+        case_management_legalcase_case_offices case_office
+    INNER JOIN case_management_legalcase legalcase ON
+        legalcase.id = case_office.legalcase_id
+    UNION ALL
+    SELECT case_office.caseoffice_id, transition.at::date, 0, 1, 0
+    FROM
+        case_management_legalcase_case_offices case_office
+    INNER JOIN case_management_legalcasestatetransition transition ON
+        transition.legal_case_id = case_office.legalcase_id
+        AND transition.to_state = 'Closed'
+    UNION ALL
+    SELECT case_office.caseoffice_id, log.created_at::date, 0, 0, 1
+    FROM
+        case_management_legalcase_case_offices case_office
+    INNER JOIN case_management_log log ON
+        log.target_type = 'LegalCase'
+        AND log.target_id = case_office.legalcase_id
+) counts
+GROUP BY 1, 2
+"""
+
+BACKFILL_USER_ACTIVITY_DAYS = """
+INSERT INTO case_management_useractivityday (user_id, day, logs)
+SELECT user_id, created_at::date, COUNT(*)
+FROM case_management_log
+WHERE user_id IS NOT NULL
+GROUP BY 1, 2
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('case_management', '0045_rollups'),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            BACKFILL_CASE_OFFICE_DAYS, 'DELETE FROM case_management_caseofficeday'
+        ),
+        migrations.RunSQL(
+            BACKFILL_USER_ACTIVITY_DAYS, 'DELETE FROM case_management_useractivityday'
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 3.2.25 on 2026-10-18 07:04
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('case_management', '0046_backfill_rollups'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CaseOfficeVersion',
+            fields=[
+                ('case_office', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='+', serialize=False, to='case_management.caseoffice')),
+                ('version', models.BigIntegerField(default=0)),
+            ],
+        ),
+    ]
@@ -0,0 +1,69 @@
+# Generated by Django 3.2.25 on 2026-10-18 07:47
+
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+BATCH_SIZE = 10000
+
+
+def backfill(apps, schema_editor):
+    '''Fill closed_at from LegalCaseOpenClose and last_activity_at from the
+    audit log, one id range at a time'''
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute('SELECT MIN(id), MAX(id) FROM case_management_legalcase')
+        first_id, last_id = cursor.fetchone()
+        if first_id is None:
+            return
+        for start in range(first_id, last_id + 1, BATCH_SIZE):
+            cursor.execute(
+                '''UPDATE case_management_legalcase legalcase
+                SET
+                    closed_at = open_close.closed_at,
+                    last_activity_at = GREATEST(
+                        legalcase.updated_at,
+                        (
+                            SELECT MAX(log.created_at)
+                            FROM case_management_log log
+                            WHERE
+                                log.parent_type = 'LegalCase'
+                                AND log.parent_id = legalcase.id
+                        )
+                    )
+                FROM case_management_legalcaseopenclose open_close
+                WHERE open_close.legal_case_id = legalcase.id
+                    AND legalcase.id >= %s AND legalcase.id < %s''',
+                [start, start + BATCH_SIZE],
+            )
+
+
+class Migration(migrations.Migration):
+    # Each backfill batch commits on its own rather than in one long
+    # transaction, and the indexes are built once it is done, without
+    # blocking writes to cases
+    atomic = False
+
+    dependencies = [
+        ('case_management', '0048_report_jobs'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='legalcase',
+            name='closed_at',
+            field=models.DateTimeField(editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='legalcase',
+            name='last_activity_at',
+            field=models.DateTimeField(editable=False, null=True),
+        ),
+        migrations.RunPython(backfill, migrations.RunPython.noop),
+        AddIndexConcurrently(
+            model_name='legalcase',
+            index=models.Index(fields=['closed_at'], name='legalcase_closed_at_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='legalcase',
+            index=models.Index(fields=['last_activity_at'], name='legalcase_last_activity_idx'),
+        ),
+    ]
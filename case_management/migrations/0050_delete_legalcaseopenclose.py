@@ -0,0 +1,16 @@
+# Generated by Django 3.2.25 on 2026-10-18 08:28
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('case_management', '0049_legalcase_activity'),
+    ]
+
+    operations = [
+        migrations.DeleteModel(
+            name='LegalCaseOpenClose',
+        ),
+    ]
@@ -1,8 +1,13 @@
+import functools
 import os
+from collections import defaultdict
 from django.contrib.auth.models import AbstractUser
 from django.contrib.auth.models import User
+from django.core.exceptions import ObjectDoesNotExist
 from django.core.validators import MinValueValidator
+from django.contrib.postgres.indexes import GinIndex
 from django.db import models
+from django.utils import timezone
 from phonenumber_field.modelfields import PhoneNumberField
 from case_management.enums import (
     PermissionGroups,
@@ -15,18 +20,33 @@ from case_management.enums import (
     Languages,
     Provinces,
     LogChangeTypes,
+    ReportJobStates,
 )
 from django_countries.fields import CountryField
 from django.conf import settings
-from django.db.models.signals import post_save, m2m_changed
+from django.db.models.signals import post_save, pre_save, m2m_changed
 from django.dispatch import receiver
 from rest_framework.authtoken.models import Token
-from case_management.managers import UserManager
-from django_lifecycle import LifecycleModel, hook, AFTER_CREATE, AFTER_UPDATE, BEFORE_DELETE
-from django.apps import apps
+from case_management import audit, report_cache, rollups
+from case_management.managers import LogQuerySet, UserManager
+from django_lifecycle import (
+    LifecycleModel,
+    hook,
+    AFTER_CREATE,
+    AFTER_UPDATE,
+    BEFORE_DELETE,
+    BEFORE_SAVE,
+)
 
 
-LOG_CHANGE_EXCLUDED_FIELDS = ('id', 'created_at', 'updated_at')
+# Timestamps, including those LegalCase derives from its changes
+LOG_CHANGE_EXCLUDED_FIELDS = (
+    'id',
+    'created_at',
+    'updated_at',
+    'closed_at',
+    'last_activity_at',
+)
 
 
 class User(AbstractUser):
@@ -90,6 +110,23 @@ class Log(models.Model):
 
     note = models.CharField(max_length=500, null=True, blank=True)
 
+    # Changes stored inline instead of as LogChange rows when
+    # AUDIT_LOG_STORAGE is 'json', see case_management.audit
+    change_set = models.JSONField(null=True, blank=True)
+
+    objects = LogQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            GinIndex(fields=['change_set'], name='log_change_set_gin'),
+            # Case history feed (LogViewSet): parent filter, newest first
+            models.Index(
+                fields=['parent_type', 'parent_id', '-id'], name='log_parent_idx'
+            ),
+            # History of a single record, e.g. Client.updates
+            models.Index(fields=['target_type', 'target_id'], name='log_target_idx'),
+        ]
+
     def __str__(self):
         return f'{self.action} - {self.target_type}'
 
@@ -101,21 +138,91 @@ class Log(models.Model):
 
 class LogChange(models.Model):
     id = models.AutoField(primary_key=True)
-    log = models.ForeignKey(Log, related_name='changes', on_delete=models.CASCADE)
+    # No database constraint: a partitioned log table cannot be referenced by
+    # id alone (see case_management.partitions), deletes cascade in Django
+    log = models.ForeignKey(
+        Log, related_name='changes', on_delete=models.CASCADE, db_constraint=False
+    )
+    # Copy of log.created_at, the partition key both tables share
+    created_at = models.DateTimeField()
 
     field = models.CharField(max_length=255)
     value = models.TextField(null=True)
     action = models.CharField(max_length=10, choices=LogChangeTypes.choices)
 
 
-def _logChange(log, field, value, action):
-    log_change = LogChange(
-        log=log, field=field, value=value, action=action
+class LogSnapshot(models.Model):
+    '''State of a logged record after one of its logs, see case_management.history'''
+
+    id = models.AutoField(primary_key=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    target_id = models.IntegerField()
+    target_type = models.CharField(max_length=255)
+
+    # The last log included and its created_at. Not a foreign key, see LogChange.log
+    last_log_id = models.IntegerField()
+    logged_at = models.DateTimeField()
+
+    fields = models.JSONField()
+    deleted = models.BooleanField(default=False)
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=['target_type', 'target_id', 'logged_at'],
+                name='logsnapshot_target_idx',
+            ),
+        ]
+
+
+def _logChanges(log, changes):
+    # Values are converted to text now, as they are written on commit
+    return [
+        LogChange(
+            log=log,
+            field=field,
+            value=None if value is None else str(value),
+            action=action,
+        )
+        for field, value, action in changes
+    ]
+
+
+@functools.lru_cache(maxsize=None)
+def _loggedFields(model, action):
+    '''Fields whose values are recorded as LogChanges, computed once per model.
+    A reverse one-to-one (e.g. CaseUpdate.note) cannot point at a row that was
+    only just inserted, so it is skipped on create instead of costing a lookup.
+    '''
+    return tuple(
+        field
+        for field in model._meta.get_fields()
+        if field.name not in LOG_CHANGE_EXCLUDED_FIELDS
+        and not (
+            action == 'Create'
+            and field.one_to_one
+            and field.auto_created
+            and not field.concrete
+        )
     )
-    log_change.save()
 
 
-def logIt(self, action, parent_id=None, parent_type=None, user=None, note=None):
+def _logNote(instance):
+    '''Describe the instance from memory rather than re-fetching it.
+    Related objects that __str__ depends on are served from the instance's
+    relation cache, which the save paths populate (see LoggedChildModel.save).
+    '''
+    try:
+        return str(instance)
+    except ObjectDoesNotExist:
+        # e.g. a related object __str__ depends on was already deleted
+        return instance.__class__.__name__
+
+
+def logIt(
+    self, action, parent_id=None, parent_type=None, user=None, note=None, changes=()
+):
     target_type = self.__class__.__name__
     target_id = self.id
 
@@ -126,12 +233,7 @@ def logIt(self, action, parent_id=None, parent_type=None, user=None, note=None):
         parent_type = self.__class__.__name__
 
     if note is None:
-        target_model = apps.get_model('case_management', target_type)
-        record = target_model.objects.filter(id=target_id)
-        if record.count() > 0:
-            note = record[0].__str__()
-        else:
-            note = target_type
+        note = _logNote(self)
     self.log = Log(
         parent_id=parent_id,
         parent_type=parent_type,
@@ -141,15 +243,13 @@ def logIt(self, action, parent_id=None, parent_type=None, user=None, note=None):
         user=user,
         note=note,
     )
-    self.log.save()
-    for field in self._meta.get_fields():
-        if (
-            hasattr(self, field.name)
-            and field.name not in LOG_CHANGE_EXCLUDED_FIELDS
-            and (action == 'Create' or self.has_changed(field.name))
-        ):
-            value = getattr(self, field.name)
-            _logChange(self.log, field.name, value, LogChangeTypes.CHANGE)
+    field_changes = [
+        (field.name, getattr(self, field.name), LogChangeTypes.CHANGE)
+        for field in _loggedFields(self.__class__, action)
+        if (action == 'Create' or self.has_changed(field.name))
+        and hasattr(self, field.name)
+    ]
+    audit.record(_logChanges(self.log, field_changes + list(changes)), log=self.log)
     return self.log
 
 
@@ -157,17 +257,21 @@ def logIt(self, action, parent_id=None, parent_type=None, user=None, note=None):
 def logManyToManyChange(
     sender, instance=None, action=None, model=None, pk_set=None, **kwargs
 ):
+    if not isinstance(instance, LoggedModel):
+        return
     if action in ('post_add', 'post_remove'):
         if action == 'post_add':
             change_action = LogChangeTypes.ADD
         elif action == 'post_remove':
             change_action = LogChangeTypes.REMOVE
         _, field = sender.__name__.split('_', 1)
-        value = list(pk_set)
-        if not hasattr(instance, 'log'):
-            # logIt has not been called
-            logIt(instance, 'Update', user=instance.updated_by)
-        _logChange(instance.log, field, value, change_action)
+        change = (field, list(pk_set), change_action)
+        if hasattr(instance, 'log') and audit.is_pending(instance.log):
+            # Join the instance's log from this transaction, so that all its
+            # changes in a request end up in one Log
+            audit.record(_logChanges(instance.log, [change]))
+        else:
+            logIt(instance, 'Update', user=instance.updated_by, changes=[change])
 
 class LoggedModel(LifecycleModel, models.Model):
     id = models.AutoField(primary_key=True)
@@ -216,7 +320,7 @@ class LoggedChildModel(LoggedModel):
         logIt(
             self,
             action,
-            parent_id=self.legal_case.id,
+            parent_id=self.legal_case_id,
             parent_type='LegalCase',
             user=user,
         )
@@ -256,6 +360,10 @@ class CaseOffice(LoggedModel):
     def __str__(self):
         return self.name
 
+    @hook(AFTER_UPDATE, when='name', has_changed=True)
+    def invalidate_reports(self):
+        report_cache.bump([self.id])
+
 
 class CaseType(LoggedModel):
     title = models.CharField(max_length=255, unique=True)
@@ -326,14 +434,29 @@ class Client(LoggedModel):
 
     @property
     def updates(self):
-        '''TODO: Do this in scalable way e.g. in view using proper join
-        The below would not scale, because the request is done for each row
-        '''
-        updates = Log.objects.filter(target_type='Client', target_id=self.id).order_by(
-            '-updated_at'
+        if hasattr(self, '_prefetched_updates'):
+            return self._prefetched_updates
+        updates = (
+            Log.objects.with_details()
+            .filter(target_type='Client', target_id=self.id)
+            .order_by('-updated_at')
         )
         return updates
 
+    @classmethod
+    def prefetch_updates(cls, clients):
+        '''Load the updates of many clients at once instead of per client'''
+        updates = defaultdict(list)
+        logs = (
+            Log.objects.with_details()
+            .filter(target_type='Client', target_id__in=[c.id for c in clients])
+            .order_by('-updated_at')
+        )
+        for log in logs:
+            updates[log.target_id].append(log)
+        for client in clients:
+            client._prefetched_updates = updates[client.id]
+
 
 class LegalCase(LoggedModel):
     case_number = models.CharField(max_length=32, null=False, blank=False, unique=True)
@@ -353,9 +476,155 @@ class LegalCase(LoggedModel):
     respondent_name = models.CharField(max_length=255, blank=True)
     respondent_contact_number = PhoneNumberField(blank=True)
 
+    # When the case was last closed, for reports, and last changed along with
+    # its updates, notes, meetings and files, for listing cases, without
+    # reading the audit log. Set by the hooks below and moved on to the time
+    # of each new log of the case by case_management.rollups.
+    # `manage.py rebuild_report_tables` recomputes both.
+    closed_at = models.DateTimeField(null=True, editable=False)
+    last_activity_at = models.DateTimeField(null=True, editable=False)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['closed_at'], name='legalcase_closed_at_idx'),
+            models.Index(
+                fields=['last_activity_at'], name='legalcase_last_activity_idx'
+            ),
+        ]
+
     def __str__(self):
         return self.case_number
 
+    @hook(BEFORE_SAVE)
+    def record_activity(self):
+        self.last_activity_at = timezone.now()
+
+    @hook(AFTER_CREATE)
+    def record_initial_state(self):
+        if self.state != CaseStates.OPENED:
+            self._record_state_transition(None, self.created_by)
+
+    @hook(AFTER_UPDATE, when='state', has_changed=True)
+    def record_state_change(self):
+        self._record_state_transition(self.initial_value('state'), self.updated_by)
+
+    def _record_state_transition(self, from_state, user):
+        LegalCaseStateTransition.objects.create(
+            legal_case=self,
+            from_state=from_state,
+            to_state=self.state,
+            at=self.updated_at,
+            user=user,
+        )
+        if self.state == CaseStates.CLOSED:
+            self.closed_at = self.updated_at
+            LegalCase.objects.filter(pk=self.pk).update(closed_at=self.closed_at)
+            rollups.record_close(self.id, self.updated_at)
+
+    @hook(BEFORE_DELETE)
+    def remove_from_rollups(self):
+        rollups.change_case_offices([self.id], None, -1)
+
+
+class LegalCaseStateTransition(models.Model):
+    '''A change of LegalCase.state, for reports to query instead of the audit log'''
+
+    id = models.AutoField(primary_key=True)
+    legal_case = models.ForeignKey(
+        LegalCase, related_name='state_transitions', on_delete=models.CASCADE
+    )
+    # Null for cases created in a state other than Opened
+    from_state = models.CharField(max_length=10, choices=CaseStates.choices, null=True)
+    to_state = models.CharField(max_length=10, choices=CaseStates.choices)
+    at = models.DateTimeField()
+    user = models.ForeignKey(
+        User, related_name='+', on_delete=models.SET_NULL, null=True
+    )
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['to_state', 'at'], name='transition_to_state_at_idx'),
+        ]
+
+
+class CaseOfficeDay(models.Model):
+    '''A case office's cases opened, closed and logged on one day, for
+    reports. Maintained by case_management.rollups.'''
+
+    id = models.AutoField(primary_key=True)
+    case_office = models.ForeignKey(
+        CaseOffice, related_name='+', on_delete=models.CASCADE
+    )
+    day = models.DateField()
+    cases_opened = models.IntegerField(default=0)
+    cases_closed = models.IntegerField(default=0)
+    case_logs = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['case_office', 'day'], name='caseofficeday_unique'
+            ),
+        ]
+
+
+class CaseOfficeVersion(models.Model):
+    '''Version of the report data of a case office, bumped with every change
+    to it. Report results are cached per version, see
+    case_management.report_cache.'''
+
+    case_office = models.OneToOneField(
+        CaseOffice, primary_key=True, related_name='+', on_delete=models.CASCADE
+    )
+    version = models.BigIntegerField(default=0)
+
+
+class UserActivityDay(models.Model):
+    '''The number of logs of a user on one day, for reports. Maintained by
+    case_management.rollups.'''
+
+    id = models.AutoField(primary_key=True)
+    user = models.ForeignKey(User, related_name='+', on_delete=models.CASCADE)
+    day = models.DateField()
+    logs = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'day'], name='useractivityday_unique'),
+        ]
+        indexes = [
+            models.Index(fields=['day'], name='useractivityday_day_idx'),
+        ]
+
+
+class ReportJob(models.Model):
+    '''A report run in the background by `manage.py run_report_jobs`, see
+    case_management.report_jobs'''
+
+    id = models.AutoField(primary_key=True)
+    report = models.CharField(max_length=50)
+    # The report's query parameters, e.g. startMonth, endMonth and caseOffice
+    parameters = models.JSONField()
+    # Of the report and the versions of its case offices, see report_cache.key
+    key = models.CharField(max_length=50)
+    state = models.CharField(
+        max_length=10, choices=ReportJobStates.choices, default=ReportJobStates.PENDING
+    )
+    result = models.JSONField(null=True)
+    error = models.TextField(blank=True)
+    created_by = models.ForeignKey(
+        User, related_name='+', on_delete=models.SET_NULL, null=True
+    )
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True)
+    finished_at = models.DateTimeField(null=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['key'], name='reportjob_key_idx'),
+            models.Index(fields=['state', 'id'], name='reportjob_state_idx'),
+        ]
+
 
 class CaseUpdate(LoggedChildModel):
     legal_case = models.ForeignKey(
@@ -455,6 +724,43 @@ class File(LoggedChildModel):
         return os.path.basename(self.upload.file.name)
 
 
+@receiver(m2m_changed, sender=LegalCase.case_offices.through)
+def rollUpCaseOfficeChange(
+    sender, instance=None, action=None, reverse=False, pk_set=None, **kwargs
+):
+    # Counts move while the cases are still (or already) in the case offices
+    if action == 'post_add':
+        sign = 1
+    elif action in ('pre_remove', 'pre_clear'):
+        sign = -1
+    else:
+        return
+    ids = None if pk_set is None else list(pk_set)
+    if reverse:
+        rollups.change_case_offices(ids, [instance.pk], sign)
+    else:
+        rollups.change_case_offices([instance.pk], ids, sign)
+
+
+@receiver(pre_save, sender=settings.AUTH_USER_MODEL)
+def invalidateActiveUserReports(sender, instance=None, update_fields=None, **kwargs):
+    # Reports count active users per case office and name
+    if instance.pk is None:
+        return
+    if update_fields is not None and not {'name', 'case_office'} & set(update_fields):
+        return
+    previous = sender.objects.filter(pk=instance.pk).values('name', 'case_office').first()
+    if previous is None:
+        return
+    if (previous['name'], previous['case_office']) != (
+        instance.name,
+        instance.case_office_id,
+    ):
+        report_cache.bump(
+            {previous['case_office'], instance.case_office_id} - {None}
+        )
+
+
 @receiver(post_save, sender=settings.AUTH_USER_MODEL)
 def create_auth_token(sender, instance=None, created=False, **kwargs):
     if created:
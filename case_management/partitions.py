@@ -0,0 +1,193 @@
+'''Monthly range partitioning of the audit log tables on created_at.
+
+Partitioning is opt-in: `manage.py partition_audit_log` converts existing
+tables in place, and `manage.py create_log_partitions` (run monthly, e.g.
+from cron) keeps partitions for upcoming months in place. Rows outside any
+monthly partition land in a DEFAULT partition so writes never fail, and
+move to the partition of their month once it is created.
+
+A partitioned table's primary key has to include the partition key, so the
+primary keys become (id, created_at). Django keeps treating id as the key,
+which stays unique because it is still drawn from the same sequence.
+'''
+from datetime import date
+
+LOG_TABLE = 'case_management_log'
+LOGCHANGE_TABLE = 'case_management_logchange'
+PARTITIONED_TABLES = (LOG_TABLE, LOGCHANGE_TABLE)
+
+
+def month_start(day):
+    return date(day.year, day.month, 1)
+
+
+def add_months(month, count):
+    years, month_index = divmod(month.month - 1 + count, 12)
+    return date(month.year + years, month_index + 1, 1)
+
+
+def partition_name(table, month):
+    return f'{table}_y{month:%Y}m{month:%m}'
+
+
+def is_partitioned(cursor, table):
+    cursor.execute(
+        'SELECT 1 FROM pg_partitioned_table WHERE partrelid = %s::regclass', [table]
+    )
+    return cursor.fetchone() is not None
+
+
+def default_partition(cursor, table):
+    '''The name of table's DEFAULT partition, None if it has none'''
+    cursor.execute(
+        '''SELECT partition.oid::regclass::text
+        FROM pg_inherits
+        INNER JOIN pg_class partition ON partition.oid = pg_inherits.inhrelid
+        WHERE
+            pg_inherits.inhparent = %s::regclass
+            AND pg_get_expr(partition.relpartbound, partition.oid) = 'DEFAULT'
+        ''',
+        [table],
+    )
+    row = cursor.fetchone()
+    return None if row is None else row[0]
+
+
+def _create_partition(cursor, table, name, month):
+    start = f'{month} 00:00:00+00'
+    end = f'{add_months(month, 1)} 00:00:00+00'
+    default = default_partition(cursor, table)
+    moved = False
+    if default is not None:
+        cursor.execute(
+            f'''SELECT EXISTS (
+                SELECT 1 FROM {default} WHERE created_at >= %s AND created_at < %s
+            )''',
+            [start, end],
+        )
+        moved = cursor.fetchone()[0]
+    # Postgres refuses to add a partition for rows the DEFAULT partition
+    # holds, e.g. after a missed monthly run, so those rows are moved over
+    # while it is detached
+    if moved:
+        cursor.execute(f'ALTER TABLE {table} DETACH PARTITION {default}')
+    # Plain string literals: Postgres 11 only accepts literal bounds
+    cursor.execute(
+        f'''CREATE TABLE {name} PARTITION OF {table}
+        FOR VALUES FROM (%s) TO (%s)''',
+        [start, end],
+    )
+    if moved:
+        cursor.execute(
+            f'''WITH moved AS (
+                DELETE FROM {default}
+                WHERE created_at >= %s AND created_at < %s
+                RETURNING *
+            )
+            INSERT INTO {name} SELECT * FROM moved''',
+            [start, end],
+        )
+        cursor.execute(f'ALTER TABLE {table} ATTACH PARTITION {default} DEFAULT')
+
+
+def create_partitions(cursor, table, first_month, last_month):
+    '''Create monthly partitions from first_month to last_month inclusive,
+    returning the names of those that did not exist yet. Run it in a
+    transaction: rows of those months in the DEFAULT partition are moved to
+    the new partitions.'''
+    created = []
+    month = month_start(first_month)
+    while month <= last_month:
+        name = partition_name(table, month)
+        cursor.execute('SELECT to_regclass(%s)', [name])
+        if cursor.fetchone()[0] is None:
+            _create_partition(cursor, table, name, month)
+            created.append(name)
+        month = add_months(month, 1)
+    return created
+
+
+def create_future_partitions(cursor, months_ahead, today=None):
+    '''Ensure partitions exist for the current month and months_ahead more'''
+    this_month = month_start(today or date.today())
+    created = []
+    for table in PARTITIONED_TABLES:
+        if is_partitioned(cursor, table):
+            created += create_partitions(
+                cursor, table, this_month, add_months(this_month, months_ahead)
+            )
+    return created
+
+
+def _index_definitions(cursor, table):
+    cursor.execute(
+        '''SELECT pg_get_indexdef(index.indexrelid)
+        FROM pg_index index
+        WHERE index.indrelid = %s::regclass AND NOT index.indisprimary''',
+        [table],
+    )
+    return [row[0] for row in cursor.fetchall()]
+
+
+def _foreign_key_definitions(cursor, table):
+    cursor.execute(
+        '''SELECT conname, pg_get_constraintdef(oid)
+        FROM pg_constraint
+        WHERE conrelid = %s::regclass AND contype = 'f' ''',
+        [table],
+    )
+    return cursor.fetchall()
+
+
+def partition_table(cursor, table, months_ahead):
+    '''Replace table by a partitioned copy holding the same rows'''
+    old_table = f'{table}_unpartitioned'
+    indexes = _index_definitions(cursor, table)
+    foreign_keys = _foreign_key_definitions(cursor, table)
+    cursor.execute('SELECT pg_get_serial_sequence(%s, %s)', [table, 'id'])
+    sequence = cursor.fetchone()[0]
+
+    cursor.execute(
+        '''SELECT conname FROM pg_constraint
+        WHERE conrelid = %s::regclass AND contype = 'p' ''',
+        [table],
+    )
+    primary_key = cursor.fetchone()[0]
+
+    cursor.execute(f'ALTER TABLE {table} RENAME TO {old_table}')
+    cursor.execute(
+        f'ALTER TABLE {old_table} RENAME CONSTRAINT {primary_key} TO {old_table}_pkey'
+    )
+    cursor.execute(
+        f'''CREATE TABLE {table} (
+            LIKE {old_table} INCLUDING DEFAULTS INCLUDING CONSTRAINTS
+        ) PARTITION BY RANGE (created_at)'''
+    )
+    cursor.execute(
+        f'ALTER TABLE {table} ADD CONSTRAINT {primary_key} PRIMARY KEY (id, created_at)'
+    )
+    cursor.execute(f'ALTER SEQUENCE {sequence} OWNED BY {table}.id')
+
+    cursor.execute(f'SELECT MIN(created_at) FROM {old_table}')
+    first = cursor.fetchone()[0]
+    this_month = month_start(date.today())
+    first_month = month_start(first.date()) if first else this_month
+    create_partitions(cursor, table, first_month, add_months(this_month, months_ahead))
+    cursor.execute(f'CREATE TABLE {table}_default PARTITION OF {table} DEFAULT')
+
+    cursor.execute(f'INSERT INTO {table} SELECT * FROM {old_table}')
+    cursor.execute(f'DROP TABLE {old_table}')
+    for definition in indexes:
+        cursor.execute(definition)
+    for name, definition in foreign_keys:
+        cursor.execute(f'ALTER TABLE {table} ADD CONSTRAINT {name} {definition}')
+
+
+def partition_audit_log(cursor, months_ahead):
+    '''Convert the log and logchange tables, skipping any already converted'''
+    converted = []
+    for table in PARTITIONED_TABLES:
+        if not is_partitioned(cursor, table):
+            partition_table(cursor, table, months_ahead)
+            converted.append(table)
+    return converted
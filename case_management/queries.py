@@ -1,20 +1,133 @@
+"""Report queries, as SQL with named parameters and their values.
+
+The SQL text of each report is constant, with dates and the case office
+passed as parameters, so that execute() can prepare it once per database
+connection and reuse the statement and its plan for every request.
+"""
+import hashlib
+import re
+import weakref
+from datetime import date, timedelta
+from functools import lru_cache
+
+PARAMETER = re.compile(r'%\((\w+)\)s')
+
+# Statements prepared on each (psycopg2) connection, forgotten with it
+_prepared = weakref.WeakKeyDictionary()
+
+
+@lru_cache(maxsize=None)
+def _statement(sql):
+    """Name and $n parameter SQL of a query, with its parameter names in order"""
+    names = []
+
+    def positional(match):
+        if match.group(1) not in names:
+            names.append(match.group(1))
+        return f'${names.index(match.group(1)) + 1}'
+
+    name = f'report_{hashlib.sha1(sql.encode()).hexdigest()[:16]}'
+    return name, PARAMETER.sub(positional, sql.rstrip().rstrip(';')), names
+
+
+def _execute_prepared(cursor, sql, params, command):
+    name, positional_sql, names = _statement(sql)
+    prepared = _prepared.setdefault(cursor.db.connection, set())
+    if name not in prepared:
+        cursor.execute(f'PREPARE {name} AS {positional_sql}')
+        prepared.add(name)
+    placeholders = ', '.join(['%s'] * len(names))
+    cursor.execute(
+        f'{command}EXECUTE {name} ({placeholders})', [params[n] for n in names]
+    )
+
+
+def execute(cursor, sql, params):
+    """Execute a report query as a prepared statement of the cursor's connection"""
+    _execute_prepared(cursor, sql, params, '')
+
+
+def explain(cursor, sql, params):
+    """Run a report query like execute() and return its plan with actual
+    timings and buffer counts, in EXPLAIN's JSON format"""
+    _execute_prepared(cursor, sql, params, 'EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) ')
+    return cursor.fetchone()[0][0]
+
+
+def _day_after(day):
+    return date.fromisoformat(day) + timedelta(days=1)
+
+
+def _month_after(month):
+    month = date.fromisoformat(month)
+    return (month.replace(day=28) + timedelta(days=4)).replace(day=1)
+
+
+def _month_end(month):
+    return (_month_after(month) - timedelta(days=1)).isoformat()
+
+
+def _params(case_office, **params):
+    return {
+        **params,
+        'case_office': None if case_office is None else int(case_office),
+    }
+
+
+# Recomputes LegalCase.closed_at and last_activity_at. LegalCase hooks
+# otherwise maintain closed_at, and rollups.record_logs moves last_activity_at
+# on with each new log of a case. Cases already up to date are left alone.
+REBUILD_LEGALCASE_ACTIVITY = """
+UPDATE case_management_legalcase legalcase
+SET
+    closed_at = closes.at,
+    last_activity_at = GREATEST(legalcase.updated_at, activity.at)
+FROM
+    case_management_legalcase current
+LEFT JOIN (
+    SELECT legal_case_id, MAX(at) at
+    FROM case_management_legalcasestatetransition
+    WHERE to_state = 'Closed'
+    GROUP BY legal_case_id
+) closes ON
+    closes.legal_case_id = current.id
+LEFT JOIN (
+    SELECT parent_id, MAX(created_at) at
+    FROM case_management_log
+    WHERE parent_type = 'LegalCase'
+    GROUP BY parent_id
+) activity ON
+    activity.parent_id = current.id
+WHERE
+    current.id = legalcase.id
+    AND (legalcase.closed_at, legalcase.last_activity_at) IS DISTINCT FROM (
+        closes.at, GREATEST(legalcase.updated_at, activity.at)
+    )"""
+
+
+# When each case was created and (last) closed before the given date. Only
+# cases closed again since then need their state transitions.
 LEGALCASE_OPEN_CLOSE = """
 SELECT
     legalcase.id,
     legalcase.created_at::date,
-    MAX(CASE
-          WHEN logchange.field = 'state' AND logchange.value = 'Closed'
-          THEN log.created_at
-          ELSE NULL
-      END)::date closed_at
+    CASE
+        WHEN legalcase.closed_at IS NULL
+      THEN NULL
+        WHEN legalcase.closed_at < %(before)s::timestamptz
+      THEN legalcase.closed_at::date
+        ELSE (
+            SELECT MAX(transition.at)::date
+            FROM case_management_legalcasestatetransition transition
+            WHERE
+                transition.legal_case_id = legalcase.id
+                AND transition.to_state = 'Closed'
+                AND transition.at < %(before)s::timestamptz
+        )
+    END closed_at
 FROM
-    case_management_legalcase legalcase
-LEFT JOIN case_management_log log ON
-    legalcase.id = log.target_id
-LEFT JOIN case_management_logchange logchange ON
-    log.id = logchange.log_id
-GROUP BY
-    legalcase.id"""
+    case_management_legalcase legalcase"""
+
 
 LEGALCASE_OPEN_CLOSE_DAYS = """
 SELECT
@@ -42,17 +155,54 @@ WHERE
     legalcase.id = case_office.legalcase_id"""
 
 
-def case_office_filter(case_office=None):
-    phrase = "" if case_office is None else f"WHERE caseoffice.id = '{case_office}'"
-    return phrase
+# The same for the cases closed since the start date. A case's close before
+# the end date can only fall in the report's dates if its last close does
+# too, so the closed_at index finds them without reading every case.
+CLOSED_LEGALCASE_DETAIL_BY_CASEOFFICE = f"""
+SELECT
+    legalcase.id,
+    legalcase.closed_at,
+    legalcase.closed_at - legalcase.created_at days_created_to_closed,
+    case_office.caseoffice_id
+FROM
+    ({LEGALCASE_OPEN_CLOSE}
+    WHERE
+        legalcase.closed_at >= %(start_date)s::date
+    ) legalcase,
+    case_management_legalcase_case_offices case_office
+WHERE
+    legalcase.id = case_office.legalcase_id"""
+
 
-def range_summary(start_date, end_date, case_office=None):
-    return f"""
+CASE_OFFICE_FILTER = """
+WHERE
+    %(case_office)s::integer IS NULL
+    OR caseoffice.id = %(case_office)s::integer"""
+
+
+# Mean, median and 90th percentile of the days closed cases were open, counting
+# the days they were opened and closed. Postgres computes the identical
+# percentile aggregates once, with one sort of each group's days.
+DAYS_PER_CASE = """
+  		ROUND(AVG(days_created_to_closed + 1), 1) mean,
+  		ROUND((
+  			percentile_cont(ARRAY[0.5, 0.9]) WITHIN GROUP (
+  				ORDER BY days_created_to_closed + 1
+  			)
+  		)[1]::numeric, 1) median,
+  		ROUND((
+  			percentile_cont(ARRAY[0.5, 0.9]) WITHIN GROUP (
+  				ORDER BY days_created_to_closed + 1
+  			)
+  		)[2]::numeric, 1) p90"""
+
+
+RANGE_SUMMARY_METRICS = f"""
 WITH
   date_range AS (
   	SELECT
-  		'{start_date}'::date AS start_date,
-  		'{end_date}'::date AS end_date
+  		%(start_date)s::date AS start_date,
+  		%(end_date)s::date AS end_date
   ),
   legalcase_open_close AS (
   	{LEGALCASE_OPEN_CLOSE}
@@ -63,24 +213,29 @@ WITH
   legalcase_detail_by_caseoffice AS (
   	{LEGALCASE_DETAIL_BY_CASEOFFICE}
   ),
+  closed_legalcase_detail_by_caseoffice AS (
+  	{CLOSED_LEGALCASE_DETAIL_BY_CASEOFFICE}
+  ),
   metric_cases_opened AS (
   	SELECT
-  		legalcase.caseoffice_id,
-  		COUNT(id) n
+  		rollup.case_office_id caseoffice_id,
+  		SUM(rollup.cases_opened) n
   	FROM
-  		legalcase_detail_by_caseoffice legalcase,
+  		case_management_caseofficeday rollup,
   		date_range
   	WHERE
-  		legalcase.created_at BETWEEN date_range.start_date AND date_range.end_date
+  		rollup.day BETWEEN date_range.start_date AND date_range.end_date
   	GROUP BY
-  		legalcase.caseoffice_id
+  		rollup.case_office_id
+  	HAVING
+  		SUM(rollup.cases_opened) > 0
   ),
   metric_cases_closed AS (
   	SELECT
   		legalcase.caseoffice_id,
   		COUNT(id) n
   	FROM
-  		legalcase_detail_by_caseoffice legalcase,
+  		closed_legalcase_detail_by_caseoffice legalcase,
   		date_range
   	WHERE
   		legalcase.closed_at BETWEEN date_range.start_date AND date_range.end_date
@@ -108,10 +263,10 @@ WITH
   		users.case_office_id,
   		users.name
   	FROM
-  		case_management_log AS log,
+  		case_management_useractivityday AS activity,
   		case_management_user AS users
   	WHERE
-  		log.user_id = users.id
+  		activity.user_id = users.id
   	GROUP BY
   		users.case_office_id,
   		users.name
@@ -135,20 +290,21 @@ WITH
   	WHERE
   		open_cases.caseoffice_id = active_users.case_office_id
   ),
-  metric_avg_days_per_case AS (
+  metric_days_per_case AS (
   	SELECT
-  		legalcase.caseoffice_id,
-  		legalcase.days_created_to_closed n
+  		legalcase.caseoffice_id,{DAYS_PER_CASE}
   	FROM
-  		legalcase_detail_by_caseoffice legalcase,
+  		closed_legalcase_detail_by_caseoffice legalcase,
   		date_range
   	WHERE
   		legalcase.closed_at BETWEEN date_range.start_date AND date_range.end_date
   	GROUP BY
-  		legalcase.caseoffice_id,
-  		legalcase.days_created_to_closed
-    LIMIT 1
-  )
+  		legalcase.caseoffice_id
+  )"""
+
+
+RANGE_SUMMARY = f"""
+{RANGE_SUMMARY_METRICS}
 SELECT
 	json_object_agg(
     name, json_build_object(
@@ -168,9 +324,19 @@ SELECT
               WHERE avg_cases.caseoffice_id = caseoffice.id
       ),
       'Average days per case', (
-              SELECT n + 1
-              FROM metric_avg_days_per_case avg_days
-              WHERE avg_days.caseoffice_id = caseoffice.id
+              SELECT mean
+              FROM metric_days_per_case days
+              WHERE days.caseoffice_id = caseoffice.id
+      ),
+      'Median days per case', (
+              SELECT median
+              FROM metric_days_per_case days
+              WHERE days.caseoffice_id = caseoffice.id
+      ),
+      '90th percentile days per case', (
+              SELECT p90
+              FROM metric_days_per_case days
+              WHERE days.caseoffice_id = caseoffice.id
       ),
       'Cases opened', (
               SELECT n
@@ -186,165 +352,176 @@ SELECT
 )
 FROM
 	case_management_caseoffice AS caseoffice
-{case_office_filter(case_office)};"""
+{CASE_OFFICE_FILTER};"""
 
-def daily_summary(start_month, end_month, case_office=None):
-    return f"""
-WITH
-  months AS (
-  	SELECT
-  		DATE_TRUNC('month', months_series)::date AS MONTH,
-  		(
-  			DATE_TRUNC('month', months_series) + INTERVAL '1 month' - INTERVAL '1 day'
-  		)::date month_end
-  	FROM
-  		generate_series(
-      '{start_month}'::timestamp,
-      '{end_month}'::timestamp,
-      '1 month'::INTERVAL
-  ) months_series
-  ),
-  days AS (
-  	SELECT
-  		DATE_TRUNC('day', days_series)::date AS DAY
-  	FROM
-  		generate_series(
-      '{start_month}'::timestamp,
-      '{end_month}'::timestamp + '1 month - 1 day',
-      '1 day'::INTERVAL
-  ) days_series
-  ),
-  metric_cases_created AS (
+
+def range_summary(start_date, end_date, case_office=None):
+    return RANGE_SUMMARY, _params(
+        case_office,
+        start_date=start_date,
+        end_date=end_date,
+        before=_day_after(end_date).isoformat(),
+    )
+
+
+RANGE_SUMMARY_ROWS = f"""
+{RANGE_SUMMARY_METRICS}
+SELECT
+	caseoffice.name office,
+	metric.name metric,
+	to_char(date_range.start_date, 'YYYY-MM-DD') || '/' ||
+		to_char(date_range.end_date, 'YYYY-MM-DD') period,
+	to_json(metric.value) value
+FROM
+	case_management_caseoffice AS caseoffice
+CROSS JOIN date_range
+CROSS JOIN LATERAL (
+	VALUES
+		(1, 'Active case officers', (
+			SELECT n
+			FROM metric_active_users active_users
+			WHERE active_users.case_office_id = caseoffice.id
+		)),
+		(2, 'Total cases', (
+			SELECT n
+			FROM metric_open_cases open_cases
+			WHERE open_cases.caseoffice_id = caseoffice.id
+		)),
+		(3, 'Average cases per officer', (
+			SELECT n
+			FROM metric_avg_open_cases_per_active_user avg_cases
+			WHERE avg_cases.caseoffice_id = caseoffice.id
+		)),
+		(4, 'Average days per case', (
+			SELECT mean
+			FROM metric_days_per_case days
+			WHERE days.caseoffice_id = caseoffice.id
+		)),
+		(5, 'Median days per case', (
+			SELECT median
+			FROM metric_days_per_case days
+			WHERE days.caseoffice_id = caseoffice.id
+		)),
+		(6, '90th percentile days per case', (
+			SELECT p90
+			FROM metric_days_per_case days
+			WHERE days.caseoffice_id = caseoffice.id
+		)),
+		(7, 'Cases opened', (
+			SELECT n
+			FROM metric_cases_opened AS opened
+			WHERE opened.caseoffice_id = caseoffice.id
+		)),
+		(8, 'Cases closed', (
+			SELECT n
+			FROM metric_cases_closed AS closed
+			WHERE closed.caseoffice_id = caseoffice.id
+		))
+) metric(position, name, value)
+{CASE_OFFICE_FILTER}
+ORDER BY
+	caseoffice.id,
+	metric.position;"""
+
+
+def range_summary_rows(start_date, end_date, case_office=None):
+    return RANGE_SUMMARY_ROWS, range_summary(start_date, end_date, case_office)[1]
+
+
+# Report periods, by the date_trunc() field their dates are bucketed by: the
+# interval between periods and the to_char() format of their labels
+GRANULARITIES = {
+    'day': ('1 day', 'YYYY-MM-DD'),
+    'week': ('1 week', 'IYYY-"W"IW'),
+    'month': ('1 month', 'YYYY-MM'),
+    'quarter': ('3 months', 'YYYY-"Q"Q'),
+    'year': ('1 year', 'YYYY'),
+}
+
+
+def _period_start(day, granularity):
+    if granularity == 'week':
+        return day - timedelta(days=day.weekday())
+    if granularity == 'month':
+        return day.replace(day=1)
+    if granularity == 'quarter':
+        return day.replace(month=(day.month - 1) // 3 * 3 + 1, day=1)
+    if granularity == 'year':
+        return day.replace(month=1, day=1)
+    return day
+
+
+def _period_after(day, granularity):
+    start = _period_start(day, granularity)
+    if granularity == 'week':
+        return start + timedelta(days=7)
+    if granularity == 'day':
+        return start + timedelta(days=1)
+    months = {'month': 1, 'quarter': 3, 'year': 12}[granularity]
+    index = start.year * 12 + start.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+# Counts of case offices by period. Days without any cases opened, closed or
+# logged have no value. Closes rather than cases: a case closed twice in a
+# period counts twice.
+PERIOD_ROLLUP = """
+  metric_rollup AS (
   	SELECT
-  		case_office.caseoffice_id,
-  		DATE_TRUNC('day', legalcase.created_at)::date AS DAY,
-  		COUNT(legalcase.id) n
+  		case_office_id caseoffice_id,
+  		date_trunc(%(granularity)s, day)::date period,
+  		NULLIF(SUM(cases_opened), 0) cases_opened,
+  		NULLIF(SUM(cases_closed), 0) case_closes,
+  		NULLIF(SUM(case_logs), 0) case_logs
   	FROM
-  		case_management_legalcase legalcase,
-  		case_management_legalcase_case_offices case_office
+  		case_management_caseofficeday
   	WHERE
-  		legalcase.id = case_office.legalcase_id
+  		day >= %(start_date)s::date
+  		AND day < %(before)s::date
+  		AND (
+  			%(case_office)s::integer IS NULL
+  				OR case_office_id = %(case_office)s::integer
+  		)
   	GROUP BY
-  		case_office.caseoffice_id,
-  		DAY
-  ),
-  metric_cases_closed AS (
+  		1, 2
+  )"""
+
+# The same by day, the rollup's own rows
+PERIOD_ROLLUP_DAYS = """
+  metric_rollup AS (
   	SELECT
-  		case_office.caseoffice_id,
-  		DATE_TRUNC('day', log.created_at)::date AS DAY,
-  		COUNT(logchange.id) n
+  		case_office_id caseoffice_id,
+  		day period,
+  		NULLIF(cases_opened, 0) cases_opened,
+  		NULLIF(cases_closed, 0) case_closes,
+  		NULLIF(case_logs, 0) case_logs
   	FROM
-  		case_management_logchange logchange
-  	INNER JOIN case_management_log log ON
-  		log.id = logchange.log_id
-  	INNER JOIN case_management_legalcase legalcase ON
-  		legalcase.id = log.target_id
-  	INNER JOIN case_management_legalcase_case_offices case_office ON
-  		case_office.legalcase_id = legalcase.id
+  		case_management_caseofficeday
   	WHERE
-  		logchange.field = 'state'
-  		AND logchange.value = 'Closed'
-  	GROUP BY
-  		case_office.caseoffice_id,
-  		DAY
-  ),
-  metric_updates AS (
-  	SELECT
-  		case_office.caseoffice_id,
-  		DATE_TRUNC('day', log.created_at)::date AS DAY,
-  		COUNT(log.id) n
-  	FROM
-  		case_management_log log
-  	INNER JOIN case_management_legalcase legalcase ON
-  		legalcase.id = log.target_id
-  	INNER JOIN case_management_legalcase_case_offices case_office ON
-  		case_office.legalcase_id = legalcase.id
-  	GROUP BY
-  		case_office.caseoffice_id,
-  		DAY
-  )
-SELECT
-	json_object_agg(
-    name, json_build_object(
-      'Cases opened', (
-        SELECT json_object_agg(
-            to_char(months.month, 'YYYY-MM'), (
-                SELECT json_agg(
-                    json_build_object(
-                        'date', days.day,
-                        'value', (
-                            SELECT n
-                            FROM metric_cases_created cases_created
-                            WHERE cases_created.caseoffice_id = caseoffice.id AND cases_created.day = days.day
-                        )
-                    )
-                )
-                FROM days
-                WHERE days.day BETWEEN months.month AND months.month_end
-            )
-        )
-        FROM months
-      ),
-      'Cases closed', (
-        SELECT json_object_agg(
-            to_char(months.month, 'YYYY-MM'), (
-                SELECT json_agg(
-                    json_build_object(
-                        'date', days.day,
-                        'value', (
-                            SELECT n
-                            FROM metric_cases_closed cases_closed
-                            WHERE cases_closed.caseoffice_id = caseoffice.id AND cases_closed.day = days.day
-                        )
-                    )
-                )
-                FROM days
-                WHERE days.day BETWEEN months.month AND months.month_end
-            )
-        )
-        FROM months
-      ),
-      'Cases with activity', (
-        SELECT json_object_agg(
-            to_char(months.month, 'YYYY-MM'), (
-                SELECT json_agg(
-                    json_build_object(
-                        'date', days.day,
-                        'value', (
-                            SELECT n
-                            FROM metric_updates updates
-                            WHERE updates.caseoffice_id = caseoffice.id AND updates.day = days.day
-                        )
-                    )
-                )
-                FROM days
-                WHERE days.day BETWEEN months.month AND months.month_end
-            )
-        )
-        FROM months
-      )
-    )
-)
-FROM
-	case_management_caseoffice AS caseoffice
-{case_office_filter(case_office)};"""
+  		day >= %(start_date)s::date
+  		AND day < %(before)s::date
+  		AND (
+  			%(case_office)s::integer IS NULL
+  				OR case_office_id = %(case_office)s::integer
+  		)
+  )"""
 
 
-def monthly_summary(start_month, end_month, case_office=None):
-    return f"""
-WITH
-  months AS (
+# The values of each metric by case office and period, with rows only where
+# there is a value. Bucketing facts by date_trunc() reads each of them once,
+# whatever the number of periods. The case CTEs are only evaluated for the
+# metrics that read them.
+PERIOD_METRICS = f"""
+  periods AS (
   	SELECT
-  		date_trunc('month', months_series)::date AS MONTH,
-  		(
-  			date_trunc('month', months_series) + INTERVAL '1 month' - INTERVAL '1 day'
-  		)::date month_end
+  		period_series::date period,
+  		to_char(period_series, %(period_format)s) label
   	FROM
   		generate_series(
-      '{start_month}'::timestamp,
-      '{end_month}'::timestamp,
-      '1 month'::INTERVAL
-  ) months_series
+      %(start_date)s::date::timestamp,
+      %(end_date)s::date::timestamp,
+      %(step)s::interval
+  ) period_series
   ),
   legalcase_open_close AS (
   	{LEGALCASE_OPEN_CLOSE}
@@ -355,194 +532,322 @@ WITH
   legalcase_detail_by_caseoffice AS (
   	{LEGALCASE_DETAIL_BY_CASEOFFICE}
   ),
-  metric_cases_opened AS (
-  	SELECT
-  		legalcase.caseoffice_id,
-  		months.month,
-  		COUNT(id) n
-  	FROM
-  		legalcase_detail_by_caseoffice legalcase,
-  		months
-  	WHERE
-  		legalcase.created_at BETWEEN months.month AND months.month_end
-  	GROUP BY
-  		legalcase.caseoffice_id,
-  		months.month
+  closed_legalcase_detail_by_caseoffice AS (
+  	{CLOSED_LEGALCASE_DETAIL_BY_CASEOFFICE}
   ),
+{{rollup}},
   metric_cases_closed AS (
   	SELECT
-  		legalcase.caseoffice_id,
-  		months.month,
+  		caseoffice_id,
+  		date_trunc(%(granularity)s, closed_at)::date period,
   		COUNT(id) n
   	FROM
-  		legalcase_detail_by_caseoffice legalcase,
-  		months
+  		closed_legalcase_detail_by_caseoffice
   	WHERE
-  		legalcase.closed_at BETWEEN months.month AND months.month_end
+  		closed_at >= %(start_date)s::date
   	GROUP BY
-  		legalcase.caseoffice_id,
-  		months.month
+  		1, 2
   ),
-  metric_open_cases AS (
+  -- Cases open at the end of each period, i.e. created by its last day and
+  -- not closed before it: the running total of cases created less cases
+  -- closed the day before, with changes before the first period counted in it
+  open_case_changes AS (
   	SELECT
-  		legalcase.caseoffice_id,
-  		months.month,
-  		COUNT(id) n
-  	FROM
-  		legalcase_detail_by_caseoffice legalcase,
-  		months
+  		caseoffice_id,
+  		GREATEST(date_trunc(%(granularity)s, day)::date, %(start_date)s::date) period,
+  		SUM(change) n
+  	FROM (
+  		SELECT caseoffice_id, created_at AS day, 1 change
+  		FROM legalcase_detail_by_caseoffice
+  		UNION ALL
+  		SELECT caseoffice_id, closed_at + 1, -1
+  		FROM legalcase_detail_by_caseoffice
+  		WHERE closed_at IS NOT NULL
+  	) changes
   	WHERE
-  		legalcase.created_at <= months.month_end
-  		AND (
-  			legalcase.closed_at IS NULL
-  				OR legalcase.closed_at >= months.month_end
-  		)
+  		day < %(before)s::date
   	GROUP BY
-  		legalcase.caseoffice_id,
-  		months.month
+  		1, 2
   ),
-  active_users_by_caseoffice AS (
+  metric_open_cases AS (
   	SELECT
-  		users.case_office_id,
-  		users.name,
-  		DATE_TRUNC('month', log.created_at)::date AS MONTH
+  		caseoffice.id caseoffice_id,
+  		periods.period,
+  		NULLIF(
+  			SUM(COALESCE(changes.n, 0)) OVER (
+  				PARTITION BY caseoffice.id ORDER BY periods.period
+  			)::bigint,
+  			0
+  		) n
   	FROM
-  		case_management_log AS log,
-  		case_management_user AS users
-  	WHERE
-  		log.user_id = users.id
-  	GROUP BY
-  		users.case_office_id,
-  		users.name,
-  		MONTH
+  		case_management_caseoffice caseoffice
+  	CROSS JOIN periods
+  	LEFT JOIN open_case_changes changes ON
+  		changes.caseoffice_id = caseoffice.id
+  		AND changes.period = periods.period
   ),
   metric_active_users AS (
   	SELECT
-  		case_office_id,
-  		MONTH,
-  		COUNT(name) AS n
+  		users.case_office_id caseoffice_id,
+  		date_trunc(%(granularity)s, activity.day)::date period,
+  		COUNT(DISTINCT users.name) n
   	FROM
-  		active_users_by_caseoffice
+  		case_management_useractivityday AS activity,
+  		case_management_user AS users
+  	WHERE
+  		activity.user_id = users.id
+  		AND activity.day >= %(start_date)s::date
+  		AND activity.day < %(before)s::date
   	GROUP BY
-  		case_office_id,
-  		MONTH
+  		1, 2
   ),
   metric_avg_open_cases_per_active_user AS (
   	SELECT
   		open_cases.caseoffice_id,
-  		open_cases.month,
+  		open_cases.period,
   		open_cases.n / active_users.n n
   	FROM
   		metric_open_cases open_cases,
   		metric_active_users active_users
   	WHERE
-  		open_cases.caseoffice_id = active_users.case_office_id
-  		AND open_cases.month = active_users.month
+  		open_cases.caseoffice_id = active_users.caseoffice_id
+  		AND open_cases.period = active_users.period
   ),
-  metric_avg_days_per_case AS (
+  metric_days_per_case AS (
   	SELECT
-  		legalcase.caseoffice_id,
-  		months.month,
-  		legalcase.days_created_to_closed n
+  		caseoffice_id,
+  		date_trunc(%(granularity)s, closed_at)::date period,{DAYS_PER_CASE}
   	FROM
-  		legalcase_detail_by_caseoffice legalcase,
-  		months
+  		closed_legalcase_detail_by_caseoffice
   	WHERE
-  		legalcase.closed_at BETWEEN months.month AND months.month_end
+  		closed_at >= %(start_date)s::date
   	GROUP BY
-  		legalcase.caseoffice_id,
-  		months.month,
-  		legalcase.days_created_to_closed
+  		1, 2
+  )"""
+
+# The metrics of each metric set: their names and the PERIOD_METRICS CTE and
+# column of their values
+METRIC_SETS = {
+    'summary': (
+        ('Active case officers', 'metric_active_users', 'n'),
+        ('Total cases', 'metric_open_cases', 'n'),
+        ('Average cases per officer', 'metric_avg_open_cases_per_active_user', 'n'),
+        ('Average days per case', 'metric_days_per_case', 'mean'),
+        ('Median days per case', 'metric_days_per_case', 'median'),
+        ('90th percentile days per case', 'metric_days_per_case', 'p90'),
+        ('Cases opened', 'metric_rollup', 'cases_opened'),
+        ('Cases closed', 'metric_cases_closed', 'n'),
+    ),
+    'activity': (
+        ('Cases opened', 'metric_rollup', 'cases_opened'),
+        ('Cases closed', 'metric_rollup', 'case_closes'),
+        ('Cases with activity', 'metric_rollup', 'case_logs'),
+    ),
+}
+
+# Every metric of a set, as value_<n> columns, for every case office and
+# period, null without a value
+PERIOD_POINTS = """
+  points AS (
+  	SELECT
+  		caseoffice.id caseoffice_id,
+  		periods.period,
+  		periods.label{group_columns},
+  		{values}
+  	FROM
+  		case_management_caseoffice caseoffice
+  	CROSS JOIN periods
+  	{joins}{case_office_filter}
+  )"""
+
+# Points grouped by coarser periods, e.g. the days of each month
+PERIOD_GROUP_COLUMNS = """,
+  		date_trunc(%(group_by)s, periods.period)::date group_start"""
+
+PERIOD_SUMMARY = """
+WITH{metrics},{points},
+  series AS (
+  	SELECT
+  		caseoffice_id,
+  		{series}
+  	FROM
+  		points
+  	GROUP BY
+  		caseoffice_id
   )
 SELECT
 	json_object_agg(
-    name, json_build_object(
-      'Active case officers', (
-          SELECT json_agg(
-              json_build_object(
-                  'date', to_char(months.month, 'YYYY-MM'),
-                  'value', (
-                      SELECT n
-                      FROM metric_active_users active_users
-                      WHERE active_users.case_office_id = caseoffice.id AND active_users.month = months.month
-                  )
-              )
-
-           )
-          FROM months
-      ),
-      'Total cases', (
-          SELECT json_agg(
-              json_build_object(
-                  'date', to_char(months.month, 'YYYY-MM'),
-                  'value', (
-                      SELECT n
-                      FROM metric_open_cases open_cases
-                      WHERE open_cases.caseoffice_id = caseoffice.id AND open_cases.month = months.month
-                  )
-              )
-
-           )
-          FROM months
-      ),
-      'Average cases per officer', (
-          SELECT json_agg(
-              json_build_object(
-                  'date', to_char(months.month, 'YYYY-MM'),
-                  'value', (
-                      SELECT n
-                      FROM metric_avg_open_cases_per_active_user avg_cases
-                      WHERE avg_cases.caseoffice_id = caseoffice.id AND avg_cases.month = months.month
-                  )
-              )
-
-           )
-          FROM months
-      ),
-      'Average days per case', (
-          SELECT json_agg(
-              json_build_object(
-                  'date', to_char(months.month, 'YYYY-MM'),
-                  'value', (
-                      SELECT n + 1
-                      FROM metric_avg_days_per_case avg_days
-                      WHERE avg_days.caseoffice_id = caseoffice.id AND avg_days.month = months.month
-                  )
-              )
-
-           )
-          FROM months
-      ),
-      'Cases opened', (
-          SELECT json_agg(
-              json_build_object(
-                  'date', to_char(months.month, 'YYYY-MM'),
-                  'value', (
-                      SELECT n
-                      FROM metric_cases_opened AS opened
-                      WHERE opened.caseoffice_id = caseoffice.id AND opened.month = months.month
-                  )
-              )
-
-           )
-          FROM months
-      ),
-      'Cases closed', (
-          SELECT json_agg(
-              json_build_object(
-                  'date', to_char(months.month, 'YYYY-MM'),
-                  'value', (
-                      SELECT n
-                      FROM metric_cases_closed AS closed
-                      WHERE closed.caseoffice_id = caseoffice.id AND closed.month = months.month
-                  )
-              )
-
-           )
-          FROM months
-      )
-    )
-)
+		caseoffice.name, json_build_object({object}) ORDER BY caseoffice.id
+	)
 FROM
-	case_management_caseoffice AS caseoffice
-{case_office_filter(case_office)};"""
+	series
+JOIN case_management_caseoffice caseoffice ON
+	caseoffice.id = series.caseoffice_id;"""
+
+PERIOD_SUMMARY_GROUPED = """
+WITH{metrics},{points},
+  group_series AS (
+  	SELECT
+  		caseoffice_id,
+  		group_start,
+  		{series}
+  	FROM
+  		points
+  	GROUP BY
+  		caseoffice_id,
+  		group_start
+  ),
+  series AS (
+  	SELECT
+  		caseoffice_id,
+  		{groups}
+  	FROM
+  		group_series
+  	GROUP BY
+  		caseoffice_id
+  )
+SELECT
+	json_object_agg(
+		caseoffice.name, json_build_object({object}) ORDER BY caseoffice.id
+	)
+FROM
+	series
+JOIN case_management_caseoffice caseoffice ON
+	caseoffice.id = series.caseoffice_id;"""
+
+# Values are JSON like in the other reports, rather than the numeric type
+# common to counts and averages
+PERIOD_SUMMARY_ROWS = """
+WITH{metrics},{points}
+SELECT
+	caseoffice.name office,
+	metric.name metric,
+	points.label period,
+	to_json(metric.value) value
+FROM
+	points
+JOIN case_management_caseoffice caseoffice ON
+	caseoffice.id = points.caseoffice_id
+CROSS JOIN LATERAL (
+	VALUES
+		{rows}
+) metric(position, name, value)
+ORDER BY
+	points.caseoffice_id,
+	metric.position,
+	points.period;"""
+
+
+@lru_cache(maxsize=None)
+def _period_summary_sql(metrics, template, granularity):
+    metric_set = list(enumerate(METRIC_SETS[metrics], 1))
+    # Each CTE is joined once, for all of its metrics
+    ctes = list(dict.fromkeys(cte for _, (_, cte, _) in metric_set))
+    points = PERIOD_POINTS.format(
+        group_columns=(
+            PERIOD_GROUP_COLUMNS if template is PERIOD_SUMMARY_GROUPED else ''
+        ),
+        values=',\n  \t\t'.join(
+            f'{cte}.{column} value_{n}' for n, (_, cte, column) in metric_set
+        ),
+        joins='\n  \t'.join(
+            f'LEFT JOIN {cte} ON\n  \t\t'
+            f'{cte}.caseoffice_id = caseoffice.id\n  \t\t'
+            f'AND {cte}.period = periods.period'
+            for cte in ctes
+        ),
+        case_office_filter=CASE_OFFICE_FILTER.replace('\n', '\n  \t'),
+    )
+    return template.format(
+        metrics=PERIOD_METRICS.format(
+            rollup=PERIOD_ROLLUP_DAYS if granularity == 'day' else PERIOD_ROLLUP
+        ),
+        points=points,
+        series=',\n  \t\t'.join(
+            f"json_agg(json_build_object('date', label, 'value', value_{n}) "
+            f'ORDER BY period) value_{n}'
+            for n, _ in metric_set
+        ),
+        groups=',\n  \t\t'.join(
+            f'json_object_agg(to_char(group_start, %(group_format)s), value_{n} '
+            f'ORDER BY group_start) value_{n}'
+            for n, _ in metric_set
+        ),
+        object=', '.join(
+            f"'{name}', series.value_{n}" for n, (name, _, _) in metric_set
+        ),
+        rows=',\n\t\t'.join(
+            f"({n}, '{name}', points.value_{n})" for n, (name, _, _) in metric_set
+        ),
+    )
+
+
+def _period_params(granularity, start_date, end_date, case_office):
+    if granularity not in GRANULARITIES:
+        raise ValueError(f'Unknown granularity {granularity}')
+    step, period_format = GRANULARITIES[granularity]
+    end = date.fromisoformat(end_date)
+    return _params(
+        case_office,
+        granularity=granularity,
+        step=step,
+        period_format=period_format,
+        start_date=_period_start(
+            date.fromisoformat(start_date), granularity
+        ).isoformat(),
+        end_date=_period_start(end, granularity).isoformat(),
+        before=_period_after(end, granularity).isoformat(),
+    )
+
+
+def period_summary(
+    start_date,
+    end_date,
+    case_office=None,
+    granularity='month',
+    metrics='summary',
+    group_by=None,
+):
+    """A metric set by case office and period of the granularity, from the
+    period of start_date to that of end_date. group_by nests the periods in
+    coarser ones, e.g. days in months."""
+    params = _period_params(granularity, start_date, end_date, case_office)
+    if group_by is None:
+        return _period_summary_sql(metrics, PERIOD_SUMMARY, granularity), params
+    return _period_summary_sql(metrics, PERIOD_SUMMARY_GROUPED, granularity), {
+        **params,
+        'group_by': group_by,
+        'group_format': GRANULARITIES[group_by][1],
+    }
+
+
+def period_summary_rows(
+    start_date, end_date, case_office=None, granularity='month', metrics='summary'
+):
+    params = _period_params(granularity, start_date, end_date, case_office)
+    return _period_summary_sql(metrics, PERIOD_SUMMARY_ROWS, granularity), params
+
+
+def daily_summary(start_month, end_month, case_office=None):
+    return period_summary(
+        start_month,
+        _month_end(end_month),
+        case_office,
+        'day',
+        'activity',
+        group_by='month',
+    )
+
+
+def daily_summary_rows(start_month, end_month, case_office=None):
+    return period_summary_rows(
+        start_month, _month_end(end_month), case_office, 'day', 'activity'
+    )
+
+
+def monthly_summary(start_month, end_month, case_office=None):
+    return period_summary(start_month, end_month, case_office)
+
+
+def monthly_summary_rows(start_month, end_month, case_office=None):
+    return period_summary_rows(start_month, end_month, case_office)
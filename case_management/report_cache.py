@@ -0,0 +1,88 @@
+'''Cache of report results, invalidated per case office.
+
+Every change to the data reports read about a case office bumps its
+CaseOfficeVersion in the same transaction: case_management.rollups does so
+with the counts it updates, and models for case office renames and changes
+to users. Results are cached under the report, its parameters and the
+versions of the case offices it covers, so a write shows in the next
+report of its case office while reports of other case offices stay cached.
+The versions are read from the database on every request, so entries are
+safe to share between processes.
+'''
+import hashlib
+import json
+
+from django.core.cache import cache
+from django.db import connection
+
+from case_management import queries
+
+CACHE_SECONDS = 24 * 60 * 60
+
+BUMP = '''
+INSERT INTO case_management_caseofficeversion AS version (case_office_id, version)
+SELECT id, 1
+FROM case_management_caseoffice
+WHERE %(case_offices)s::integer[] IS NULL OR id = ANY(%(case_offices)s)
+ORDER BY id
+ON CONFLICT (case_office_id) DO UPDATE SET version = version.version + 1'''
+
+# Final statement for SQL whose earlier statements return the case_office_id
+# of the rows they change, from the named common table expression
+BUMP_CHANGED = '''
+INSERT INTO case_management_caseofficeversion AS version (case_office_id, version)
+SELECT DISTINCT case_office_id, 1
+FROM {changed}
+WHERE case_office_id IS NOT NULL
+ORDER BY case_office_id
+ON CONFLICT (case_office_id) DO UPDATE SET version = version.version + 1'''
+
+VERSIONS = '''
+SELECT caseoffice.id, COALESCE(version.version, 0)
+FROM
+    case_management_caseoffice caseoffice
+LEFT JOIN case_management_caseofficeversion version ON
+    version.case_office_id = caseoffice.id
+WHERE %(case_office)s::integer IS NULL OR caseoffice.id = %(case_office)s::integer
+ORDER BY caseoffice.id'''
+
+_missing = object()
+
+
+def bump(case_office_ids=None):
+    '''Invalidate the cached reports of case offices, or of all if None'''
+    with connection.cursor() as cursor:
+        cursor.execute(
+            BUMP,
+            {
+                'case_offices': None
+                if case_office_ids is None
+                else list(case_office_ids)
+            },
+        )
+
+
+def key(cursor, sql, params):
+    '''The cache key of a report query from queries for the current versions
+    of its case offices'''
+    cursor.execute(VERSIONS, {'case_office': params['case_office']})
+    versions = cursor.fetchall()
+    return (
+        'report:'
+        + hashlib.sha1(
+            json.dumps([sql, params, versions], default=str).encode()
+        ).hexdigest()
+    )
+
+
+def report(sql, params):
+    '''The result of a report query from queries, cached while the data of
+    its case offices is unchanged'''
+    with connection.cursor() as cursor:
+        report_key = key(cursor, sql, params)
+        result = cache.get(report_key, _missing)
+        if result is _missing:
+            queries.execute(cursor, sql, params)
+            result = cursor.fetchone()[0]
+            cache.set(report_key, result, CACHE_SECONDS)
+    return result
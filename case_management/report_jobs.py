@@ -0,0 +1,132 @@
+'''Reports run in the background, for date ranges too wide to run in a request.
+
+Submitting a report creates a pending ReportJob, unless a job for the same
+report over the same data exists already: jobs are keyed like cached
+reports, by the report and the versions of its case offices, so identical
+later requests reuse a pending, running or finished job. Worker processes
+started by `manage.py run_report_jobs` poll the table, claiming one job at
+a time with SELECT ... FOR UPDATE SKIP LOCKED, so any number of them can
+share the queue. A job left running by a worker that died is claimed again
+after STALE_SECONDS.
+'''
+import logging
+import time
+from datetime import timedelta
+
+from django.db import close_old_connections, connection, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from case_management import queries, report_cache
+from case_management.enums import ReportJobStates
+from case_management.models import ReportJob
+
+logger = logging.getLogger(__name__)
+
+# The query of each report, with the names of its start and end parameters
+# and of the other parameters its query takes
+REPORTS = {
+    'range-summary': (queries.range_summary, 'startDate', 'endDate', ()),
+    'monthly-summary': (queries.monthly_summary, 'startMonth', 'endMonth', ()),
+    'daily-summary': (queries.daily_summary, 'startMonth', 'endMonth', ()),
+    'period-summary': (
+        queries.period_summary,
+        'startDate',
+        'endDate',
+        ('granularity', 'metrics'),
+    ),
+}
+POLL_SECONDS = 1
+STALE_SECONDS = 15 * 60
+KEEP_DAYS = 7
+PURGE_SECONDS = 60 * 60
+
+
+def query(report, parameters, build=None):
+    '''The SQL and parameters of a report, or of build for the same
+    parameters'''
+    report_build, start, end, options = REPORTS[report]
+    return (build or report_build)(
+        parameters[start],
+        parameters[end],
+        parameters['caseOffice'],
+        **{option: parameters[option] for option in options},
+    )
+
+
+def submit(report, parameters, user):
+    '''The job running a report, a new one unless the same report of the same
+    data was submitted before'''
+    with connection.cursor() as cursor:
+        key = report_cache.key(cursor, *query(report, parameters))
+    job = (
+        ReportJob.objects.filter(key=key)
+        .exclude(state=ReportJobStates.FAILED)
+        .order_by('-id')
+        .first()
+    )
+    if job is None:
+        job = ReportJob.objects.create(
+            report=report, parameters=parameters, key=key, created_by=user
+        )
+    return job
+
+
+def claim():
+    '''Mark the oldest pending job as running and return it, None if there is
+    none'''
+    stale = timezone.now() - timedelta(seconds=STALE_SECONDS)
+    with transaction.atomic():
+        job = (
+            ReportJob.objects.select_for_update(skip_locked=True)
+            .filter(
+                Q(state=ReportJobStates.PENDING)
+                | Q(state=ReportJobStates.RUNNING, started_at__lt=stale)
+            )
+            .order_by('id')
+            .first()
+        )
+        if job is not None:
+            job.state = ReportJobStates.RUNNING
+            job.started_at = timezone.now()
+            job.save(update_fields=['state', 'started_at'])
+    return job
+
+
+def run(job):
+    try:
+        result = report_cache.report(*query(job.report, job.parameters))
+    except Exception as error:
+        logger.exception('Report job %s failed', job.id)
+        job.state = ReportJobStates.FAILED
+        job.error = str(error)
+    else:
+        job.state = ReportJobStates.DONE
+        job.result = result
+    job.finished_at = timezone.now()
+    job.save(update_fields=['state', 'result', 'error', 'finished_at'])
+
+
+def purge():
+    '''Delete jobs finished more than KEEP_DAYS ago'''
+    ReportJob.objects.filter(
+        finished_at__lt=timezone.now() - timedelta(days=KEEP_DAYS)
+    ).delete()
+
+
+def work(once=False):
+    '''Run jobs as they are submitted, or until there are none left if once'''
+    purged = None
+    while True:
+        if purged is None or time.monotonic() - purged > PURGE_SECONDS:
+            purge()
+            purged = time.monotonic()
+        job = claim()
+        if job is not None:
+            run(job)
+        elif once:
+            return
+        else:
+            # Like between requests, drop a connection that failed or expired
+            close_old_connections()
+            time.sleep(POLL_SECONDS)
@@ -0,0 +1,247 @@
+'''Daily counts for reports, kept up to date as cases and logs are written.
+
+CaseOfficeDay counts, per case office and day, the cases opened, their
+transitions to Closed and their audit logs. A case counts towards each of
+its current case offices, so adding or removing an office moves all of the
+case's counts to or from it. UserActivityDay counts each user's logs per
+day, for the number of active users. New logs also move the
+last_activity_at of their cases, that of a case's updates, notes, meetings
+and files included.
+
+Days are dates in the database session's time zone, as in the report
+queries. `manage.py rebuild_report_tables` recomputes both tables from the
+cases, state transitions and logs. Every change also bumps the versions of
+the case offices whose reports it changes, see case_management.report_cache.
+'''
+from django.db import connection
+
+from case_management import report_cache
+
+# Rows are upserted in key order, so that concurrent writers lock them in
+# the same order
+RECORD_LOGS = f'''
+WITH
+  log AS (
+    SELECT *
+    FROM unnest(
+      %s::varchar[],
+      %s::integer[],
+      %s::varchar[],
+      %s::integer[],
+      %s::integer[],
+      %s::timestamptz[]
+    ) AS log(parent_type, parent_id, target_type, target_id, user_id, created_at)
+  ),
+  case_activity AS (
+    SELECT parent_id, MAX(created_at) at
+    FROM log
+    WHERE parent_type = 'LegalCase'
+    GROUP BY parent_id
+  ),
+  -- Cases are locked in id order too, before they are updated
+  locked_cases AS (
+    SELECT legalcase.id, case_activity.at
+    FROM
+      case_management_legalcase legalcase
+    INNER JOIN case_activity ON
+      case_activity.parent_id = legalcase.id
+    WHERE
+      legalcase.last_activity_at IS NULL
+      OR legalcase.last_activity_at < case_activity.at
+    ORDER BY legalcase.id
+    FOR UPDATE OF legalcase
+  ),
+  case_updates AS (
+    UPDATE case_management_legalcase legalcase
+    SET last_activity_at = locked_cases.at
+    FROM locked_cases
+    WHERE
+      legalcase.id = locked_cases.id
+      AND (
+        legalcase.last_activity_at IS NULL
+        OR legalcase.last_activity_at < locked_cases.at
+      )
+  ),
+  case_office_days AS (
+    INSERT INTO case_management_caseofficeday AS rollup (
+      case_office_id, day, cases_opened, cases_closed, case_logs
+    )
+    SELECT case_office.caseoffice_id, log.created_at::date, 0, 0, COUNT(*)
+    FROM
+      log
+    INNER JOIN case_management_legalcase_case_offices case_office ON
+      case_office.legalcase_id = log.target_id
+    WHERE
+      log.target_type = 'LegalCase'
+    GROUP BY
+      1, 2
+    ORDER BY
+      1, 2
+    ON CONFLICT (case_office_id, day) DO UPDATE SET
+      case_logs = rollup.case_logs + EXCLUDED.case_logs
+    RETURNING case_office_id
+  ),
+  user_days AS (
+    INSERT INTO case_management_useractivityday AS rollup (user_id, day, logs)
+    SELECT log.user_id, log.created_at::date, COUNT(*)
+    FROM log
+    WHERE log.user_id IS NOT NULL
+    GROUP BY 1, 2
+    ORDER BY 1, 2
+    ON CONFLICT (user_id, day) DO UPDATE SET logs = rollup.logs + EXCLUDED.logs
+    RETURNING user_id, xmax = 0 AS inserted
+  ),
+  -- Only a user's first log of a day can change who is active
+  changed AS (
+    SELECT case_office_id FROM case_office_days
+    UNION ALL
+    SELECT users.case_office_id
+    FROM
+      user_days
+    INNER JOIN case_management_user users ON
+      users.id = user_days.user_id
+    WHERE
+      user_days.inserted
+  )
+{report_cache.BUMP_CHANGED.format(changed='changed')}'''
+
+RECORD_CLOSE = f'''
+WITH
+  changed AS (
+    INSERT INTO case_management_caseofficeday AS rollup (
+      case_office_id, day, cases_opened, cases_closed, case_logs
+    )
+    SELECT caseoffice_id, %s::timestamptz::date, 0, 1, 0
+    FROM case_management_legalcase_case_offices
+    WHERE legalcase_id = %s
+    ORDER BY caseoffice_id
+    ON CONFLICT (case_office_id, day) DO UPDATE SET
+      cases_closed = rollup.cases_closed + 1
+    RETURNING case_office_id
+  )
+{report_cache.BUMP_CHANGED.format(changed='changed')}'''
+
+# The counts of cases in their case offices, either all or those of the
+# given cases and case offices (null for all)
+CASE_OFFICE_COUNTS = '''
+  case_office AS (
+    SELECT legalcase_id, caseoffice_id
+    FROM case_management_legalcase_case_offices
+    WHERE
+      (%(legal_cases)s::integer[] IS NULL OR legalcase_id = ANY(%(legal_cases)s))
+      AND (%(case_offices)s::integer[] IS NULL OR caseoffice_id = ANY(%(case_offices)s))
+  ),
+  counts AS (
+    SELECT case_office.caseoffice_id, legalcase.created_at::date AS day,
+      1 cases_opened, 0 cases_closed, 0 case_logs
+    FROM
+      case_office
+    INNER JOIN case_management_legalcase legalcase ON
+      legalcase.id = case_office.legalcase_id
+    UNION ALL
+    SELECT case_office.caseoffice_id, transition.at::date, 0, 1, 0
+    FROM
+      case_office
+    INNER JOIN case_management_legalcasestatetransition transition ON
+      transition.legal_case_id = case_office.legalcase_id
+      AND transition.to_state = 'Closed'
+    UNION ALL
+    SELECT case_office.caseoffice_id, log.created_at::date, 0, 0, 1
+    FROM
+      case_office
+    INNER JOIN case_management_log log ON
+      log.target_type = 'LegalCase'
+      AND log.target_id = case_office.legalcase_id
+  )'''
+
+CHANGE_CASE_OFFICES = f'''
+WITH
+{CASE_OFFICE_COUNTS},
+  changed AS (
+    INSERT INTO case_management_caseofficeday AS rollup (
+      case_office_id, day, cases_opened, cases_closed, case_logs
+    )
+    SELECT
+      caseoffice_id,
+      day,
+      %(sign)s * SUM(cases_opened),
+      %(sign)s * SUM(cases_closed),
+      %(sign)s * SUM(case_logs)
+    FROM counts
+    GROUP BY 1, 2
+    ORDER BY 1, 2
+    ON CONFLICT (case_office_id, day) DO UPDATE SET
+      cases_opened = rollup.cases_opened + EXCLUDED.cases_opened,
+      cases_closed = rollup.cases_closed + EXCLUDED.cases_closed,
+      case_logs = rollup.case_logs + EXCLUDED.case_logs
+    RETURNING case_office_id
+  )
+{report_cache.BUMP_CHANGED.format(changed='changed')}'''
+
+REBUILD = [
+    '''LOCK TABLE case_management_caseofficeday, case_management_useractivityday
+    IN EXCLUSIVE MODE''',
+    'DELETE FROM case_management_caseofficeday',
+    'DELETE FROM case_management_useractivityday',
+    f'''
+WITH
+{CASE_OFFICE_COUNTS}
+INSERT INTO case_management_caseofficeday (
+  case_office_id, day, cases_opened, cases_closed, case_logs
+)
+SELECT caseoffice_id, day, SUM(cases_opened), SUM(cases_closed), SUM(case_logs)
+FROM counts
+GROUP BY 1, 2''',
+    '''
+INSERT INTO case_management_useractivityday (user_id, day, logs)
+SELECT user_id, created_at::date, COUNT(*)
+FROM case_management_log
+WHERE user_id IS NOT NULL
+GROUP BY 1, 2''',
+]
+
+
+def record_logs(logs):
+    '''Count newly written logs'''
+    if logs:
+        with connection.cursor() as cursor:
+            cursor.execute(
+                RECORD_LOGS,
+                [
+                    [log.parent_type for log in logs],
+                    [log.parent_id for log in logs],
+                    [log.target_type for log in logs],
+                    [log.target_id for log in logs],
+                    [log.user_id for log in logs],
+                    [log.created_at for log in logs],
+                ],
+            )
+
+
+def record_close(legal_case_id, at):
+    with connection.cursor() as cursor:
+        cursor.execute(RECORD_CLOSE, [at, legal_case_id])
+
+
+def change_case_offices(legal_case_ids, case_office_ids, sign):
+    '''Add (sign 1) or remove (sign -1) the counts of cases to or from their
+    case offices. Either list of ids may be None for all. Call it while the
+    cases are in the case offices, i.e. after adding or before removing.'''
+    with connection.cursor() as cursor:
+        cursor.execute(
+            CHANGE_CASE_OFFICES,
+            {
+                'legal_cases': legal_case_ids,
+                'case_offices': case_office_ids,
+                'sign': sign,
+            },
+        )
+
+
+def rebuild():
+    '''Recompute the counts, returning the number of case office days'''
+    with connection.cursor() as cursor:
+        for sql in REBUILD:
+            cursor.execute(sql, {'legal_cases': None, 'case_offices': None})
+        cursor.execute('SELECT COUNT(*) FROM case_management_caseofficeday')
+        return cursor.fetchone()[0]
@@ -1,4 +1,6 @@
+from django.db import models
 from rest_framework import serializers
+from rest_framework.utils import model_meta
 from django_countries.serializers import CountryFieldMixin
 from case_management.models import (
     CaseOffice,
@@ -16,19 +18,53 @@ from case_management.models import (
 from case_management.enums import MaritalStatuses
 
 
+class AddRelationsOnCreateMixin:
+    '''Adds the many to many relations of a new instance rather than set()ting
+    them, which would first query its (still empty) relations'''
+
+    def create(self, validated_data):
+        relations = model_meta.get_field_info(self.Meta.model).relations
+        many_to_many = {
+            name: validated_data.pop(name)
+            for name, relation in relations.items()
+            if relation.to_many and name in validated_data
+        }
+        instance = super().create(validated_data)
+        for name, values in many_to_many.items():
+            if values:
+                getattr(instance, name).add(*values)
+        return instance
+
+
 class LogChangeSerializer(serializers.ModelSerializer):
     class Meta:
         model = LogChange
-        fields = '__all__'
+        # created_at only mirrors log.created_at for partitioning
+        exclude = ['created_at']
 
 
 class LogSerializer(serializers.ModelSerializer):
-    changes = LogChangeSerializer(many=True, read_only=True)
+    changes = serializers.SerializerMethodField()
     extra = serializers.ReadOnlyField()
 
+    def get_changes(self, log):
+        if log.change_set is None:
+            return LogChangeSerializer(log.changes.all(), many=True).data
+        # Same shape as LogChangeSerializer output
+        return [
+            {
+                'id': entry['id'],
+                'field': entry['field'],
+                'value': entry['value'],
+                'action': entry['action'],
+                'log': log.id,
+            }
+            for entry in log.change_set
+        ]
+
     class Meta:
         model = Log
-        fields = '__all__'
+        exclude = ['change_set']
 
 
 class ChildModelSerializer(serializers.ModelSerializer):
@@ -41,7 +77,7 @@ class CaseTypeSerializer(serializers.ModelSerializer):
         fields = '__all__'
 
 
-class LegalCaseSerializer(serializers.ModelSerializer):
+class LegalCaseSerializer(AddRelationsOnCreateMixin, serializers.ModelSerializer):
     meetings = serializers.PrimaryKeyRelatedField(many=True, read_only=True)
     case_number = serializers.CharField(required=False)
 
@@ -59,7 +95,16 @@ class LegalCaseSerializer(serializers.ModelSerializer):
         fields = '__all__'
 
 
-class ClientSerializer(CountryFieldMixin, serializers.ModelSerializer):
+class ClientListSerializer(serializers.ListSerializer):
+    def to_representation(self, data):
+        clients = list(data.all() if isinstance(data, models.Manager) else data)
+        Client.prefetch_updates(clients)
+        return super().to_representation(clients)
+
+
+class ClientSerializer(
+    CountryFieldMixin, AddRelationsOnCreateMixin, serializers.ModelSerializer
+):
     legal_cases = serializers.PrimaryKeyRelatedField(many=True, read_only=True)
     updates = LogSerializer(many=True, read_only=True)
     case_offices = serializers.PrimaryKeyRelatedField(many=True, read_only=True)
@@ -94,6 +139,7 @@ class ClientSerializer(CountryFieldMixin, serializers.ModelSerializer):
     class Meta:
         model = Client
         fields = '__all__'
+        list_serializer_class = ClientListSerializer
 
 
 class CaseOfficeSerializer(serializers.ModelSerializer):
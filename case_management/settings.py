@@ -149,6 +149,14 @@ DATABASES = {"default": env.db("DATABASE_URL")}
 DATABASES["default"]["ATOMIC_REQUESTS"] = True
 DATABASES["default"]["CONN_MAX_AGE"] = env.int("CONN_MAX_AGE", default=60)  # noqa F405
 
+# Report results, see case_management.report_cache
+CACHES = {"default": env.cache("CACHE_URL", default="locmemcache://")}
+
+
+# Audit log changes are stored as one LogChange row per field ('rows') or
+# as a single JSONB document on each Log ('json')
+AUDIT_LOG_STORAGE = env("AUDIT_LOG_STORAGE", default="rows")
+
 
 # Password validation
 # https://docs.djangoproject.com/en/2.2/ref/settings/#auth-password-validators
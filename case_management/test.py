@@ -1,7 +1,38 @@
-from django.test import Client, TestCase
+import csv
+import io
+import json
+import os
+import tempfile
+import threading
+import time
+from datetime import date, timedelta
+from unittest import mock
+
+from django.contrib.auth.models import Group
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import IntegrityError, connection, transaction
+from django.db.models import F, Sum
+from django.test import Client, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIClient
 
 import html5lib
 
+from case_management import (
+    activity,
+    audit,
+    history,
+    models,
+    partitions,
+    queries,
+    report_cache,
+    rollups,
+    serializers,
+    views,
+)
+
 
 class IndexTestCase(TestCase):
     def test_index(self):
@@ -14,6 +45,1409 @@ class IndexTestCase(TestCase):
         assertValidHTML(response.content)
 
 
+class AuditLogTestCase(TestCase):
+    def setUp(self):
+        self.user = models.User.objects.create_user(
+            email='audit@example.com', password=None
+        )
+
+    def test_create_logs_all_fields_on_commit(self):
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            with self.assertNumQueries(1):
+                client = models.Client.objects.create(
+                    name='Client', created_by=self.user, updated_by=self.user
+                )
+            self.assertFalse(models.Log.objects.exists())
+        self.assertEqual(len(callbacks), 1)
+        log = models.Log.objects.get(target_type='Client', target_id=client.id)
+        self.assertEqual(log.action, 'Create')
+        self.assertEqual(log.note, 'Client')
+        changes = dict(log.changes.values_list('field', 'value'))
+        self.assertEqual(changes['name'], 'Client')
+        self.assertEqual(changes['preferred_name'], 'Client')
+        self.assertNotIn('id', changes)
+
+    def test_note_uses_cached_related_objects(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            client = models.Client.objects.create(name='Client')
+            legal_case = models.LegalCase.objects.create(
+                case_number='D00/2201/0001', client=client
+            )
+            with self.assertNumQueries(1):
+                case_update = models.CaseUpdate.objects.create(
+                    legal_case=legal_case, created_by=self.user
+                )
+        log = models.Log.objects.get(target_type='CaseUpdate')
+        self.assertEqual(log.note, 'D00/2201/0001 case update')
+        self.assertEqual(log.parent_id, legal_case.id)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            case_update.delete()
+        log = models.Log.objects.get(target_type='CaseUpdate', action='Delete')
+        self.assertEqual(log.note, 'D00/2201/0001 case update')
+
+    def test_rolled_back_savepoint_writes_no_logs(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            client = models.Client.objects.create(name='Kept')
+            try:
+                with transaction.atomic():
+                    models.Client.objects.create(name='Discarded')
+                    client.users.add(self.user)
+                    raise IntegrityError
+            except IntegrityError:
+                pass
+            models.CaseOffice.objects.create(name='Office', description='')
+        self.assertEqual(
+            sorted(models.Log.objects.values_list('note', flat=True)),
+            ['Kept', 'Office'],
+        )
+        log = models.Log.objects.get(note='Kept')
+        self.assertFalse(log.changes.filter(action='Add').exists())
+
+    def test_case_relations_logged_with_the_case(self):
+        admin = models.User.objects.create_user(
+            email='admin@example.com', password=None, permission_group='Admin'
+        )
+        users = models.User.objects.bulk_create(
+            models.User(email=f'user{i}@example.com') for i in range(3)
+        )
+        case_types = models.CaseType.objects.bulk_create(
+            models.CaseType(title=f'Type {i}', description='') for i in range(3)
+        )
+        case_offices = models.CaseOffice.objects.bulk_create(
+            models.CaseOffice(name=f'Office {i}', description='') for i in range(3)
+        )
+        client = models.Client.objects.create(name='Client')
+        api = APIClient()
+        api.force_authenticate(admin)
+
+        def create_case(case_number, relations):
+            with self.captureOnCommitCallbacks(execute=True):
+                with CaptureQueriesContext(connection) as captured:
+                    response = api.post(
+                        '/api/v1/cases/',
+                        {
+                            'case_number': case_number,
+                            'client': client.id,
+                            'users': [user.id for user in users[:relations]],
+                            'case_types': [
+                                case_type.id for case_type in case_types[:relations]
+                            ],
+                            'case_offices': [
+                                office.id for office in case_offices[:relations]
+                            ],
+                        },
+                        format='json',
+                    )
+            self.assertEqual(response.status_code, 201)
+            return response, captured
+
+        _, one_each = create_case('D00/2201/0001', 1)
+        response, captured = create_case('D00/2201/0002', 3)
+        # One request savepoint, and one log write for the case and relations
+        self.assertEqual(
+            len([query for query in captured if query['sql'].startswith('SAVEPOINT')]),
+            1,
+        )
+        log = models.Log.objects.get(
+            target_type='LegalCase', target_id=response.data['id']
+        )
+        self.assertEqual(
+            sorted(log.changes.filter(action='Add').values_list('field', 'value')),
+            [
+                ('case_offices', json.dumps([office.id for office in case_offices])),
+                ('case_types', json.dumps([case_type.id for case_type in case_types])),
+                ('users', json.dumps([user.id for user in users])),
+            ],
+        )
+        # Validating the request looks up each related id, but adding and
+        # logging the relations takes the same queries however many there are
+        self.assertEqual(len(captured) - len(one_each), 3 * (3 - 1))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = api.patch(
+                f'/api/v1/cases/{response.data["id"]}/',
+                {'summary': 'Summary', 'users': [users[0].id]},
+                format='json',
+            )
+        update = models.Log.objects.get(target_type='LegalCase', action='Update')
+        self.assertEqual(
+            sorted(update.changes.values_list('field', 'action')),
+            [('summary', 'Change'), ('users', 'Remove')],
+        )
+
+    def test_later_many_to_many_change_starts_a_new_log(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            client = models.Client.objects.create(name='Client', updated_by=self.user)
+        with self.captureOnCommitCallbacks(execute=True):
+            client.users.add(self.user)
+        create, update = models.Log.objects.order_by('id')
+        self.assertEqual((create.action, update.action), ('Create', 'Update'))
+        self.assertFalse(create.changes.filter(action='Add').exists())
+        self.assertEqual(
+            list(update.changes.values_list('field', 'value', 'action')),
+            [('users', json.dumps([self.user.id]), 'Add')],
+        )
+
+    def test_unlogged_models_many_to_many_changes_ignored(self):
+        group = Group.objects.create(name='Group')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.groups.add(group)
+        self.assertFalse(models.Log.objects.exists())
+
+    def test_failed_announcement_keeps_the_logs(self):
+        def notify(logs):
+            with connection.cursor() as cursor:
+                cursor.execute('SELECT 1 / 0')
+
+        with mock.patch.object(activity, 'notify', notify):
+            with self.assertLogs('case_management.audit', 'ERROR'):
+                with self.captureOnCommitCallbacks(execute=True):
+                    models.Client.objects.create(name='Client')
+        self.assertTrue(models.Log.objects.filter(target_type='Client').exists())
+
+    def test_client_responses_list_their_new_logs(self):
+        admin = models.User.objects.create_user(
+            email='admin@example.com', password=None, permission_group='Admin'
+        )
+        api = APIClient()
+        api.force_authenticate(admin)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = api.post(
+                '/api/v1/clients/',
+                {
+                    'name': 'Client',
+                    'official_identifier': '8001015009087',
+                    'official_identifier_type': 'National',
+                    'users': [admin.id],
+                },
+                format='json',
+            )
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(
+            [log['action'] for log in response.data['updates']], ['Create']
+        )
+        with self.captureOnCommitCallbacks(execute=True):
+            response = api.patch(
+                f'/api/v1/clients/{response.data["id"]}/',
+                {'name': 'Renamed'},
+                format='json',
+            )
+        self.assertEqual(
+            [log['action'] for log in response.data['updates']], ['Update', 'Create']
+        )
+        self.assertEqual(models.Log.objects.filter(target_type='Client').count(), 2)
+
+    def test_failed_write_after_commit_is_logged(self):
+        def bulk_create(logs):
+            with connection.cursor() as cursor:
+                cursor.execute('SELECT 1 / 0')
+
+        with mock.patch.object(models.Log.objects, 'bulk_create', bulk_create):
+            with self.assertLogs('case_management.audit', 'ERROR') as logged:
+                with self.captureOnCommitCallbacks(execute=True):
+                    client = models.Client.objects.create(name='Client')
+        self.assertTrue(models.Client.objects.filter(id=client.id).exists())
+        self.assertFalse(models.Log.objects.exists())
+        self.assertFalse(models.LogChange.objects.exists())
+        message = logged.records[0].getMessage()
+        entries = json.loads(message.split(': ', 1)[1])
+        self.assertEqual(
+            [(entry['target_type'], entry['target_id']) for entry in entries],
+            [('Client', client.id)],
+        )
+        self.assertIn(
+            {'field': 'name', 'value': 'Client', 'action': 'Change'},
+            entries[0]['changes'],
+        )
+
+
+class JSONAuditLogStorageTestCase(TestCase):
+    def setUp(self):
+        self.user = models.User.objects.create_user(
+            email='audit@example.com', password=None
+        )
+
+    def create_client(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            client = models.Client.objects.create(name='Client')
+            client.users.add(self.user)
+        return client
+
+    def test_serialized_changes_match_row_storage(self):
+        client = self.create_client()
+        rows_log = models.Log.objects.get(target_id=client.id)
+        with override_settings(AUDIT_LOG_STORAGE='json'):
+            client = self.create_client()
+        json_log = models.Log.objects.get(target_id=client.id)
+
+        self.assertFalse(json_log.changes.exists())
+        rows_data = serializers.LogSerializer(rows_log).data
+        json_data = serializers.LogSerializer(json_log).data
+        self.assertEqual(list(rows_data), list(json_data))
+        self.assertNotIn('change_set', json_data)
+        self.assertEqual(len(rows_data['changes']), len(json_data['changes']))
+        for rows_change, json_change in zip(rows_data['changes'], json_data['changes']):
+            self.assertEqual(list(rows_change), list(json_change))
+            self.assertEqual(json_change['log'], json_log.id)
+            self.assertGreater(json_change['id'], rows_change['id'])
+            for key in ('field', 'value', 'action'):
+                self.assertEqual(rows_change[key], json_change[key])
+        self.assertEqual(json_data['changes'][-1]['value'], f'[{self.user.id}]')
+        self.assertEqual(json_data['changes'][-1]['action'], 'Add')
+
+    def test_backfill_copies_change_rows(self):
+        client = self.create_client()
+        log = models.Log.objects.get(target_id=client.id)
+        expected = serializers.LogSerializer(log).data
+
+        self.assertEqual(audit.backfill_change_sets(models.Log, models.LogChange, 1), 1)
+        log.refresh_from_db()
+        self.assertEqual(len(log.change_set), log.changes.count())
+        self.assertEqual(serializers.LogSerializer(log).data, expected)
+
+
+class AuditLogPartitioningTestCase(TestCase):
+    def test_partitioned_tables_keep_logging_and_reporting(self):
+        with connection.cursor() as cursor:
+            converted = partitions.partition_audit_log(cursor, months_ahead=1)
+            self.assertEqual(converted, list(partitions.PARTITIONED_TABLES))
+            this_month = partitions.month_start(date.today())
+            self.assertEqual(
+                partitions.create_future_partitions(cursor, 2),
+                [
+                    partitions.partition_name(
+                        table, partitions.add_months(this_month, 2)
+                    )
+                    for table in partitions.PARTITIONED_TABLES
+                ],
+            )
+
+        with self.captureOnCommitCallbacks(execute=True):
+            client = models.Client.objects.create(name='Client')
+        log = models.Log.objects.get(target_id=client.id)
+        self.assertEqual(log.changes.get(field='name').value, 'Client')
+
+        today = date.today().isoformat()
+        with connection.cursor() as cursor:
+            cursor.execute(*queries.range_summary(today, today))
+            cursor.execute(
+                f'SELECT tableoid::regclass::text FROM {partitions.LOG_TABLE}'
+            )
+            self.assertEqual(
+                cursor.fetchone()[0],
+                partitions.partition_name(partitions.LOG_TABLE, this_month),
+            )
+
+    def test_new_partitions_take_rows_from_the_default_partition(self):
+        later = partitions.add_months(partitions.month_start(date.today()), 3)
+        with connection.cursor() as cursor:
+            partitions.partition_audit_log(cursor, months_ahead=1)
+            with self.captureOnCommitCallbacks(execute=True):
+                client = models.Client.objects.create(name='Client')
+            # e.g. written after the monthly job missed a run
+            models.Log.objects.filter(target_id=client.id).update(
+                created_at=F('created_at') + (later - date.today())
+            )
+            models.LogChange.objects.update(
+                created_at=F('created_at') + (later - date.today())
+            )
+            for table in partitions.PARTITIONED_TABLES:
+                cursor.execute(f'SELECT COUNT(*) FROM {table}_default')
+                self.assertGreater(cursor.fetchone()[0], 0)
+
+            partitions.create_future_partitions(cursor, 3)
+            for table in partitions.PARTITIONED_TABLES:
+                self.assertEqual(
+                    partitions.default_partition(cursor, table), f'{table}_default'
+                )
+                cursor.execute(f'SELECT COUNT(*) FROM {table}_default')
+                self.assertEqual(cursor.fetchone()[0], 0)
+                cursor.execute(
+                    f'SELECT COUNT(*) FROM {partitions.partition_name(table, later)}'
+                )
+                self.assertGreater(cursor.fetchone()[0], 0)
+        log = models.Log.objects.get(target_id=client.id)
+        self.assertEqual(log.changes.get(field='name').value, 'Client')
+
+
+class LegalCaseStateTransitionTestCase(TestCase):
+    def setUp(self):
+        self.user = models.User.objects.create_user(
+            email='officer@example.com', password=None
+        )
+        with self.captureOnCommitCallbacks(execute=True):
+            self.case_office = models.CaseOffice.objects.create(
+                name='Office', description=''
+            )
+            self.legal_case = models.LegalCase.objects.create(
+                case_number='D00/2201/0001',
+                client=models.Client.objects.create(name='Client'),
+            )
+            self.legal_case.case_offices.add(self.case_office)
+        self.legal_case.refresh_from_db()
+
+    def set_state(self, state):
+        self.legal_case.state = state
+        self.legal_case.updated_by = self.user
+        self.legal_case.save()
+
+    def test_state_changes_are_recorded(self):
+        self.assertFalse(self.legal_case.state_transitions.exists())
+        self.set_state('Closed')
+        self.set_state('Closed')
+        self.set_state('InProgress')
+        self.assertEqual(
+            list(
+                self.legal_case.state_transitions.order_by('id').values_list(
+                    'from_state', 'to_state', 'user'
+                )
+            ),
+            [
+                ('Opened', 'Closed', self.user.id),
+                ('Closed', 'InProgress', self.user.id),
+            ],
+        )
+        legal_case = models.LegalCase.objects.create(
+            case_number='D00/2201/0002', client=self.legal_case.client, state='Closed'
+        )
+        transition = legal_case.state_transitions.get()
+        self.assertEqual((transition.from_state, transition.to_state), (None, 'Closed'))
+
+    def test_reports_count_closes_from_transitions(self):
+        self.set_state('Closed')
+        # Reports no longer read closes from the audit log
+        models.Log.objects.all().delete()
+        today = date.today().isoformat()
+        month = partitions.month_start(date.today()).isoformat()
+        with connection.cursor() as cursor:
+            cursor.execute(*queries.range_summary(today, today))
+            self.assertEqual(cursor.fetchone()[0]['Office']['Cases closed'], 1)
+            cursor.execute(*queries.monthly_summary(month, month))
+            self.assertEqual(
+                cursor.fetchone()[0]['Office']['Cases closed'],
+                [{'date': month[:7], 'value': 1}],
+            )
+            cursor.execute(*queries.daily_summary(month, month))
+            days = cursor.fetchone()[0]['Office']['Cases closed'][month[:7]]
+            self.assertIn({'date': today, 'value': 1}, days)
+
+    def test_close_dates_follow_state_changes(self):
+        self.assertIsNone(self.legal_case.closed_at)
+        self.set_state('Closed')
+        first_close = self.legal_case.updated_at
+        self.set_state('InProgress')
+        self.legal_case.refresh_from_db()
+        self.assertEqual(self.legal_case.closed_at, first_close)
+
+        models.LegalCase.objects.update(closed_at=None)
+        call_command('rebuild_report_tables', stdout=io.StringIO())
+        self.legal_case.refresh_from_db()
+        self.assertEqual(self.legal_case.closed_at, first_close)
+
+        # A report ending before a later close counts the earlier one
+        self.legal_case.state_transitions.update(at=F('at') - timedelta(days=2))
+        self.set_state('Closed')
+        call_command('rebuild_report_tables', stdout=io.StringIO())
+        yesterday = (date.today() - timedelta(days=1)).isoformat()
+        with connection.cursor() as cursor:
+            cursor.execute(
+                *queries.range_summary(
+                    (date.today() - timedelta(days=3)).isoformat(), yesterday
+                )
+            )
+            self.assertEqual(cursor.fetchone()[0]['Office']['Cases closed'], 1)
+
+    def test_close_and_last_activity_kept_on_the_case(self):
+        created = self.legal_case.last_activity_at
+        self.assertIsNotNone(created)
+        self.assertIsNone(self.legal_case.closed_at)
+        with self.captureOnCommitCallbacks(execute=True):
+            models.Note.objects.create(
+                legal_case=self.legal_case, title='Note', content='Called'
+            )
+        self.legal_case.refresh_from_db()
+        noted = self.legal_case.last_activity_at
+        self.assertGreater(noted, created)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.set_state('Closed')
+        self.legal_case.refresh_from_db()
+        self.assertGreater(self.legal_case.last_activity_at, noted)
+        self.assertEqual(self.legal_case.closed_at, self.legal_case.updated_at)
+        # Derived from the changes, so not logged as changes themselves
+        self.assertFalse(
+            models.LogChange.objects.filter(
+                field__in=['closed_at', 'last_activity_at']
+            ).exists()
+        )
+
+        expected = models.LegalCase.objects.values_list(
+            'closed_at', 'last_activity_at'
+        ).get()
+        models.LegalCase.objects.update(closed_at=None, last_activity_at=None)
+        call_command('rebuild_report_tables', stdout=io.StringIO())
+        closed_at, last_activity_at = models.LegalCase.objects.values_list(
+            'closed_at', 'last_activity_at'
+        ).get()
+        self.assertEqual(closed_at, expected[0])
+        # The last log is written on commit, just after the case
+        self.assertGreaterEqual(last_activity_at, expected[1])
+
+
+class RollupTestCase(TestCase):
+    def setUp(self):
+        self.user = models.User.objects.create_user(
+            email='officer@example.com', password=None
+        )
+        self.case_offices = models.CaseOffice.objects.bulk_create(
+            models.CaseOffice(name=f'Office {i}', description='') for i in range(2)
+        )
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client_ = models.Client.objects.create(name='Client')
+
+    def rollups(self):
+        return (
+            sorted(
+                models.CaseOfficeDay.objects.values_list(
+                    'case_office', 'day', 'cases_opened', 'cases_closed', 'case_logs'
+                )
+            ),
+            sorted(models.UserActivityDay.objects.values_list('user', 'day', 'logs')),
+        )
+
+    def test_counts_kept_up_to_date_on_write(self):
+        today = date.today()
+        with self.captureOnCommitCallbacks(execute=True):
+            legal_case = models.LegalCase.objects.create(
+                case_number='D00/2201/0001', client=self.client_, updated_by=self.user
+            )
+            legal_case.case_offices.add(self.case_offices[0])
+        with self.captureOnCommitCallbacks(execute=True):
+            legal_case.state = 'Closed'
+            legal_case.save()
+            other = models.LegalCase.objects.create(
+                case_number='D00/2201/0002', client=self.client_, state='Closed'
+            )
+            other.case_offices.add(*self.case_offices)
+        office_days, user_days = self.rollups()
+        self.assertEqual(
+            office_days,
+            [
+                (self.case_offices[0].id, today, 2, 2, 3),
+                (self.case_offices[1].id, today, 1, 1, 1),
+            ],
+        )
+        self.assertEqual(user_days, [(self.user.id, today, 1)])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            legal_case.case_offices.set([self.case_offices[1]])
+            self.case_offices[0].legalcase_set.remove(other)
+            other.delete()
+        office_days, _ = self.rollups()
+        self.assertEqual(
+            office_days,
+            [
+                (self.case_offices[0].id, today, 0, 0, 0),
+                (self.case_offices[1].id, today, 1, 1, 3),
+            ],
+        )
+        # The same counts as recomputed from cases, transitions and logs
+        expected = self.rollups()
+        rollups.rebuild()
+        actual = self.rollups()
+        self.assertEqual(
+            [row for row in expected[0] if row[2:] != (0, 0, 0)], actual[0]
+        )
+        self.assertEqual(expected[1], actual[1])
+
+    def test_failed_counts_keep_the_logs(self):
+        def record_logs(logs):
+            with connection.cursor() as cursor:
+                cursor.execute('SELECT 1 / 0')
+
+        with mock.patch.object(rollups, 'record_logs', record_logs):
+            with self.assertLogs('case_management.audit', 'ERROR'):
+                with self.captureOnCommitCallbacks(execute=True):
+                    models.CaseOffice.objects.create(name='Office', description='')
+        self.assertTrue(models.Log.objects.filter(target_type='CaseOffice').exists())
+        self.assertEqual(self.rollups(), ([], []))
+
+
+class ReportQueryTestCase(TestCase):
+    def setUp(self):
+        self.case_offices = models.CaseOffice.objects.bulk_create(
+            models.CaseOffice(name=f'Office {i}', description='') for i in range(2)
+        )
+
+    def test_reports_are_prepared_once_per_connection(self):
+        today = date.today().isoformat()
+        with connection.cursor() as cursor:
+            cursor.execute(*queries.range_summary(today, today))
+            expected = cursor.fetchone()[0]
+            # Earlier tests share the connection
+            cursor.execute('DEALLOCATE ALL')
+            queries._prepared.pop(connection.connection, None)
+        with CaptureQueriesContext(connection) as captured:
+            with connection.cursor() as cursor:
+                for case_office in (None, self.case_offices[1].id, None):
+                    queries.execute(
+                        cursor, *queries.range_summary(today, today, case_office)
+                    )
+                    results = cursor.fetchone()[0]
+        self.assertEqual(
+            [query['sql'].split()[0] for query in captured],
+            ['PREPARE', 'EXECUTE', 'EXECUTE', 'EXECUTE'],
+        )
+        self.assertEqual(results, expected)
+        self.assertEqual(list(results), ['Office 0', 'Office 1'])
+
+    def test_daily_summary_lists_every_day_of_each_month(self):
+        models.CaseOfficeDay.objects.create(
+            case_office=self.case_offices[1],
+            day=date(2024, 2, 29),
+            cases_opened=2,
+            cases_closed=0,
+            case_logs=3,
+        )
+        with connection.cursor() as cursor:
+            queries.execute(
+                cursor,
+                *queries.daily_summary(
+                    '2024-01-01', '2024-02-01', self.case_offices[1].id
+                ),
+            )
+            data = cursor.fetchone()[0]
+        self.assertEqual(list(data), ['Office 1'])
+        opened = data['Office 1']['Cases opened']
+        self.assertEqual(list(opened), ['2024-01', '2024-02'])
+        self.assertEqual([len(days) for days in opened.values()], [31, 29])
+        self.assertEqual(opened['2024-02'][-1], {'date': '2024-02-29', 'value': 2})
+        self.assertEqual(data['Office 1']['Cases closed']['2024-02'][-1]['value'], None)
+        self.assertEqual(
+            data['Office 1']['Cases with activity']['2024-02'][-1]['value'], 3
+        )
+
+    def test_period_summary_buckets_by_granularity(self):
+        for day, opened in ((date(2024, 2, 29), 2), (date(2024, 3, 4), 1)):
+            models.CaseOfficeDay.objects.create(
+                case_office=self.case_offices[1],
+                day=day,
+                cases_opened=opened,
+                cases_closed=0,
+                case_logs=0,
+            )
+        client = APIClient()
+        client.force_authenticate(
+            models.User.objects.create_user(
+                email='admin@example.com', password=None, permission_group='Admin'
+            )
+        )
+        response = client.get(
+            '/api/v1/reports/period-summary',
+            {
+                'startDate': '2024-02-28',
+                'endDate': '2024-03-10',
+                'granularity': 'week',
+                'metrics': 'activity',
+                'caseOffice': self.case_offices[1].id,
+            },
+        )
+        self.assertEqual(
+            response.data['dataPerCaseOffice']['Office 1']['Cases opened'],
+            [{'date': '2024-W09', 'value': 2}, {'date': '2024-W10', 'value': 1}],
+        )
+        with connection.cursor() as cursor:
+            queries.execute(
+                cursor,
+                *queries.period_summary(
+                    '2024-02-01',
+                    '2024-03-31',
+                    granularity='quarter',
+                    metrics='activity',
+                ),
+            )
+            data = cursor.fetchone()[0]
+        self.assertEqual(list(data), ['Office 0', 'Office 1'])
+        self.assertEqual(
+            data['Office 1']['Cases opened'], [{'date': '2024-Q1', 'value': 3}]
+        )
+        response = client.get(
+            '/api/v1/reports/period-summary', {'granularity': 'fortnight'}
+        )
+        self.assertEqual(response.status_code, 400)
+
+    def test_period_summary_counts_cases_open_at_the_end_of_each_period(self):
+        legal_case = models.LegalCase.objects.create(
+            case_number='D00/2201/0001',
+            client=models.Client.objects.create(name='Client'),
+        )
+        legal_case.case_offices.add(self.case_offices[0])
+        today = date.today()
+        with connection.cursor() as cursor:
+            queries.execute(
+                cursor,
+                *queries.period_summary(
+                    (today - timedelta(days=2)).isoformat(),
+                    today.isoformat(),
+                    self.case_offices[0].id,
+                    granularity='day',
+                ),
+            )
+            total = cursor.fetchone()[0]['Office 0']['Total cases']
+        self.assertEqual([point['value'] for point in total], [None, None, 1])
+
+    def test_days_per_case_statistics_of_closed_cases(self):
+        client = models.Client.objects.create(name='Client')
+        for i, days_open in enumerate((0, 2, 9)):
+            legal_case = models.LegalCase.objects.create(
+                case_number=f'D00/2201/000{i}', client=client, state='Closed'
+            )
+            legal_case.case_offices.add(self.case_offices[0])
+            models.LegalCase.objects.filter(id=legal_case.id).update(
+                created_at=F('created_at') - timedelta(days=days_open)
+            )
+        today = date.today().isoformat()
+        month = partitions.month_start(date.today()).isoformat()
+        metrics = [
+            'Average days per case',
+            'Median days per case',
+            '90th percentile days per case',
+        ]
+        with connection.cursor() as cursor:
+            queries.execute(cursor, *queries.range_summary(today, today))
+            office = cursor.fetchone()[0]['Office 0']
+            self.assertEqual([office[metric] for metric in metrics], [4.7, 3, 8.6])
+            queries.execute(cursor, *queries.monthly_summary(month, month))
+            office = cursor.fetchone()[0]['Office 0']
+            self.assertEqual(
+                [office[metric][0]['value'] for metric in metrics], [4.7, 3, 8.6]
+            )
+
+    def test_case_office_must_be_an_id(self):
+        client = APIClient()
+        client.force_authenticate(
+            models.User.objects.create_user(
+                email='admin@example.com', password=None, permission_group='Admin'
+            )
+        )
+        response = client.get(
+            '/api/v1/reports/range-summary', {'caseOffice': "1' OR '1'='1"}
+        )
+        self.assertEqual(response.status_code, 400)
+        response = client.get(
+            '/api/v1/reports/monthly-summary',
+            {'caseOffice': self.case_offices[1].id},
+        )
+        self.assertEqual(list(response.data['dataPerCaseOffice']), ['Office 1'])
+
+    def test_dates_must_be_calendar_dates(self):
+        client = APIClient()
+        client.force_authenticate(
+            models.User.objects.create_user(
+                email='admin@example.com', password=None, permission_group='Admin'
+            )
+        )
+        for report in ('range-summary', 'period-summary'):
+            response = client.get(
+                f'/api/v1/reports/{report}', {'startDate': '2021-02-30'}
+            )
+            self.assertEqual(response.status_code, 400)
+            self.assertIn('startDate', response.data)
+
+
+class ReportCacheTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = models.User.objects.create_user(
+            email='officer@example.com', password=None
+        )
+        self.case_offices = models.CaseOffice.objects.bulk_create(
+            models.CaseOffice(name=f'Office {i}', description='') for i in range(2)
+        )
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client_ = models.Client.objects.create(name='Client')
+        self.today = date.today().isoformat()
+
+    def report(self, case_office=None):
+        with mock.patch.object(queries, 'execute', wraps=queries.execute) as execute:
+            data = report_cache.report(
+                *queries.range_summary(self.today, self.today, case_office)
+            )
+        return data, execute.called
+
+    def open_case(self, case_office):
+        with self.captureOnCommitCallbacks(execute=True):
+            legal_case = models.LegalCase.objects.create(
+                case_number=f'D00/2201/{case_office.id:04}',
+                client=self.client_,
+                updated_by=self.user,
+            )
+            legal_case.case_offices.add(case_office)
+        return legal_case
+
+    def test_reports_cached_until_their_case_office_changes(self):
+        office, other = self.case_offices
+        data, executed = self.report(office.id)
+        self.assertTrue(executed)
+        self.assertEqual(self.report(office.id), (data, False))
+
+        self.open_case(other)
+        self.assertEqual(self.report(office.id), (data, False))
+        data, executed = self.report()
+        self.assertTrue(executed)
+        self.assertEqual(data['Office 1']['Cases opened'], 1)
+
+        legal_case = self.open_case(office)
+        data, executed = self.report(office.id)
+        self.assertTrue(executed)
+        self.assertEqual(data['Office 0']['Cases opened'], 1)
+        with self.captureOnCommitCallbacks(execute=True):
+            legal_case.state = 'Closed'
+            legal_case.save()
+        data, executed = self.report(office.id)
+        self.assertTrue(executed)
+        self.assertEqual(data['Office 0']['Cases closed'], 1)
+
+    def test_renames_invalidate(self):
+        office = self.case_offices[0]
+        self.report(office.id)
+        office = models.CaseOffice.objects.get(id=office.id)
+        office.name = 'Renamed'
+        office.save()
+        data, executed = self.report(office.id)
+        self.assertTrue(executed)
+        self.assertEqual(list(data), ['Renamed'])
+        self.user.case_office = office
+        self.user.save()
+        self.assertTrue(self.report(office.id)[1])
+
+
+class ReportJobTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.case_office = models.CaseOffice.objects.create(
+            name='Office', description=''
+        )
+        self.client_ = APIClient()
+        self.client_.force_authenticate(
+            models.User.objects.create_user(
+                email='admin@example.com', password=None, permission_group='Admin'
+            )
+        )
+        self.parameters = {'startMonth': '2024-01', 'endMonth': '2024-02'}
+
+    def test_jobs_run_reports_once_for_the_same_data(self):
+        response = self.client_.post(
+            '/api/v1/reports/daily-summary/jobs?startMonth=2024-01&endMonth=2024-02'
+        )
+        self.assertEqual(response.status_code, 202)
+        job = response.data
+        self.assertEqual(job['state'], 'Pending')
+        self.assertEqual(job['startMonth'], '2024-01-01')
+        again = self.client_.post(
+            '/api/v1/reports/daily-summary/jobs?startMonth=2024-01&endMonth=2024-02'
+        )
+        self.assertEqual(again.data['id'], job['id'])
+
+        call_command('run_report_jobs', once=True)
+        response = self.client_.get(f'/api/v1/reports/jobs/{job["id"]}')
+        self.assertEqual(response.data['state'], 'Done')
+        self.assertEqual(
+            response.data['dataPerCaseOffice'],
+            self.client_.get('/api/v1/reports/daily-summary', self.parameters).data[
+                'dataPerCaseOffice'
+            ],
+        )
+
+        report_cache.bump([self.case_office.id])
+        changed = self.client_.post(
+            '/api/v1/reports/daily-summary/jobs?startMonth=2024-01&endMonth=2024-02'
+        )
+        self.assertNotEqual(changed.data['id'], job['id'])
+
+    def test_scoped_users_only_see_jobs_of_their_case_office(self):
+        job = self.client_.post('/api/v1/reports/range-summary/jobs').data
+        user = models.User.objects.create_user(
+            email='office-admin@example.com',
+            password=None,
+            permission_group='AdviceOfficeAdmin',
+            case_office=self.case_office,
+        )
+        self.client_.force_authenticate(user)
+        response = self.client_.get(f'/api/v1/reports/jobs/{job["id"]}')
+        self.assertEqual(response.status_code, 403)
+        response = self.client_.post(
+            f'/api/v1/reports/range-summary/jobs?caseOffice={self.case_office.id}'
+        )
+        self.assertEqual(response.status_code, 202)
+        response = self.client_.get(f'/api/v1/reports/jobs/{response.data["id"]}')
+        self.assertEqual(response.status_code, 200)
+        response = self.client_.post('/api/v1/reports/unknown/jobs')
+        self.assertEqual(response.status_code, 404)
+
+
+class ReportExportTestCase(TestCase):
+    def setUp(self):
+        self.case_offices = models.CaseOffice.objects.bulk_create(
+            models.CaseOffice(name=f'Office {i}', description='') for i in range(2)
+        )
+        models.CaseOfficeDay.objects.create(
+            case_office=self.case_offices[1],
+            day=date(2024, 2, 29),
+            cases_opened=2,
+            cases_closed=0,
+            case_logs=3,
+        )
+        self.client_ = APIClient()
+        self.client_.force_authenticate(
+            models.User.objects.create_user(
+                email='admin@example.com', password=None, permission_group='Admin'
+            )
+        )
+
+    def export(self, path, params):
+        response = self.client_.get(path, params)
+        self.assertEqual(response.status_code, 200)
+        return b''.join(response.streaming_content).decode()
+
+    def test_daily_summary_csv_has_a_row_per_office_metric_and_day(self):
+        content = self.export(
+            '/api/v1/reports/daily-summary.csv',
+            {'startMonth': '2024-02', 'endMonth': '2024-02'},
+        )
+        rows = list(csv.reader(io.StringIO(content)))
+        self.assertEqual(rows[0], ['office', 'metric', 'period', 'value'])
+        self.assertEqual(len(rows), 1 + 2 * 3 * 29)
+        self.assertEqual(rows[1], ['Office 0', 'Cases opened', '2024-02-01', ''])
+        self.assertIn(['Office 1', 'Cases opened', '2024-02-29', '2'], rows)
+        self.assertIn(['Office 1', 'Cases with activity', '2024-02-29', '3'], rows)
+
+    def test_range_summary_ndjson_matches_the_report(self):
+        params = {
+            'startDate': '2024-02-01',
+            'endDate': '2024-02-29',
+            'caseOffice': self.case_offices[1].id,
+        }
+        content = self.export('/api/v1/reports/range-summary.ndjson', params)
+        rows = [json.loads(line) for line in content.splitlines()]
+        report = self.client_.get('/api/v1/reports/range-summary', params).data
+        self.assertEqual(
+            rows,
+            [
+                {
+                    'office': 'Office 1',
+                    'metric': metric,
+                    'period': '2024-02-01/2024-02-29',
+                    'value': value,
+                }
+                for metric, value in report['dataPerCaseOffice']['Office 1'].items()
+            ],
+        )
+        response = self.client_.get('/api/v1/reports/range-summary.xml')
+        self.assertEqual(response.status_code, 404)
+
+
+class LogIndexTestCase(TestCase):
+    """Checks the planner picks the Log indexes on a realistic volume of logs.
+    Set LOG_INDEX_TEST_ROWS to seed more, e.g. several million."""
+
+    @classmethod
+    def setUpTestData(cls):
+        users = models.User.objects.bulk_create(
+            models.User(email=f'user{i}@example.com') for i in range(50)
+        )
+        with connection.cursor() as cursor:
+            cursor.execute(
+                """INSERT INTO case_management_log (
+                    created_at, updated_at, parent_id, parent_type,
+                    target_id, target_type, action, user_id, note
+                )
+                SELECT
+                    created_at, created_at, i %% 5000 + 1, 'LegalCase',
+                    i %% 20000 + 1,
+                    (ARRAY['LegalCase', 'Client', 'Meeting', 'Note', 'CaseUpdate', 'File'])[i %% 6 + 1],
+                    'Update', %s + i %% 50, 'Seeded'
+                FROM
+                    generate_series(1, %s) i,
+                    LATERAL (SELECT now() - (i %% 1460) * INTERVAL '1 day') t(created_at)""",
+                [users[0].id, int(os.getenv('LOG_INDEX_TEST_ROWS', 200000))],
+            )
+            cursor.execute('ANALYZE case_management_log')
+
+    def explain(self, query):
+        sql, params = query
+        with connection.cursor() as cursor:
+            cursor.execute(f'EXPLAIN {sql}', params)
+            return '\n'.join(row[0] for row in cursor.fetchall())
+
+    def test_case_history_uses_parent_index(self):
+        queryset = views.LogViewSet.queryset.filter(
+            parent_type='LegalCase', parent_id=42
+        )
+        self.assertIn('log_parent_idx', queryset.explain())
+
+    def test_record_history_uses_target_index(self):
+        queryset = models.Log.objects.filter(target_type='Client', target_id=43)
+        self.assertIn('log_target_idx', queryset.order_by('-updated_at').explain())
+
+    def test_reports_do_not_read_logs(self):
+        today = date.today().isoformat()
+        month = partitions.month_start(date.today()).isoformat()
+        for query in (
+            queries.range_summary(today, today),
+            queries.monthly_summary(month, month),
+            queries.daily_summary(month, month),
+        ):
+            self.assertNotIn('case_management_log', self.explain(query))
+
+
+class LogPaginationTestCase(TestCase):
+    def setUp(self):
+        self.user = models.User.objects.create_user(
+            email='admin@example.com', password=None, permission_group='Admin'
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.logs = models.Log.objects.bulk_create(
+            models.Log(
+                parent_type='LegalCase',
+                parent_id=1,
+                target_type='LegalCase',
+                target_id=1,
+                action='Update',
+                note=str(i),
+            )
+            for i in range(5)
+        )
+
+    def test_pages_follow_cursor_newest_first(self):
+        response = self.client.get(
+            '/api/v1/logs/',
+            {'parent_type': 'LegalCase', 'parent_id': 1, 'page_size': 2},
+        )
+        ids = []
+        while True:
+            self.assertEqual(response.status_code, 200)
+            self.assertLessEqual(len(response.data['results']), 2)
+            ids += [log['id'] for log in response.data['results']]
+            if response.data['next'] is None:
+                break
+            response = self.client.get(response.data['next'])
+        self.assertEqual(ids, sorted((log.id for log in self.logs), reverse=True))
+
+    def test_since_id_returns_only_newer_logs(self):
+        response = self.client.get(
+            '/api/v1/logs/',
+            {'parent_type': 'LegalCase', 'parent_id': 1, 'since_id': self.logs[2].id},
+        )
+        self.assertEqual(
+            [log['id'] for log in response.data['results']],
+            [self.logs[4].id, self.logs[3].id],
+        )
+        response = self.client.get('/api/v1/logs/', {'since_id': 'latest'})
+        self.assertEqual(response.status_code, 400)
+
+
+class LogQueryCountTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = models.User.objects.create_user(
+            email='admin@example.com', password=None, permission_group='Admin'
+        )
+        users = models.User.objects.bulk_create(
+            models.User(email=f'user{i}@example.com', name=f'User {i}')
+            for i in range(10)
+        )
+        cls.clients = models.Client.objects.bulk_create(
+            models.Client(name=f'Client {i}') for i in range(10)
+        )
+        logs = models.Log.objects.bulk_create(
+            models.Log(
+                parent_type='LegalCase',
+                parent_id=1,
+                target_type='Client',
+                target_id=cls.clients[i % 10].id,
+                action='Update',
+                user=users[i % 10],
+            )
+            for i in range(1000)
+        )
+        models.LogChange.objects.bulk_create(
+            models.LogChange(
+                log=log,
+                created_at=log.created_at,
+                field=field,
+                value='x',
+                action='Change',
+            )
+            for log in logs
+            for field in ('name', 'preferred_name')
+        )
+
+    def test_log_list_queries_do_not_grow_with_logs(self):
+        client = APIClient()
+        client.force_authenticate(self.admin)
+        # Savepoint and release for ATOMIC_REQUESTS, logs with users, changes
+        with self.assertNumQueries(4):
+            response = client.get(
+                '/api/v1/logs/',
+                {'parent_type': 'LegalCase', 'parent_id': 1, 'page_size': 1000},
+            )
+        self.assertEqual(len(response.data['results']), 1000)
+        self.assertEqual(len(response.data['results'][0]['changes']), 2)
+        self.assertTrue(response.data['results'][0]['extra']['user']['name'])
+
+    def test_client_updates_loaded_for_all_clients_at_once(self):
+        with CaptureQueriesContext(connection) as captured:
+            data = serializers.ClientSerializer(
+                models.Client.objects.all(), many=True
+            ).data
+        log_queries = [
+            query for query in captured if 'case_management_log' in query['sql']
+        ]
+        # One query for the logs with their users, one for their changes
+        self.assertEqual(len(log_queries), 2)
+        self.assertEqual(sum(len(client['updates']) for client in data), 1000)
+
+
+class RecordHistoryTestCase(TestCase):
+    def setUp(self):
+        self.user = models.User.objects.create_user(
+            email='admin@example.com', password=None, permission_group='Admin'
+        )
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client_record = models.Client.objects.create(name='Name 0')
+        for i in range(1, 6):
+            with self.captureOnCommitCallbacks(execute=True):
+                self.client_record.name = f'Name {i}'
+                self.client_record.save()
+                if i == 2:
+                    self.client_record.users.add(self.user)
+        self.logs = list(
+            models.Log.objects.filter(
+                target_type='Client', target_id=self.client_record.id
+            ).order_by('id')
+        )
+
+    def state_at(self, log, **kwargs):
+        return history.state_at(
+            'Client', self.client_record.id, log.created_at, **kwargs
+        )
+
+    def test_state_at_replays_logs(self):
+        state = history.state_at(
+            'Client', self.client_record.id, self.logs[0].created_at - timedelta(1)
+        )
+        self.assertFalse(state['exists'])
+
+        state = self.state_at(self.logs[0])
+        self.assertTrue(state['exists'])
+        self.assertEqual(state['fields']['name'], 'Name 0')
+        self.assertNotIn('users', state['fields'])
+        self.assertNotIn('legal_cases', state['fields'])
+
+        state = self.state_at(self.logs[2])
+        self.assertEqual(state['fields']['name'], 'Name 2')
+        self.assertEqual(state['fields']['users'], [self.user.id])
+        self.assertEqual(state['replayed_logs'], 3)
+
+        client_id = self.client_record.id
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client_record.delete()
+        state = history.state_at('Client', client_id, timezone.now())
+        self.assertFalse(state['exists'])
+        self.assertTrue(state['deleted'])
+        self.assertEqual(state['fields']['name'], 'Name 5')
+
+    def test_replay_starts_from_nearest_snapshot(self):
+        expected = [self.state_at(log)['fields'] for log in self.logs]
+        with mock.patch.object(history, 'SNAPSHOT_DELAY', timedelta(0)):
+            self.assertEqual(history.create_snapshots(interval=2), 3)
+            self.assertEqual(history.create_snapshots(interval=2), 0)
+
+        state = self.state_at(self.logs[-1])
+        self.assertEqual(state['snapshot_log_id'], self.logs[-1].id)
+        self.assertEqual(state['replayed_logs'], 0)
+        state = self.state_at(self.logs[2])
+        self.assertEqual(state['snapshot_log_id'], self.logs[1].id)
+        self.assertEqual(state['replayed_logs'], 1)
+        self.assertEqual([self.state_at(log)['fields'] for log in self.logs], expected)
+
+    def test_state_endpoint(self):
+        api_client = APIClient()
+        api_client.force_authenticate(self.user)
+        response = api_client.get(
+            '/api/v1/logs/state/',
+            {
+                'target_type': 'Client',
+                'target_id': self.client_record.id,
+                'at': self.logs[1].created_at.isoformat(),
+            },
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['fields']['name'], 'Name 1')
+        response = api_client.get(
+            '/api/v1/logs/state/', {'target_type': 'Log', 'target_id': 1}
+        )
+        self.assertEqual(response.status_code, 400)
+
+    def test_state_endpoint_scoped_to_the_case_office(self):
+        offices = models.CaseOffice.objects.bulk_create(
+            models.CaseOffice(name=f'Office {i}', description='') for i in range(2)
+        )
+        with self.captureOnCommitCallbacks(execute=True):
+            cases = [
+                models.LegalCase.objects.create(
+                    case_number=f'D00/2201/000{i}', client=client
+                )
+                for i, client in enumerate(
+                    [self.client_record, models.Client.objects.create(name='Other')]
+                )
+            ]
+            for case, office in zip(cases, offices):
+                case.case_offices.add(office)
+            note = models.Note.objects.create(
+                legal_case=cases[0], title='Note', content='Called'
+            )
+        api_client = APIClient()
+        api_client.force_authenticate(
+            models.User.objects.create_user(
+                email='officer@example.com',
+                password=None,
+                permission_group='CaseWorker',
+                case_office=offices[0],
+            )
+        )
+        for target, status in [
+            (self.client_record, 200),
+            (cases[0], 200),
+            (note, 200),
+            (offices[0], 200),
+            (cases[1].client, 403),
+            (cases[1], 403),
+            (offices[1], 403),
+        ]:
+            response = api_client.get(
+                '/api/v1/logs/state/',
+                {'target_type': type(target).__name__, 'target_id': target.id},
+            )
+            self.assertEqual(response.status_code, status, target)
+
+
+class CaseActivityStreamTestCase(TransactionTestCase):
+    def setUp(self):
+        for name in ('POLL_SECONDS', 'HEARTBEAT_SECONDS'):
+            patcher = mock.patch.object(activity, name, 0.1)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.user = models.User.objects.create_user(
+            email='admin@example.com', password=None, permission_group='Admin'
+        )
+        client = models.Client.objects.create(name='Client')
+        self.legal_case = models.LegalCase.objects.create(
+            case_number='D00/2201/0001', client=client
+        )
+        self.other_case = models.LegalCase.objects.create(
+            case_number='D00/2201/0002', client=client
+        )
+
+    def tearDown(self):
+        # The listener stops once unsubscribed. Wait for its backend to exit
+        # too, so that the test database can be dropped.
+        thread = activity.listener.thread
+        if thread is not None:
+            thread.join(timeout=5)
+        with connection.cursor() as cursor:
+            for _ in range(50):
+                cursor.execute(
+                    """SELECT count(*) FROM pg_stat_activity
+                    WHERE datname = current_database() AND query = %s""",
+                    [f'LISTEN {activity.CHANNEL}'],
+                )
+                if cursor.fetchone()[0] == 0:
+                    break
+                time.sleep(0.1)
+
+    def update_case(self, legal_case, summary):
+        legal_case.summary = summary
+        legal_case.save()
+
+    def update_cases_soon(self, *updates):
+        def run():
+            for legal_case, summary in updates:
+                self.update_case(legal_case, summary)
+            connection.close()
+
+        timer = threading.Timer(0.5, run)
+        timer.start()
+        self.addCleanup(timer.join)
+
+    def next_event(self, stream):
+        # Give up after 5 seconds of keepalives
+        for _, chunk in zip(range(50), stream):
+            if not chunk.startswith(b':'):
+                lines = chunk.decode().strip().split('\n')
+                return dict(line.split(': ', 1) for line in lines)
+        self.fail('No event received')
+
+    def test_listener_receives_committed_logs(self):
+        subscriber = activity.listener.subscribe()
+        try:
+            self.update_case(self.legal_case, 'Updated')
+            log = models.Log.objects.latest('id')
+            self.assertEqual(
+                subscriber.get(timeout=5),
+                {
+                    'id': log.id,
+                    'parent_type': 'LegalCase',
+                    'parent_id': self.legal_case.id,
+                },
+            )
+        finally:
+            activity.listener.unsubscribe(subscriber)
+
+    def test_stream_pushes_new_logs_of_the_case(self):
+        api_client = APIClient()
+        api_client.force_authenticate(self.user)
+        last_log = models.Log.objects.filter(parent_id=self.legal_case.id).latest('id')
+        response = api_client.get(
+            '/api/v1/logs/stream/',
+            {'parent_type': 'LegalCase', 'parent_id': self.legal_case.id},
+            HTTP_LAST_EVENT_ID=str(last_log.id - 1),
+        )
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        stream = iter(response.streaming_content)
+        try:
+            # Missed while disconnected
+            event = self.next_event(stream)
+            self.assertEqual(int(event['id']), last_log.id)
+            self.update_cases_soon(
+                (self.other_case, 'Other case'), (self.legal_case, 'This case')
+            )
+            event = self.next_event(stream)
+            self.assertEqual(event['event'], 'log')
+            data = json.loads(event['data'])
+            self.assertEqual(data['parent_id'], self.legal_case.id)
+            self.assertEqual(data['action'], 'Update')
+            self.assertIn(
+                {'field': 'summary', 'value': 'This case'},
+                [{'field': c['field'], 'value': c['value']} for c in data['changes']],
+            )
+        finally:
+            response.close()
+
+
+class BenchmarkAuditWritesTestCase(TransactionTestCase):
+    def test_reports_every_operation_and_cleans_up(self):
+        out = io.StringIO()
+        call_command('benchmark_audit_writes', iterations=2, warmup=1, stdout=out)
+        lines = out.getvalue().splitlines()
+        self.assertEqual(len(lines), 7)
+        queries_per_op = {line[:40].strip(): line.split()[-2] for line in lines[1:]}
+        self.assertEqual(queries_per_op['Client create'], '5.0')
+        self.assertEqual(queries_per_op['LegalCase create (API)'], '22.0')
+        for model in (models.User, models.Client, models.LegalCase, models.Log):
+            self.assertFalse(model.objects.exists())
+
+
+class BenchmarkReportsTestCase(TestCase):
+    def benchmark(self, **options):
+        out = io.StringIO()
+        call_command(
+            'benchmark_reports',
+            months=[1, 3],
+            iterations=1,
+            warmup=1,
+            stdout=out,
+            **options,
+        )
+        return out.getvalue().splitlines()
+
+    def test_reports_the_grid_and_rolls_back(self):
+        lines = self.benchmark(add_offices=2, case_offices=['all', 'busiest'])
+        self.assertEqual(
+            [line.split()[:3] for line in lines[1:]],
+            [
+                [report, months, office]
+                for report in ('range-summary', 'monthly-summary', 'daily-summary')
+                for months in ('1', '3')
+                for office in ('all', 'busiest')
+            ],
+        )
+        self.assertFalse(models.CaseOffice.objects.exists())
+        self.assertFalse(models.CaseOfficeDay.objects.exists())
+
+    def test_writes_and_compares_results(self):
+        models.CaseOffice.objects.create(name='Office')
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'results.json')
+            self.benchmark(reports=['daily-summary'], output=path)
+            with open(path) as file:
+                results = json.load(file)
+            self.assertEqual(results['dataset']['case_offices'], 1)
+            self.assertEqual(
+                [(r['months'], r['case_office']) for r in results['results']],
+                [(1, 'all'), (3, 'all')],
+            )
+            self.assertIn('Execution Time', results['results'][0]['plan'])
+            lines = self.benchmark(reports=['daily-summary'], compare=path)
+        for line in lines[1:]:
+            self.assertRegex(line, r' \d+\.\d\dx')
+
+
+class GenerateSyntheticDataTestCase(TestCase):
+    def generate(self):
+        call_command(
+            'generate_synthetic_data',
+            offices=3,
+            users_per_office=2,
+            cases=50,
+            updates_per_case=2,
+            years=1,
+            seed=1,
+            stdout=io.StringIO(),
+        )
+
+    def test_cases_come_with_their_history(self):
+        self.generate()
+        self.assertEqual(models.LegalCase.objects.count(), 50)
+        self.assertEqual(models.User.objects.count(), 6)
+        closed = models.LegalCase.objects.filter(state='Closed')
+        self.assertTrue(closed.exists())
+        self.assertFalse(closed.exclude(state_transitions__to_state='Closed').exists())
+        self.assertFalse(closed.filter(closed_at__isnull=True).exists())
+        logs = (
+            models.Client.objects.count()
+            + models.LegalCase.objects.count()
+            + models.LegalCaseStateTransition.objects.count()
+            + 2 * models.CaseUpdate.objects.count()
+        )
+        self.assertEqual(models.Log.objects.count(), logs)
+        self.assertEqual(
+            models.CaseUpdate.objects.count(),
+            models.Note.objects.count()
+            + models.Meeting.objects.count()
+            + models.File.objects.count(),
+        )
+        self.assertFalse(models.Log.objects.filter(changes__isnull=True).exists())
+        self.assertEqual(
+            models.CaseOfficeDay.objects.aggregate(n=Sum('cases_opened'))['n'], 50
+        )
+
+    @override_settings(AUDIT_LOG_STORAGE='json')
+    def test_changes_stored_on_logs(self):
+        self.generate()
+        self.assertFalse(models.LogChange.objects.exists())
+        self.assertFalse(models.Log.objects.filter(change_set__isnull=True).exists())
+        case_log = models.Log.objects.filter(
+            target_type='LegalCase', action='Create'
+        ).first()
+        self.assertEqual(
+            [change['field'] for change in case_log.change_set],
+            ['case_number', 'state', 'client', 'case_offices', 'users'],
+        )
+
+
 def assertValidHTML(string):
     """
     Raises exception if the string is not valid HTML, e.g. has unmatched tags
@@ -24,6 +24,10 @@ from case_management.views import (
     range_summary,
     monthly_summary,
     daily_summary,
+    period_summary,
+    create_report_job,
+    report_job,
+    export_report,
 )
 
 # Note: For Sentry integration testing
@@ -71,6 +75,18 @@ urlpatterns = [
     path('api/v1/reports/monthly-summary',
          monthly_summary, name='monthly-summary'),
     path('api/v1/reports/daily-summary', daily_summary, name='daily-summary'),
+    path('api/v1/reports/period-summary', period_summary, name='period-summary'),
+    path(
+        'api/v1/reports/<slug:report>/jobs',
+        create_report_job,
+        name='create-report-job',
+    ),
+    path('api/v1/reports/jobs/<int:pk>', report_job, name='report-job'),
+    path(
+        'api/v1/reports/<slug:report>.<slug:export_format>',
+        export_report,
+        name='export-report',
+    ),
     path(
         'api/ui/',
         schema_view.with_ui('swagger', cache_timeout=0),
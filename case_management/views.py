@@ -1,24 +1,35 @@
+import csv
+import json
+import queue
 import re
 from datetime import date, timedelta
 from rest_framework.authtoken.views import ObtainAuthToken
 from rest_framework.authtoken.models import Token
-from rest_framework.decorators import api_view, permission_classes
-from rest_framework.exceptions import ValidationError
+from rest_framework.decorators import action, api_view, permission_classes
+from rest_framework.exceptions import NotFound, ValidationError
+from rest_framework.renderers import JSONRenderer
 from rest_framework.response import Response
 
 from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework import viewsets, mixins
+from rest_framework.filters import OrderingFilter
+from rest_framework.pagination import CursorPagination
 from rest_framework.parsers import MultiPartParser, FormParser
 
 from django.core.exceptions import BadRequest, FieldError
+from django.core.serializers.json import DjangoJSONEncoder
 
 from django.views import generic
 
-from django.db import connection
+from django.db import connection, transaction
 
 from django.contrib.auth.models import AnonymousUser
 
-from django.http import HttpResponseBadRequest
+from django.http import StreamingHttpResponse
+from django.shortcuts import get_object_or_404
+
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
 
 from case_management.auth import (
     InAdminGroup,
@@ -27,6 +38,8 @@ from case_management.auth import (
     InCaseWorkerGroup,
     check_create_update_permission,
     check_scoped_list_permission,
+    check_scoped_record_permission,
+    check_scoped_report_job_permission,
     check_scoped_reporting_permision
 )
 
@@ -54,8 +67,9 @@ from case_management.models import (
     Note,
     User,
     Log,
+    ReportJob,
 )
-from case_management import queries
+from case_management import activity, audit, history, queries, report_cache, report_jobs
 
 import time
 
@@ -176,12 +190,23 @@ class ClientViewSet(LoggedModelViewSet):
             ).distinct('id')
         return queryset
 
+    def perform_create(self, serializer):
+        super().perform_create(serializer)
+        # Responses list the client's updates, so write its new log first
+        audit.flush_pending()
+
+    def perform_update(self, serializer):
+        super().perform_update(serializer)
+        audit.flush_pending()
+
 
 class LegalCaseViewSet(LoggedModelViewSet):
     queryset = LegalCase.objects.all()
     serializer_class = LegalCaseSerializer
-    filter_backends = [DjangoFilterBackend]
+    filter_backends = [DjangoFilterBackend, OrderingFilter]
     filterset_fields = ['client']
+    # e.g. ?ordering=-last_activity_at for recently active cases
+    ordering_fields = ['last_activity_at', 'closed_at']
 
     def perform_create(self, serializer):
         try:
@@ -201,9 +226,8 @@ class LegalCaseViewSet(LoggedModelViewSet):
         queryset = super().get_queryset()
         case_office = self.request.query_params.get('caseOffice')
         if case_office is not None:
-            queryset = queryset.filter(
-                case_offices__id=case_office
-            ).distinct('id')
+            # A case is in an office at most once, so this adds no duplicates
+            queryset = queryset.filter(case_offices__id=case_office)
         return queryset
 
 
@@ -246,16 +270,33 @@ class UserViewSet(UpdateRetrieveViewSet):
     serializer_class = UserSerializer
 
 
+class LogCursorPagination(CursorPagination):
+    ordering = '-id'
+    page_size = 100
+    page_size_query_param = 'page_size'
+    max_page_size = 1000
+
+
 class LogViewSet(viewsets.ReadOnlyModelViewSet):
     permission_classes = [InAdminGroup |
                           InAdviceOfficeAdminGroup | InCaseWorkerGroup]
-    queryset = Log.objects.all().order_by('-id')
+    queryset = Log.objects.with_details().order_by('-id')
     serializer_class = LogSerializer
+    pagination_class = LogCursorPagination
     filter_backends = [DjangoFilterBackend]
     filterset_fields = ['parent_id', 'parent_type', 'target_id', 'target_type']
 
     permission_scope_query_param = 'parent_id'
 
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        since_id = self.request.query_params.get('since_id')
+        if since_id is not None:
+            if not since_id.isdigit():
+                raise ValidationError('since_id must be a log id')
+            queryset = queryset.filter(id__gt=since_id)
+        return queryset
+
     @property
     def permission_scope_query_param_values(self):
         parent_type = self.request.query_params.get('parent_type')
@@ -268,10 +309,95 @@ class LogViewSet(viewsets.ReadOnlyModelViewSet):
         return legalcase_case_offices
 
     def get_permissions(self):
-        if self.action == 'list':
+        if self.action == 'stream' and 'caseOffice' in self.request.query_params:
+            check_scoped_reporting_permision(self.request)
+        elif self.action in ('list', 'stream'):
             check_scoped_list_permission(self.request, self)
         return [permission() for permission in self.permission_classes]
 
+    @action(detail=False)
+    def stream(self, request):
+        '''Server-sent events for logs committed from now on, for one case
+        (parent_type/parent_id) or all cases of a case office (caseOffice).
+        Clients reconnecting with Last-Event-ID first get the logs they missed.
+        '''
+        queryset = self.filter_queryset(self.get_queryset()).order_by('id')
+        case_office = request.query_params.get('caseOffice')
+        if case_office is not None:
+            queryset = queryset.filter(
+                parent_type='LegalCase',
+                parent_id__in=LegalCase.objects.filter(
+                    case_offices__id=case_office
+                ).values('id'),
+            )
+        response = StreamingHttpResponse(
+            self._events(queryset, request.META.get('HTTP_LAST_EVENT_ID')),
+            content_type='text/event-stream',
+        )
+        response['Cache-Control'] = 'no-cache'
+        response['X-Accel-Buffering'] = 'no'
+        return response
+
+    @action(detail=False)
+    def state(self, request):
+        '''State of the record target_type/target_id at a time (default now),
+        replayed from its logs. Scoped users may replay the records of their
+        case office, see check_scoped_record_permission.'''
+        target_type = request.query_params.get('target_type')
+        target_id = request.query_params.get('target_id', '')
+        if target_type is None or not target_id.isdigit():
+            raise ValidationError('Must provide target_type and target_id')
+        try:
+            model = history.logged_model(target_type)
+        except LookupError:
+            raise ValidationError(f'{target_type} is not a logged model')
+        check_scoped_record_permission(request, model, int(target_id))
+        at = request.query_params.get('at')
+        if at is None:
+            at = timezone.now()
+        else:
+            at = parse_datetime(at)
+            if at is None:
+                raise ValidationError('at must be an ISO 8601 date and time')
+            if timezone.is_naive(at):
+                at = timezone.make_aware(at)
+        return Response(history.state_at(target_type, int(target_id), at))
+
+    def _events(self, queryset, last_event_id):
+        parent_type = self.request.query_params.get('parent_type')
+        parent_id = self.request.query_params.get('parent_id')
+        subscriber = activity.listener.subscribe()
+        try:
+            if last_event_id is not None and last_event_id.isdigit():
+                yield from self._log_events(queryset.filter(id__gt=last_event_id))
+            while True:
+                # Idle streams hold no database connection
+                if not connection.in_atomic_block:
+                    connection.close()
+                try:
+                    entries = [subscriber.get(timeout=activity.HEARTBEAT_SECONDS)]
+                except queue.Empty:
+                    yield ': keepalive\n\n'
+                    continue
+                while not subscriber.empty():
+                    entries.append(subscriber.get_nowait())
+                ids = [
+                    entry['id']
+                    for entry in entries
+                    if parent_type in (None, entry['parent_type'])
+                    and parent_id in (None, str(entry['parent_id']))
+                ]
+                if ids:
+                    yield from self._log_events(queryset.filter(id__in=ids))
+        finally:
+            activity.listener.unsubscribe(subscriber)
+
+    def _log_events(self, queryset):
+        renderer = JSONRenderer()
+        for log in queryset:
+            data = renderer.render(self.get_serializer(log).data).decode()
+            yield f'id: {log.id}\nevent: log\ndata: {data}\n\n'
+
 
 def _get_summary_months_range(request):
     months = {'start': None, 'end': None}
@@ -286,9 +412,7 @@ def _get_summary_months_range(request):
                 month_input = int(match.group(2))
                 months[month] = date(year=year_input, month=month_input, day=1)
             else:
-                return HttpResponseBadRequest(
-                    f'{query_param} query param must be in format yyyy-mm'
-                )
+                raise ValidationError({query_param: 'Must be in format yyyy-mm'})
     if months['end'] is None:
         if months['start'] is None:
             months['end'] = date.today()
@@ -306,22 +430,21 @@ def _get_summary_months_range(request):
 def _get_summary_date_range(request):
     dates = {'start': None, 'end': None}
     date_input_pattern = re.compile(
-        '^([0-9]{4})-(0[1-9]|1[0-2])-([0-2][1-9]|3[0-1])$')
+        '^([0-9]{4})-(0[1-9]|1[0-2])-(0[1-9]|[1-2][0-9]|3[0-1])$')
     for d in list(dates):
         query_param = f'{d}Date'
         query_param_input = request.query_params.get(query_param, None)
         if query_param_input is not None:
             match = date_input_pattern.match(query_param_input)
-            if match:
-                year_input = int(match.group(1))
-                month_input = int(match.group(2))
-                day_input = int(match.group(3))
-                dates[d] = date(year=year_input,
-                                month=month_input, day=day_input)
-            else:
-                return HttpResponseBadRequest(
-                    f'{query_param} query param must be in format yyyy-mm-dd'
-                )
+            if not match:
+                raise ValidationError({query_param: 'Must be in format yyyy-mm-dd'})
+            year_input = int(match.group(1))
+            month_input = int(match.group(2))
+            day_input = int(match.group(3))
+            try:
+                dates[d] = date(year=year_input, month=month_input, day=day_input)
+            except ValueError:
+                raise ValidationError({query_param: 'Must be a valid date'})
     today = date.today()
     if dates['start'] is None:
         dates['start'] = date.today().replace(year=today.year - 1, day=1)
@@ -332,20 +455,50 @@ def _get_summary_date_range(request):
     return start_date, end_date
 
 
+def _get_summary_case_office(request):
+    case_office = request.query_params.get('caseOffice')
+    if case_office is not None and not case_office.isdigit():
+        raise ValidationError({'caseOffice': 'Must be a case office id'})
+    return case_office
+
+
+def _get_summary_granularity(request):
+    granularity = request.query_params.get('granularity', 'month')
+    if granularity not in queries.GRANULARITIES:
+        raise ValidationError(
+            {'granularity': f'Must be one of {", ".join(queries.GRANULARITIES)}'}
+        )
+    return granularity
+
+
+def _get_summary_metrics(request):
+    metrics = request.query_params.get('metrics', 'summary')
+    if metrics not in queries.METRIC_SETS:
+        raise ValidationError(
+            {'metrics': f'Must be one of {", ".join(queries.METRIC_SETS)}'}
+        )
+    return metrics
+
+
+REPORT_OPTIONS = {
+    'granularity': _get_summary_granularity,
+    'metrics': _get_summary_metrics,
+}
+
+
 @api_view(['GET'])
 @permission_classes([InAdminGroup | InReportingGroup | InAdviceOfficeAdminGroup])
 def range_summary(request):
     check_scoped_reporting_permision(request)
     start_date, end_date = _get_summary_date_range(request)
-    case_office = request.query_params.get('caseOffice')
-    with connection.cursor() as cursor:
-        cursor.execute(queries.range_summary(
-            start_date, end_date, case_office))
-        row = cursor.fetchone()
+    case_office = _get_summary_case_office(request)
+    data = report_cache.report(
+        *queries.range_summary(start_date, end_date, case_office)
+    )
     response = {
         'startDate': start_date,
         'endDate': end_date,
-        'dataPerCaseOffice': row[0]
+        'dataPerCaseOffice': data
     }
     return Response(response)
 
@@ -355,15 +508,14 @@ def range_summary(request):
 def daily_summary(request):
     check_scoped_reporting_permision(request)
     start_month, end_month = _get_summary_months_range(request)
-    case_office = request.query_params.get('caseOffice')
-    with connection.cursor() as cursor:
-        cursor.execute(queries.daily_summary(
-            start_month, end_month, case_office))
-        row = cursor.fetchone()
+    case_office = _get_summary_case_office(request)
+    data = report_cache.report(
+        *queries.daily_summary(start_month, end_month, case_office)
+    )
     response = {
         'startMonth': start_month,
         'endMonth': end_month,
-        'dataPerCaseOffice': row[0]
+        'dataPerCaseOffice': data
     }
     return Response(response)
 
@@ -373,14 +525,145 @@ def daily_summary(request):
 def monthly_summary(request):
     check_scoped_reporting_permision(request)
     start_month, end_month = _get_summary_months_range(request)
-    case_office = request.query_params.get('caseOffice')
-    with connection.cursor() as cursor:
-        cursor.execute(queries.monthly_summary(
-            start_month, end_month, case_office))
-        row = cursor.fetchone()
+    case_office = _get_summary_case_office(request)
+    data = report_cache.report(
+        *queries.monthly_summary(start_month, end_month, case_office)
+    )
     response = {
         'startMonth': start_month,
         'endMonth': end_month,
-        'dataPerCaseOffice': row[0]
+        'dataPerCaseOffice': data
     }
     return Response(response)
+
+
+@api_view(['GET'])
+@permission_classes([InAdminGroup | InReportingGroup | InAdviceOfficeAdminGroup])
+def period_summary(request):
+    '''Metrics by case office and period of a granularity: day, week, month,
+    quarter or year'''
+    check_scoped_reporting_permision(request)
+    parameters = _get_report_parameters(request, 'period-summary')
+    data = report_cache.report(*report_jobs.query('period-summary', parameters))
+    response = {
+        'startDate': parameters['startDate'],
+        'endDate': parameters['endDate'],
+        'granularity': parameters['granularity'],
+        'metrics': parameters['metrics'],
+        'dataPerCaseOffice': data
+    }
+    return Response(response)
+
+
+def _get_report_parameters(request, report):
+    _, start_name, end_name, options = report_jobs.REPORTS[report]
+    if start_name == 'startDate':
+        start, end = _get_summary_date_range(request)
+    else:
+        start, end = _get_summary_months_range(request)
+    return {
+        start_name: start,
+        end_name: end,
+        'caseOffice': _get_summary_case_office(request),
+        **{option: REPORT_OPTIONS[option](request) for option in options},
+    }
+
+
+def _report_job_response(job):
+    response = {
+        'id': job.id,
+        'report': job.report,
+        'state': job.state,
+        **{
+            name: value
+            for name, value in job.parameters.items()
+            if name != 'caseOffice'
+        },
+        'dataPerCaseOffice': job.result,
+    }
+    if job.error:
+        response['error'] = job.error
+    return response
+
+
+@api_view(['POST'])
+@permission_classes([InAdminGroup | InReportingGroup | InAdviceOfficeAdminGroup])
+def create_report_job(request, report):
+    '''Run a report in the background, with the report's query parameters.
+    Poll the returned job until its state is Done.'''
+    if report not in report_jobs.REPORTS:
+        raise NotFound
+    check_scoped_reporting_permision(request)
+    job = report_jobs.submit(
+        report, _get_report_parameters(request, report), request.user
+    )
+    return Response(_report_job_response(job), status=202)
+
+
+@api_view(['GET'])
+@permission_classes([InAdminGroup | InReportingGroup | InAdviceOfficeAdminGroup])
+def report_job(request, pk):
+    job = get_object_or_404(ReportJob, pk=pk)
+    check_scoped_report_job_permission(request, job)
+    return Response(_report_job_response(job))
+
+
+EXPORTS = {
+    'range-summary': queries.range_summary_rows,
+    'monthly-summary': queries.monthly_summary_rows,
+    'daily-summary': queries.daily_summary_rows,
+    'period-summary': queries.period_summary_rows,
+}
+EXPORT_CONTENT_TYPES = {
+    'csv': 'text/csv; charset=utf-8',
+    'ndjson': 'application/x-ndjson; charset=utf-8',
+}
+EXPORT_COLUMNS = ['office', 'metric', 'period', 'value']
+EXPORT_FETCH_ROWS = 2000
+
+
+class _Echo:
+    '''File-like object returning what is written, for csv.writer'''
+
+    def write(self, value):
+        return value
+
+
+def _export_lines(export_format, sql, params):
+    # Rows are fetched from a server-side cursor while they are sent, which
+    # needs a transaction of its own: the request's has ended by then
+    with transaction.atomic(), connection.chunked_cursor() as cursor:
+        cursor.execute(sql, params)
+        if export_format == 'csv':
+            writer = csv.writer(_Echo())
+            yield writer.writerow(EXPORT_COLUMNS)
+        for rows in iter(lambda: cursor.fetchmany(EXPORT_FETCH_ROWS), []):
+            if export_format == 'csv':
+                yield ''.join(writer.writerow(row) for row in rows)
+            else:
+                yield ''.join(
+                    json.dumps(dict(zip(EXPORT_COLUMNS, row)), cls=DjangoJSONEncoder)
+                    + '\n'
+                    for row in rows
+                )
+
+
+@api_view(['GET'])
+@permission_classes([InAdminGroup | InReportingGroup | InAdviceOfficeAdminGroup])
+def export_report(request, report, export_format):
+    '''A report with one row per case office, metric and period, streamed as
+    CSV or newline delimited JSON'''
+    if report not in EXPORTS or export_format not in EXPORT_CONTENT_TYPES:
+        raise NotFound
+    check_scoped_reporting_permision(request)
+    sql, params = report_jobs.query(
+        report, _get_report_parameters(request, report), EXPORTS[report]
+    )
+    response = StreamingHttpResponse(
+        _export_lines(export_format, sql, params),
+        content_type=EXPORT_CONTENT_TYPES[export_format],
+    )
+    response['Content-Disposition'] = (
+        f'attachment; filename="{report}.{export_format}"'
+    )
+    return response
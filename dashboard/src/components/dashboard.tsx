@@ -127,6 +127,16 @@ export default function Dashboard(props: IProps) {
         info: "This graph shows the average number of days that a case is in an open state.",
         rangeDetail: "is the average number of days cases are open",
       },
+      {
+        name: "Median days per case",
+        info: "This graph shows the median number of days that closed cases were open.",
+        rangeDetail: "is the median number of days cases are open",
+      },
+      {
+        name: "90th percentile days per case",
+        info: "This graph shows the number of days within which 90% of closed cases were closed.",
+        rangeDetail: "is the 90th percentile of days cases are open",
+      },
       {
         name: "Cases opened",
         info: "This graph shows the total amount of cases opened in the month",